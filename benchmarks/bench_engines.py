@@ -0,0 +1,71 @@
+"""Throughput comparison of the trigger engines of edap.
+
+Evaluates samples round robin over N devices with the realistic trigger set of the memory benchmark, where a
+fraction of the devices is idle, with every engine in edap.reference.ENGINES: the frozen reference engine,
+EdapDevice with and without the unchanged sample short circuit, with compact storage and with a shared trigger
+template, edap.pure, and edap.whatif when numpy is installed (which evaluates trigger sets it can not sweep,
+such as this one, with the reference). Reports the samples per second of every engine and its speedup over the
+reference, and whether it triggered the same samples and left the triggers in the same state as the reference.
+Exits with status 1 when an engine did not.
+
+Run it from the repository root with `python -m benchmarks.bench_engines --help`.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Optional
+
+from benchmarks.bench_memory import realistic_triggers
+from benchmarks.bench_triggers import DEFAULT_IDLE, _samples
+from edap.reference import ENGINES
+
+DEFAULT_DEVICES = 1000
+DEFAULT_SAMPLES = 100000
+
+
+def measure(engine: str, devices: int, samples: list[dict]) -> tuple[dict, list, list]:
+    """Samples per second of an engine, and the triggered samples and final triggers of every device."""
+    fleet = [ENGINES[engine](realistic_triggers()) for _ in range(devices)]
+    triggered = []
+    started = time.perf_counter()
+    for i, sample in enumerate(samples):
+        triggered.append(fleet[i % devices].trigger(sample))
+    elapsed = time.perf_counter() - started
+    return {
+        "samples_per_s": round(len(samples) / elapsed) if elapsed > 0 else None,
+        "triggered": sum(result is not None for result in triggered),
+    }, triggered, [device.triggers() for device in fleet]
+
+
+def main(argv: Optional[list[str]] = None):
+    """Parses the arguments and runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=DEFAULT_DEVICES)
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='samples evaluated over all devices')
+    parser.add_argument('--idle', type=float, default=DEFAULT_IDLE,
+                        help='fraction of the devices that report unchanged samples')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES),
+                        help='engines to compare with the reference')
+    args = parser.parse_args(argv)
+
+    samples = _samples(args.devices, args.samples, args.idle, args.seed)
+    reference, expected, expected_triggers = measure("reference", args.devices, samples)
+    results = {"reference": reference}
+    for engine in args.engines:
+        if engine == "reference":
+            continue
+        result, triggered, triggers = measure(engine, args.devices, samples)
+        result["identical"] = triggered == expected and triggers == expected_triggers
+        if result["samples_per_s"] and reference["samples_per_s"]:
+            result["speedup"] = round(result["samples_per_s"] / reference["samples_per_s"], 2)
+        results[engine] = result
+    different = [engine for engine, result in results.items() if not result.get("identical", True)]
+    print(json.dumps({"results": results, "different": different}, indent=2))
+    if different:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
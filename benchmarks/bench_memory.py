@@ -0,0 +1,158 @@
+"""Memory footprint benchmark of EdapDevice.
+
+Builds N devices with a realistic trigger set (time, delta, level, tolerance and conditional triggers) and
+measures with tracemalloc the bytes per device and per trigger that stay allocated once the devices are built,
+with the trigger definitions as received (dicts), with compact storage (see edap.compact) and with a trigger
+template shared by all devices (see edap.template). It then evaluates
+samples round robin over the devices: the bytes retained per device are traced over the first sample of every
+device, and the memory blocks allocated over the second half of all the samples are counted without tracing
+(which would slow down the evaluation about tenfold), as they should not grow with the number of samples once
+the state of the triggers settled.
+Exits with status 1 when a budget is exceeded, so it can be used as a regression check.
+
+Run it from the repository root with `python -m benchmarks.bench_memory --help`.
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from edap.edap import EdapDevice, Trigger
+from edap.template import TriggerTemplate
+
+DEFAULT_DEVICES = 10000
+DEFAULT_SAMPLES = 1000000
+# bytes per device with the trigger set below, see the readme
+DEFAULT_BUDGET = 4096
+DEFAULT_COMPACT_BUDGET = 2048
+DEFAULT_RETAINED_BUDGET = 1024
+DEFAULT_LEAKED_BLOCKS_BUDGET = 1.0
+
+
+def realistic_triggers() -> list[Trigger]:
+    """A trigger set as sent by the proxy, decoded from JSON, so every device gets its own copy."""
+    return json.loads(json.dumps([
+        {"id": "time", "property": "time", "delta": 60},
+        {"id": "power", "property": "power", "delta": 0.5, "sensors": ["soc", "temperature"]},
+        {"id": "soc", "property": "soc", "levels": [0.1, 0.2, 0.5, 0.8, 0.9], "sensors": ["soc"]},
+        {"id": "temperature_missing", "property": "temperature", "tolerance": 1},
+        {"condition": "charging", "property": "power", "greater": 0},
+        {"id": "energy", "property": "energy", "delta": 1, "conditions": ["charging"]},
+    ]))
+
+
+class _CompactDevice(EdapDevice):
+    compact_storage = True
+
+
+def _device_factory(storage: str) -> Callable[[], EdapDevice]:
+    if storage == "compact":
+        return lambda: _CompactDevice(realistic_triggers())
+    if storage == "template":
+        template = TriggerTemplate(realistic_triggers())
+
+        def from_template() -> EdapDevice:
+            device = EdapDevice()
+            device.set_template(template)
+            return device
+        return from_template
+    return lambda: EdapDevice(realistic_triggers())
+
+
+def _traced() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _sample(step: int) -> dict:
+    return {
+        "time": datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=step),
+        "power": float(step % 13 - 6),
+        "energy": step * 0.01,
+        "sensors": {"soc": (step % 100) / 100, "temperature": 20.0 + step % 3},
+    }
+
+
+def measure(devices: int, samples: int, storage: str) -> dict:
+    """Bytes per device and per trigger after building the devices, bytes retained per device after evaluating
+    a sample on every device, and memory blocks allocated per device over the second half of the samples."""
+    triggers_per_device = len(realistic_triggers())
+    tracemalloc.start()
+    try:
+        new_device = _device_factory(storage)
+        before = _traced()
+        started = time.perf_counter()
+        fleet = [new_device() for _ in range(devices)]
+        build_time = time.perf_counter() - started
+        built = _traced()
+
+        # the triggers alone, as stored by the devices
+        trigger_lists = [new_device().get_triggers() for _ in range(devices)]
+        triggers_only = _traced() - built
+        del trigger_lists
+        built = _traced()
+
+        for device in fleet:
+            device.trigger(_sample(0))
+        retained = _traced()
+    finally:
+        tracemalloc.stop()
+
+    half = max(samples // 2, devices)
+    started = time.perf_counter()
+    for i in range(devices, half):
+        fleet[i % devices].trigger(_sample(i // devices))
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    for i in range(half, max(samples, devices)):
+        fleet[i % devices].trigger(_sample(i // devices))
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    leaked_blocks = sys.getallocatedblocks() - blocks
+    return {
+        "devices": devices,
+        "bytes_per_device": round((built - before) / devices),
+        "bytes_per_trigger": round(triggers_only / devices / triggers_per_device),
+        "build_us_per_device": round(build_time / devices * 1e6, 1),
+        "samples": samples,
+        "retained_bytes_per_device": round((retained - built) / devices),
+        "leaked_blocks_per_device": round(leaked_blocks / devices, 3),
+        "samples_per_s": round((samples - devices) / elapsed) if elapsed > 0 else None,
+    }
+
+
+def main(argv: Optional[list[str]] = None):
+    """Parses the arguments and runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=DEFAULT_DEVICES)
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='samples evaluated over all devices')
+    parser.add_argument('--budget', type=int, default=DEFAULT_BUDGET,
+                        help='maximum bytes per device with the triggers as dicts')
+    parser.add_argument('--compact-budget', type=int, default=DEFAULT_COMPACT_BUDGET,
+                        help='maximum bytes per device with compact trigger storage or a shared template')
+    parser.add_argument('--retained-budget', type=int, default=DEFAULT_RETAINED_BUDGET,
+                        help='maximum bytes per device retained after evaluating a sample')
+    parser.add_argument('--leaked-blocks-budget', type=float, default=DEFAULT_LEAKED_BLOCKS_BUDGET,
+                        help='maximum memory blocks per device allocated over the second half of the samples and not freed')
+    args = parser.parse_args(argv)
+
+    budgets = {"dict": args.budget, "compact": args.compact_budget, "template": args.compact_budget}
+    results = {storage: measure(args.devices, args.samples, storage) for storage in budgets}
+    exceeded = [f"{storage}: {result['bytes_per_device']} bytes per device > {budgets[storage]}"
+                for storage, result in results.items() if result["bytes_per_device"] > budgets[storage]]
+    exceeded += [f"{storage}: {result['retained_bytes_per_device']} bytes per device retained > {args.retained_budget}"
+                 for storage, result in results.items() if result["retained_bytes_per_device"] > args.retained_budget]
+    exceeded += [f"{storage}: {result['leaked_blocks_per_device']} blocks per device leaked > {args.leaked_blocks_budget}"
+                 for storage, result in results.items()
+                 if result["leaked_blocks_per_device"] > args.leaked_blocks_budget]
+    print(json.dumps({"results": results, "exceeded": exceeded}, indent=2))
+    if exceeded:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
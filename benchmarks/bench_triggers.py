@@ -0,0 +1,94 @@
+"""Trigger evaluation benchmark of EdapDevice.
+
+Evaluates samples round robin over N devices with the realistic trigger set of the memory benchmark, where a
+fraction of the devices is idle and reports the same values sample after sample (only the time moves on), as
+idle chargers and full batteries do. Runs once with the unchanged sample short circuit (see
+edap.fingerprint) and once without, and reports the samples per second of both, the number of samples that
+were short circuited, and whether both runs triggered exactly the same samples.
+Exits with status 1 when they did not.
+
+Run it from the repository root with `python -m benchmarks.bench_triggers --help`.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from benchmarks.bench_memory import realistic_triggers
+from edap.edap import EdapDevice
+
+DEFAULT_DEVICES = 1000
+DEFAULT_SAMPLES = 200000
+DEFAULT_IDLE = 0.5
+
+
+class _FullDevice(EdapDevice):
+    short_circuit = False
+
+
+def _samples(devices: int, samples: int, idle: float, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    idle_devices = set(rng.sample(range(devices), round(devices * idle)))
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    result = []
+    for i in range(samples):
+        device, step = i % devices, i // devices
+        if device in idle_devices:
+            values = {"power": 0.0, "energy": 12.5, "sensors": {"soc": 1.0, "temperature": 20.0}}
+        else:
+            values = {
+                "power": rng.uniform(-6, 6),
+                "energy": step * 0.01,
+                "sensors": {"soc": rng.random(), "temperature": 20.0 + step % 3},
+            }
+        result.append({"time": start + timedelta(seconds=step), **values})
+    return result
+
+
+def measure(devices: int, samples: list[dict], short_circuit: bool) -> tuple[dict, list]:
+    """Samples per second and short circuited samples, and the triggered samples."""
+    factory = EdapDevice if short_circuit else _FullDevice
+    fleet = [factory(realistic_triggers()) for _ in range(devices)]
+    triggered = []
+    started = time.perf_counter()
+    for i, sample in enumerate(samples):
+        triggered.append(fleet[i % devices].trigger(sample))
+    elapsed = time.perf_counter() - started
+    return {
+        "samples": len(samples),
+        "triggered": sum(result is not None for result in triggered),
+        "short_circuited": sum(device.short_circuited for device in fleet),
+        "samples_per_s": round(len(samples) / elapsed) if elapsed > 0 else None,
+    }, triggered
+
+
+def main(argv: Optional[list[str]] = None):
+    """Parses the arguments and runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=DEFAULT_DEVICES)
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='samples evaluated over all devices')
+    parser.add_argument('--idle', type=float, default=DEFAULT_IDLE,
+                        help='fraction of the devices that report unchanged samples')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    samples = _samples(args.devices, args.samples, args.idle, args.seed)
+    full, full_triggered = measure(args.devices, samples, short_circuit=False)
+    short_circuited, short_circuited_triggered = measure(args.devices, samples, short_circuit=True)
+    identical = full_triggered == short_circuited_triggered
+    speedup = (short_circuited["samples_per_s"] / full["samples_per_s"]
+               if short_circuited["samples_per_s"] and full["samples_per_s"] else None)
+    print(json.dumps({
+        "results": {"full": full, "short_circuit": short_circuited},
+        "speedup": round(speedup, 2) if speedup is not None else None,
+        "identical": identical,
+    }, indent=2))
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 from edap.edap import EdapDevice, EdapSample, Trigger
+from edap.codec import DeltaDecoder, DeltaEncoder
+from edap.logs import RateLimitFilter
 
 
-__all__ = ["EdapDevice", "EdapSample", "Trigger"]
\ No newline at end of file
+__all__ = ["EdapDevice", "EdapSample", "Trigger", "DeltaDecoder", "DeltaEncoder", "RateLimitFilter"]
\ No newline at end of file
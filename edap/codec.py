@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from edap.edap import EdapSample
+
+DEFAULT_KEYFRAME_INTERVAL = 100
+DEFAULT_DECODER_HISTORY = 256
+
+# Keys of the frames on the wire. A keyframe is the full sample with a sequence number,
+# a delta frame only has the fields and sensors that changed relative to its base sample.
+SEQUENCE = "seq"
+BASE = "base"
+REMOVED = "removed"
+REMOVED_SENSORS = "removed_sensors"
+
+
+def _copy(sample: "EdapSample") -> "EdapSample":
+    copied: Any = dict(sample)
+    copied["sensors"] = dict(sample.get("sensors") or {})
+    return copied
+
+
+class DeltaEncoder:
+    """
+    Delta encoder for the triggered samples of a single device. Only the fields and sensors that changed
+    relative to a base sample are sent, with a full keyframe every `keyframe_interval` samples.
+    The "triggers" of a sample are always sent. When `acknowledged` is set, the base is the last sample
+    acknowledged by the receiver (see `acknowledge`), and a keyframe is sent as long as nothing is acknowledged,
+    otherwise the base is the previously encoded sample, which relies on an ordered and reliable transport.
+    """
+    def __init__(self, keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL, acknowledged: bool = False) -> None:
+        self.keyframe_interval = keyframe_interval
+        self.acknowledged = acknowledged
+        self._sequence = 0
+        self._since_keyframe = 0
+        self._base: tuple[int, "EdapSample"] | None = None
+        self._unacknowledged: OrderedDict[int, "EdapSample"] = OrderedDict()
+
+    def request_keyframe(self) -> None:
+        """Make the next encoded sample a keyframe, e.g. after a reconnect or when the receiver lost track."""
+        self._base = None
+        self._unacknowledged.clear()
+
+    def acknowledge(self, sequence: int) -> None:
+        """Mark a sample as received, making it the base of the following delta frames."""
+        if not self.acknowledged:
+            return
+        sample = self._unacknowledged.get(sequence)
+        if sample is None:
+            return
+        self._base = (sequence, sample)
+        while self._unacknowledged:
+            oldest = next(iter(self._unacknowledged))
+            if oldest > sequence:
+                break
+            del self._unacknowledged[oldest]
+
+    def encode(self, sample: "EdapSample") -> dict:
+        """Encode a sample into a keyframe or a delta frame."""
+        self._sequence += 1
+        sequence = self._sequence
+        sample = _copy(sample)
+
+        if self._base is None or self._since_keyframe >= self.keyframe_interval:
+            frame: dict = {SEQUENCE: sequence, **sample}
+            self._since_keyframe = 0
+            if self.acknowledged:
+                self._unacknowledged.clear()
+        else:
+            frame = self._delta(sequence, *self._base, sample)
+            self._since_keyframe += 1
+
+        if self.acknowledged:
+            self._unacknowledged[sequence] = sample
+            # without acknowledgements for this long the receiver is probably gone, start over from a keyframe
+            if len(self._unacknowledged) > self.keyframe_interval:
+                self._base = None
+        else:
+            self._base = (sequence, sample)
+        return frame
+
+    @staticmethod
+    def _delta(sequence: int, base_sequence: int, base: "EdapSample", sample: "EdapSample") -> dict:
+        frame: dict = {SEQUENCE: sequence, BASE: base_sequence, "triggers": sample.get("triggers", [])}
+        for key, value in sample.items():
+            if key in ("sensors", "triggers"):
+                continue
+            if key not in base or base[key] != value:
+                frame[key] = value
+        removed = [key for key in base if key not in sample]
+        if removed:
+            frame[REMOVED] = removed
+
+        base_sensors = base.get("sensors") or {}
+        sensors = sample.get("sensors") or {}
+        changed_sensors = {name: value for name, value in sensors.items()
+                           if name not in base_sensors or base_sensors[name] != value}
+        if changed_sensors:
+            frame["sensors"] = changed_sensors
+        removed_sensors = [name for name in base_sensors if name not in sensors]
+        if removed_sensors:
+            frame[REMOVED_SENSORS] = removed_sensors
+        return frame
+
+
+class DeltaDecoder:
+    """
+    Reference decoder for frames produced by DeltaEncoder, reconstructing the full samples.
+    The last `history` decoded samples are kept, as they can be the base of later frames.
+    """
+    def __init__(self, history: int = DEFAULT_DECODER_HISTORY) -> None:
+        self.history = history
+        self._samples: OrderedDict[int, "EdapSample"] = OrderedDict()
+
+    @staticmethod
+    def is_frame(payload: dict) -> bool:
+        """If a payload received from a gateway is a (delta encoded) frame."""
+        return SEQUENCE in payload
+
+    def decode(self, frame: dict) -> "EdapSample":
+        """Reconstruct the full sample of a frame. Raises KeyError when the base sample of a delta frame
+        is unknown, in which case the sender should be asked for a keyframe."""
+        frame = dict(frame)
+        sequence = frame.pop(SEQUENCE)
+        base_sequence = frame.pop(BASE, None)
+        if base_sequence is None:
+            sample = _copy(frame)
+        else:
+            if base_sequence not in self._samples:
+                raise KeyError(f"Unknown base sample {base_sequence} of frame {sequence}")
+            sample = _copy(self._samples[base_sequence])
+            for key in frame.pop(REMOVED, []):
+                sample.pop(key, None)
+            for name in frame.pop(REMOVED_SENSORS, []):
+                sample["sensors"].pop(name, None)
+            sample["sensors"].update(frame.pop("sensors", {}))
+            sample.update(frame)
+
+        self._samples[sequence] = sample
+        while len(self._samples) > self.history:
+            self._samples.popitem(last=False)
+        return _copy(sample)
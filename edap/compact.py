@@ -0,0 +1,143 @@
+import threading
+from copy import deepcopy
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
+from weakref import WeakValueDictionary
+
+if TYPE_CHECKING:
+    from edap.edap import Trigger
+
+# Keys of a trigger that hold its state, which changes as samples are evaluated. All other keys are its
+# definition, which never changes once the trigger is set.
+STATE_KEYS = ("value", "slope", "value_time")
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+
+_MISSING: Any = _Missing()
+
+
+class _Definition(dict):
+    """A trigger definition shared by every compact trigger with an equal definition."""
+    __slots__ = ("__weakref__",)
+
+
+_definitions: "WeakValueDictionary[Any, _Definition]" = WeakValueDictionary()
+_definitions_lock = threading.Lock()
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, list | tuple):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def shared_definition(trigger: Mapping[str, Any]) -> Mapping[str, Any]:
+    """The definition of a trigger, without its state, shared with every equal definition."""
+    definition = _Definition((key, _freeze(value)) for key, value in trigger.items() if key not in STATE_KEYS)
+    try:
+        key = tuple(sorted(definition.items()))
+        hash(key)
+    except TypeError:
+        # definitions with values that can not be compared or hashed are not shared
+        return definition
+    with _definitions_lock:
+        return _definitions.setdefault(key, definition)
+
+
+class CompactTrigger(Mapping):
+    """
+    Trigger that stores its definition once per process, shared with every other compact trigger with an equal
+    definition, and only its own state (see STATE_KEYS) in slots. Lists in the definition become tuples.
+    It is read like a trigger dict, and only its state can be set, which is all EdapDevice.apply_trigger needs.
+    A device with the same triggers as many others costs a small fixed size per trigger this way, instead of
+    a dict and its lists per trigger.
+    """
+    __slots__ = ("_definition", "_value", "_slope", "_value_time")
+
+    def __init__(self, trigger: Mapping[str, Any]) -> None:
+        self._definition = shared_definition(trigger)
+        self._value = trigger.get("value", _MISSING)
+        self._slope = trigger.get("slope", _MISSING)
+        self._value_time = trigger.get("value_time", _MISSING)
+
+    @classmethod
+    def from_definition(cls, definition: Mapping[str, Any], state: Mapping[str, Any] | None = None) -> "CompactTrigger":
+        """A compact trigger with a definition that is already shared (see shared_definition), and its state."""
+        trigger = cls.__new__(cls)
+        trigger._definition = definition
+        state = state or {}
+        trigger._value = state.get("value", _MISSING)
+        trigger._slope = state.get("slope", _MISSING)
+        trigger._value_time = state.get("value_time", _MISSING)
+        return trigger
+
+    def state(self) -> dict[str, Any]:
+        """The state keys of the trigger that have a value."""
+        return {key: self._state(key) for key in STATE_KEYS if self._state(key) is not _MISSING}
+
+    def _state(self, key: str) -> Any:
+        if key == "value":
+            return self._value
+        if key == "slope":
+            return self._slope
+        return self._value_time
+
+    def __getitem__(self, key: str) -> Any:
+        if key in STATE_KEYS:
+            value = self._state(key)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        return self._definition[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key == "value":
+            self._value = value
+        elif key == "slope":
+            self._slope = value
+        elif key == "value_time":
+            self._value_time = value
+        else:
+            raise TypeError(f"The definition of a compact trigger can not be changed, only its {', '.join(STATE_KEYS)}")
+
+    def __contains__(self, key: object) -> bool:
+        if key in STATE_KEYS:
+            return self._state(key) is not _MISSING  # type: ignore[arg-type]
+        return key in self._definition
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in STATE_KEYS:
+            value = self._state(key)
+            return default if value is _MISSING else value
+        return self._definition.get(key, default)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._definition
+        for key in STATE_KEYS:
+            if self._state(key) is not _MISSING:
+                yield key
+
+    def __len__(self) -> int:
+        return len(self._definition) + sum(self._state(key) is not _MISSING for key in STATE_KEYS)
+
+    def __repr__(self) -> str:
+        return f"CompactTrigger({dict(self)!r})"
+
+    def __reduce__(self) -> tuple:
+        return CompactTrigger, (dict(self),)
+
+    def __deepcopy__(self, memo: dict) -> "CompactTrigger":
+        # the definition can not be changed, so the copy shares it
+        return type(self).from_definition(self._definition, deepcopy(self.state(), memo))
+
+
+def compact_triggers(triggers: Iterable["Trigger | Mapping[str, Any]"]) -> list["Trigger"]:
+    """The triggers as CompactTriggers, to be set on a device, see EdapDevice.compact_storage."""
+    return [trigger if isinstance(trigger, CompactTrigger) else CompactTrigger(trigger)  # type: ignore[misc]
+            for trigger in triggers]
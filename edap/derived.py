@@ -0,0 +1,249 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Literal, TypedDict, get_args
+
+if TYPE_CHECKING:
+    from edap.edap import EdapSample
+
+DerivedKind = Literal["integral", "difference", "ratio", "moving_average", "scale"]
+DERIVED_KINDS = get_args(DerivedKind)
+
+# Derived values with these names are set as properties of the sample, all others as sensors.
+_SAMPLE_FIELDS = ("power", "energy")
+
+DerivedSensor = TypedDict("DerivedSensor", {
+    "name": str,
+    "kind": DerivedKind,
+    "inputs": list[str],
+    "factor": int | float,
+    "offset": int | float,
+    "window": int,
+    "initial": int | float,
+}, total=False)
+
+
+def _input_value(sample: "EdapSample", name: str) -> float | None:
+    # properties of the sample take precedence over sensors with the same name, like for triggers
+    value = sample[name] if name in sample else (sample.get("sensors") or {}).get(name)  # type: ignore[literal-required]
+    if isinstance(value, float | int):
+        return value
+    return None
+
+
+class _Stage(ABC):
+    """A derived sensor, updated with the values of its inputs in every sample."""
+    __slots__ = ("name", "inputs", "factor", "offset")
+
+    def __init__(self, definition: DerivedSensor) -> None:
+        self.name = definition["name"]
+        self.inputs = list(definition.get("inputs") or [])
+        self.factor = definition.get("factor", 1)
+        self.offset = definition.get("offset", 0)
+
+    @abstractmethod
+    def update(self, values: list[float | None], sample_time: datetime | None) -> float | None:
+        """The value of the derived sensor for a sample, None when it is missing."""
+
+
+class _Stateless(_Stage):
+    """A function of the current input values, only recomputed when they changed."""
+    __slots__ = ("_last_inputs", "_last_value")
+
+    def __init__(self, definition: DerivedSensor) -> None:
+        super().__init__(definition)
+        self._last_inputs: list[float | None] | None = None
+        self._last_value: float | None = None
+
+    def update(self, values: list[float | None], sample_time: datetime | None) -> float | None:
+        if values != self._last_inputs:
+            self._last_inputs = values
+            self._last_value = None if None in values else self.compute(values)
+        return self._last_value
+
+    @abstractmethod
+    def compute(self, values: list[float]) -> float | None:
+        """The value of the derived sensor for input values that are all present."""
+
+
+class _Scale(_Stateless):
+    __slots__ = ()
+
+    def compute(self, values: list[float]) -> float | None:
+        return values[0] * self.factor + self.offset
+
+
+class _Ratio(_Stateless):
+    __slots__ = ()
+
+    def compute(self, values: list[float]) -> float | None:
+        if values[1] == 0:
+            return None
+        return values[0] / values[1] * self.factor + self.offset
+
+
+class _Difference(_Stateless):
+    __slots__ = ("_previous",)
+
+    def __init__(self, definition: DerivedSensor) -> None:
+        super().__init__(definition)
+        self._previous: float | None = None
+
+    def update(self, values: list[float | None], sample_time: datetime | None) -> float | None:
+        if len(self.inputs) == 2:
+            return super().update(values, sample_time)
+        # the change of a single input since the previous sample that had it
+        value = values[0]
+        if value is None:
+            return None
+        previous, self._previous = self._previous, value
+        return None if previous is None else (value - previous) * self.factor + self.offset
+
+    def compute(self, values: list[float]) -> float | None:
+        return (values[0] - values[1]) * self.factor + self.offset
+
+
+class _Integral(_Stage):
+    """Integral over time in seconds (trapezoidal), scaled by the factor, e.g. 1 / 3600 for kWh from kW.
+    Inputs that are missing in some samples are interpolated linearly over the gap."""
+    __slots__ = ("_total", "_last_time", "_last_value")
+
+    def __init__(self, definition: DerivedSensor) -> None:
+        super().__init__(definition)
+        self._total = float(definition.get("initial", 0))
+        self._last_time: datetime | None = None
+        self._last_value: float | None = None
+
+    def update(self, values: list[float | None], sample_time: datetime | None) -> float | None:
+        value = values[0]
+        if value is not None and sample_time is not None:
+            if self._last_time is not None and self._last_value is not None:
+                elapsed = (sample_time - self._last_time).total_seconds()
+                if elapsed > 0:
+                    self._total += (self._last_value + value) / 2 * elapsed * self.factor
+            self._last_time = sample_time
+            self._last_value = value
+        return self._total + self.offset
+
+
+class _MovingAverage(_Stage):
+    """Average of the last `window` values of the input, with a running sum."""
+    __slots__ = ("_window", "_sum")
+
+    def __init__(self, definition: DerivedSensor) -> None:
+        super().__init__(definition)
+        size = definition.get("window", 10)
+        if size < 1:
+            raise ValueError(f"The window of derived sensor {self.name!r} must be at least 1")
+        self._window: deque[float] = deque(maxlen=size)
+        self._sum = 0.0
+
+    def update(self, values: list[float | None], sample_time: datetime | None) -> float | None:
+        value = values[0]
+        if value is not None:
+            if len(self._window) == self._window.maxlen:
+                self._sum -= self._window[0]
+            self._window.append(value)
+            self._sum += value
+        if not self._window:
+            return None
+        return self._sum / len(self._window) * self.factor + self.offset
+
+
+_STAGES: dict[str, tuple[type[_Stage], tuple[int, ...]]] = {
+    # kind: stage, accepted numbers of inputs
+    "integral": (_Integral, (1,)),
+    "difference": (_Difference, (1, 2)),
+    "ratio": (_Ratio, (2,)),
+    "moving_average": (_MovingAverage, (1,)),
+    "scale": (_Scale, (1,)),
+}
+
+
+def _ordered(definitions: list[DerivedSensor]) -> list[DerivedSensor]:
+    """The definitions in dependency order, so derived sensors can be inputs of other derived sensors."""
+    by_name: dict[str, DerivedSensor] = {}
+    for definition in definitions:
+        name = definition.get("name")
+        if not name:
+            raise ValueError("Derived sensors need a name")
+        if name in by_name:
+            raise ValueError(f"Derived sensor {name!r} is defined more than once")
+        by_name[name] = definition
+
+    ordered: list[DerivedSensor] = []
+    visiting: set[str] = set()
+    done: set[str] = set()
+
+    def visit(name: str) -> None:
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Derived sensor {name!r} depends on itself")
+        visiting.add(name)
+        for input_name in by_name[name].get("inputs") or []:
+            if input_name in by_name:
+                visit(input_name)
+        visiting.discard(name)
+        done.add(name)
+        ordered.append(by_name[name])
+
+    for name in by_name:
+        visit(name)
+    return ordered
+
+
+class DerivedSensors:
+    """
+    Pipeline of derived sensors, computed from the properties and sensors of every sample before its triggers
+    are evaluated, e.g. `{"name": "energy", "kind": "integral", "inputs": ["power"], "factor": 1 / 3600}`.
+    Kinds:
+    - `integral`: integral of an input over time in seconds, starting at `initial`.
+    - `difference`: difference of two inputs, or the change of a single input since the previous sample.
+    - `ratio`: first input divided by the second, missing when the second is 0.
+    - `moving_average`: average of the last `window` (default 10) values of an input.
+    - `scale`: the input itself.
+    The value of every kind is multiplied by `factor` (default 1), and `offset` (default 0) is added to it. Derived sensors can
+    be inputs of other derived sensors and are computed in dependency order, with state of O(1) per sensor
+    (O(window) for moving averages). Sensors that only depend on the current inputs are only recomputed when
+    one of their inputs changed. A derived sensor is missing from the sample when its inputs are, and derived
+    `power` and `energy` are set as properties of the sample, everything else as sensors.
+    """
+    def __init__(self, definitions: list[DerivedSensor] | None = None) -> None:
+        self.definitions = list(definitions or [])
+        self._stages: list[_Stage] = []
+        for definition in _ordered(self.definitions):
+            kind = definition.get("kind")
+            if kind not in _STAGES:
+                raise ValueError(f"Unknown kind {kind!r} of derived sensor {definition['name']!r}, "
+                                 f"expected one of {', '.join(DERIVED_KINDS)}")
+            stage, input_counts = _STAGES[kind]
+            if len(definition.get("inputs") or []) not in input_counts:
+                raise ValueError(f"Derived sensor {definition['name']!r} of kind {kind} needs "
+                                 f"{' or '.join(map(str, input_counts))} inputs")
+            self._stages.append(stage(definition))
+
+    def __bool__(self) -> bool:
+        return bool(self._stages)
+
+    @property
+    def names(self) -> list[str]:
+        return [stage.name for stage in self._stages]
+
+    @property
+    def inputs(self) -> list[str]:
+        return [name for stage in self._stages for name in stage.inputs]
+
+    def apply(self, sample: "EdapSample") -> "EdapSample":
+        """A copy of the sample with the derived sensors added. The given sample is not changed."""
+        derived: Any = dict(sample)
+        sensors = derived["sensors"] = dict(sample.get("sensors") or {})
+        sample_time = sample.get("time")
+        for stage in self._stages:
+            value = stage.update([_input_value(derived, name) for name in stage.inputs], sample_time)
+            target = derived if stage.name in _SAMPLE_FIELDS else sensors
+            if value is None:
+                target.pop(stage.name, None)
+            else:
+                target[stage.name] = value
+        return derived
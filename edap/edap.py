@@ -1,10 +1,25 @@
+import asyncio
 import logging
+import threading
+import time
 from contextlib import suppress
-from typing import NamedTuple, TypedDict, Any
+from typing import TYPE_CHECKING, AsyncIterable, AsyncIterator, Mapping, NamedTuple, TypedDict, Any
 from datetime import datetime, timezone, timedelta
 from copy import deepcopy
 from abc import ABC
 
+from edap.compact import compact_triggers
+from edap.derived import DerivedSensor, DerivedSensors
+from edap.expr import CompiledExpression, compile_expression
+from edap.fingerprint import TriggerPlan
+from edap.schema import SampleSchema
+
+if TYPE_CHECKING:
+    from edap.shared_state import TriggerStateTable
+    from edap.template import TriggerTemplate
+
+_logger = logging.getLogger(__name__)
+
 class EdapSample(TypedDict):
     triggers: list[str]
     time: datetime | None
@@ -26,7 +41,11 @@ Trigger = TypedDict("Trigger", {
     "in": list[int] | list[float] | list[str] | list[bool] | None,
     "greater": int | float | None,
     "less": int | float | None,
-    "conditions": list[str] | None
+    "conditions": list[str] | None,
+    "expr": str | None,
+    "deviation": int | float | None,
+    "slope": float,
+    "value_time": datetime | None
 }, total=False)
 
 
@@ -36,23 +55,145 @@ class _SampleValue(NamedTuple):
     exists: bool
     value: _MeasurementValue
 
+async def _read(iterator: AsyncIterator[EdapSample]) -> tuple[bool, EdapSample | None]:
+    # the end of the source as a value, a task can not raise StopAsyncIteration to its waiter
+    try:
+        return True, await anext(iterator)
+    except StopAsyncIteration:
+        return False, None
+
 class EdapDevice(ABC):
     """
     Base EdapDevice class. Holds main logic that includes trigger calculations.
+
+    Thread safety: every device has a lock, held while `trigger` evaluates a sample and updates the trigger
+    state and the last triggered sample, and while the triggers, derived sensors or state table are replaced.
+    Different devices can be evaluated on different threads in parallel (also without the GIL), the samples
+    of a single device are evaluated one at a time, and `set_triggers` can be called from any thread: a sample
+    is evaluated either entirely with the old or entirely with the new triggers. The new triggers are prepared
+    (expressions compiled, compact storage built) before the lock is taken, and then swapped in.
+    `apply_trigger` itself updates the triggers it is given, so the same trigger list must not be evaluated
+    from several threads at once without a lock, use `trigger` or a copy of the triggers per thread instead.
+    The trigger list of a device is never changed once set, it is replaced as a whole, and only the state of its
+    triggers changes. `get_triggers` returns a copy of it.
+
+    Unchanged samples: `trigger` fingerprints the sample properties and sensors the triggers read (see
+    edap.fingerprint). When a sample has the same fingerprint as the previous one, and the previous one
+    activated no trigger, only the triggers that depend on the time of the sample are evaluated, the others
+    can not be activated by it. `short_circuited` counts these samples. The trigger state must only change
+    through `trigger`, `set_triggers` or `set_template` for this to hold.
     """
-    def __init__(self, triggers: list[Trigger] | None = None) -> None:
+    # store the triggers as CompactTriggers (see edap.compact), for processes with many devices
+    compact_storage: bool = False
+    # only evaluate the time dependent triggers for samples that are unchanged since the previous one
+    short_circuit: bool = True
+
+    def __init__(self, triggers: list[Trigger] | None = None,
+                 derived_sensors: list[DerivedSensor] | None = None) -> None:
+        self._lock = threading.Lock()
         self._triggers: list[Trigger] = []
+        self._template: "TriggerTemplate | None" = None
+        self._template_version = 0
+        # the compiled expressions of the triggers, compiled once when they are set
+        self._expressions: Mapping[str, CompiledExpression] = {}
+        self._derived_sensors = DerivedSensors()
         self._last_sample: EdapSample | None = None
+        # the last sample evaluated, with its derived sensors, whether it activated triggers or not
+        self.last_evaluated: EdapSample | None = None
+        self._plan: TriggerPlan | None = None
+        # fingerprint of the previous sample, if it activated no trigger
+        self._fingerprint: list | None = None
+        self.short_circuited = 0
+        # ids of the properties and sensors of the device, extended (never reset) as triggers are set
+        self.schema = SampleSchema()
+        self._state_table: "TriggerStateTable | None" = None
+        self._state_row = 0
+        self._state_device_id = ""
+        self.set_derived_sensors(derived_sensors)
         self.set_triggers(triggers)
 
     def get_triggers(self) -> list[Trigger]:
-        return self._triggers
+        """A copy of the triggers and their state, taken between the evaluation of two samples."""
+        with self._lock:
+            self._sync_template()
+            return deepcopy(self._triggers)
 
     def set_triggers(self, triggers: list[Trigger] | None) -> None:
+        """Replace the triggers of the device. The triggers are copied, the device stores their state in its own
+        copy and never writes to the list or the triggers it was given."""
+        names: list[str] = []
+        expressions: dict[str, CompiledExpression] = {}
         if triggers is None:
-            self._triggers = []
+            triggers = []
         else:
+            triggers = deepcopy(triggers)
+            # compile the expressions up front, so invalid ones are rejected with an ExpressionError
+            for trigger in triggers:
+                if trigger.get("expr") is not None:
+                    expressions[trigger["expr"]] = compile_expression(trigger["expr"])
+                    names.extend(expressions[trigger["expr"]].names)
+            if self.compact_storage:
+                triggers = compact_triggers(triggers)
+        with self._lock:
+            self.schema.extend(names)
+            self.schema.extend_from_triggers(triggers)
             self._triggers = triggers
+            self._expressions = expressions
+            self._template = None
+            self._reset_short_circuit()
+            self._publish_state()
+
+    def set_template(self, template: "TriggerTemplate") -> None:
+        """Use the triggers of a template shared with other devices (see edap.template), keeping only their
+        state in the device. Updates of the template apply before the next sample is evaluated.
+        `set_triggers` replaces the template with triggers of the device's own."""
+        with self._lock:
+            self._template = template
+            self._template_version = -1
+            self._reset_short_circuit()
+            self._sync_template()
+
+    def _sync_template(self) -> None:
+        # called with the lock held
+        template = self._template
+        if template is None or template.version == self._template_version:
+            return
+        self._template_version, self._triggers = template.instantiate(self._triggers)
+        self._expressions = template.expressions
+        self.schema.extend(template.names)
+        self._reset_short_circuit()
+        self._publish_state()
+
+    def _reset_short_circuit(self) -> None:
+        # called with the lock held, whenever the triggers or the samples they see may have changed
+        self._plan = None
+        self._fingerprint = None
+
+    def get_derived_sensors(self) -> list[DerivedSensor]:
+        return self._derived_sensors.definitions
+
+    def set_derived_sensors(self, definitions: list[DerivedSensor] | None) -> None:
+        """Set the sensors derived from every sample before its triggers are evaluated (see edap.derived).
+        Raises a ValueError for invalid definitions. The state of the previous derived sensors is dropped."""
+        derived_sensors = DerivedSensors(definitions)
+        with self._lock:
+            self._derived_sensors = derived_sensors
+            self.schema.extend(derived_sensors.inputs + derived_sensors.names)
+            self._reset_short_circuit()
+
+    def attach_state_table(self, table: "TriggerStateTable | None", row: int = 0, device_id: str | None = None) -> None:
+        """Publish the trigger values and the last triggered sample of the device to a row of a shared memory
+        table whenever they change, where other processes can read them (see edap.shared_state).
+        Pass None to stop publishing."""
+        with self._lock:
+            self._state_table = table
+            self._state_row = row
+            self._state_device_id = device_id if device_id is not None else str(row)
+            self._publish_state()
+
+    def _publish_state(self) -> None:
+        if self._state_table is not None:
+            self._state_table.write(self._state_row, self._state_device_id, self._triggers, self._last_sample)
 
     @staticmethod
     def _delta_triggered(current_sample_value: _MeasurementValue, trigger: Trigger) -> bool:
@@ -70,6 +211,46 @@ class EdapDevice(ABC):
             return current_sample_value != trigger_value
         return abs(current_sample_value - trigger_value) > delta
 
+    @staticmethod
+    def _seconds_since_value(sample_time: datetime | None, trigger: Trigger) -> float | None:
+        value_time = trigger.get("value_time")
+        if not isinstance(sample_time, datetime) or not isinstance(value_time, datetime):
+            return None
+        with suppress(TypeError):
+            return (sample_time - value_time).total_seconds()
+        return None
+
+    @staticmethod
+    def _trajectory_triggered(
+        current_sample_value: _MeasurementValue, sample_time: datetime | None, trigger: Trigger
+    ) -> bool:
+        if "deviation" not in trigger:
+            return False
+        if "value" not in trigger:
+            return True
+        if not isinstance(current_sample_value, float | int):
+            return False
+        trigger_value = trigger["value"]
+        if not isinstance(trigger_value, float | int):
+            return False
+        # the value the signal is expected to have, continuing the last segment from its end
+        predicted = trigger_value
+        elapsed = EdapDevice._seconds_since_value(sample_time, trigger)
+        if elapsed is not None and elapsed > 0:
+            predicted += trigger.get("slope", 0.0) * elapsed
+        return abs(current_sample_value - predicted) > (trigger["deviation"] or 0)
+
+    @staticmethod
+    def _start_segment(trigger: Trigger, sample_time: datetime | None, sample_value: _MeasurementValue) -> None:
+        slope = 0.0
+        trigger_value = trigger.get("value")
+        elapsed = EdapDevice._seconds_since_value(sample_time, trigger)
+        if (elapsed is not None and elapsed > 0 and isinstance(trigger_value, float | int)
+                and isinstance(sample_value, float | int)):
+            slope = (sample_value - trigger_value) / elapsed
+        trigger["slope"] = slope
+        trigger["value_time"] = sample_time
+
     @staticmethod
     def _get_sample_value(sample: EdapSample | None, key: str | None) -> _SampleValue:
         if sample is None or key is None:
@@ -172,18 +353,31 @@ class EdapDevice(ABC):
         current_sample: EdapSample,
         trigger: Trigger,
         conditions: dict[str, Trigger],
+        expressions: "Mapping[str, CompiledExpression] | None" = None,
     ) -> bool:
         trigger_property: str | None = trigger.get('property')
-        if trigger_property is None:
+        expr: str | None = trigger.get('expr')
+        if trigger_property is None and expr is None:
             return False
         try:
             if "conditions" in trigger:
                 for condition in trigger.get("conditions") or []:
                     if condition in conditions and not EdapDevice._single_trigger_activated(
-                        current_sample, conditions.get(condition, {}), conditions
+                        current_sample, conditions.get(condition, {}), conditions, expressions
                     ):
                         return False
 
+            # an expression gates the trigger like its conditions do, and a trigger with only an
+            # expression (no property) is activated whenever the expression holds
+            if expr is not None:
+                compiled = expressions.get(expr) if expressions is not None else None
+                if compiled is None:
+                    compiled = compile_expression(expr)
+                if not compiled.evaluate(current_sample):
+                    return False
+            if trigger_property is None:
+                return True
+
             if trigger_property == "time":
                 return EdapDevice._is_time_triggered(current_sample.get('time'), trigger)
             current_sample_value = EdapDevice._get_sample_value(current_sample, trigger_property)
@@ -201,18 +395,25 @@ class EdapDevice(ABC):
                 EdapDevice._tolerance_triggered(current_sample_value, trigger)
                 or EdapDevice._level_triggered(current_sample_value.value, trigger)
                 or EdapDevice._delta_triggered(current_sample_value.value, trigger)
+                or EdapDevice._trajectory_triggered(current_sample_value.value, current_sample.get('time'), trigger)
             )
         except Exception as e:
-            logging.error("EdapDevice error: Error processing trigger %s: %s", trigger, e, exc_info=True)
+            _logger.error("EdapDevice error: Error processing trigger %s: %s", trigger, e, exc_info=True)
 
         return False
 
     @staticmethod
-    def apply_trigger(sample: EdapSample, triggers: list[Trigger]) -> EdapSample | None:
+    def apply_trigger(
+        sample: EdapSample,
+        triggers: list[Trigger],
+        expressions: "Mapping[str, CompiledExpression] | None" = None,
+    ) -> EdapSample | None:
         """Check if a sample activates any triggers. Returns a triggered EdapSample with activated trigger IDs, or None if no triggers fired.
         To be noted is the input "triggers" object will be updated with the values of the activated triggers and their conditions,
         but the returned EdapSample will have the trigger IDs in the "triggers" list and not the full trigger objects.
-        This is to avoid confusion about what properties are part of the triggered sample and what are part of the trigger definition."""
+        This is to avoid confusion about what properties are part of the triggered sample and what are part of the trigger definition.
+        `expressions` are the compiled expressions of the triggers by their text, expressions that are not in it
+        are compiled on the fly (cached, but only for so many expressions per process)."""
         conditions: dict[str, Trigger] = {}
         for t in triggers:
             condition = t.get("condition")
@@ -221,7 +422,7 @@ class EdapDevice(ABC):
 
         full_activated_triggers: list[Trigger] = []
         for trigger in triggers:
-            if "id" in trigger and EdapDevice._single_trigger_activated(sample, trigger, conditions):
+            if "id" in trigger and EdapDevice._single_trigger_activated(sample, trigger, conditions, expressions):
                 full_activated_triggers.append(trigger)
 
         if not full_activated_triggers:
@@ -235,6 +436,8 @@ class EdapDevice(ABC):
 
             trigger_value = EdapDevice._get_sample_value(sample, trigger_property)
             if trigger_value.exists:
+                if "deviation" in trigger:
+                    EdapDevice._start_segment(trigger, sample.get('time'), trigger_value.value)
                 trigger['value'] = trigger_value.value
             for condition in trigger.get("conditions") or []:
                 condition_property = conditions.get(condition, {}).get('property', None)
@@ -266,11 +469,122 @@ class EdapDevice(ABC):
 
     def trigger(self, sample: EdapSample) -> EdapSample | None:
         """If some triggers were activated, return modified sample with trigger list inside, otherwise, return None"""
-        result = self.apply_trigger(sample, self._triggers)
-        if result is not None:
-            self._last_sample = result
+        with self._lock:
+            if self._template is not None:
+                self._sync_template()
+            if self._derived_sensors:
+                sample = self._derived_sensors.apply(sample)
+            self.last_evaluated = sample
+            result = self._evaluate(sample)
+            if result is not None:
+                self._last_sample = result
+                # trigger values only change when triggers are activated
+                self._publish_state()
+            return result
+
+    def _evaluate(self, sample: EdapSample) -> EdapSample | None:
+        # called with the lock held
+        if not self.short_circuit:
+            return self.apply_trigger(sample, self._triggers, self._expressions)
+        plan = self._plan
+        if plan is None or plan.triggers is not self._triggers:
+            plan = self._plan = TriggerPlan(self._triggers)
+            self._fingerprint = None
+        fingerprint = plan.fingerprint(sample)
+        if plan.unchanged(self._fingerprint, fingerprint):
+            self.short_circuited += 1
+            result = self.apply_trigger(sample, plan.recheck, self._expressions) if plan.recheck else None
+        else:
+            result = self.apply_trigger(sample, self._triggers, self._expressions)
+        self._fingerprint = fingerprint if result is None else None
         return result
 
+    def _trigger_batch(self, samples: list[EdapSample]) -> tuple[list[EdapSample], float]:
+        started = time.perf_counter()
+        results = [result for result in map(self.trigger, samples) if result is not None]
+        return results, time.perf_counter() - started
+
+    async def stream(
+        self,
+        samples: AsyncIterable[EdapSample],
+        batch_size: int = 1,
+        thread_threshold: float | None = None,
+        batch_timeout: float | None = None,
+    ) -> AsyncIterator[EdapSample]:
+        """
+        Evaluate the triggers for an async stream of samples, yielding the triggered samples:
+        `async for triggered in device.stream(sample_source)`.
+        Samples are read and evaluated in batches of `batch_size` (the default of 1 evaluates every sample as
+        soon as it arrives). When `batch_timeout` is set, a batch is evaluated at the latest that many seconds
+        after its first sample was read, even if it is not full. When `thread_threshold` is set and evaluating a
+        sample takes longer than that many seconds on average, batches are evaluated in a worker thread instead
+        of on the event loop.
+        Cancelling the stream does not lose samples: a batch that is being evaluated in a worker thread is
+        finished, the samples already read into the next batch are evaluated, and their triggered samples are
+        yielded before the cancellation is raised. The sample source is closed when the stream is.
+        """
+        iterator = aiter(samples)
+        seconds_per_sample = 0.0
+        loop = asyncio.get_running_loop()
+        # the read of the next sample, when it outlasted the batch timeout of the previous batch
+        reading: asyncio.Future | None = None
+        cancelled = False
+        try:
+            exhausted = False
+            while not (exhausted or cancelled):
+                batch: list[EdapSample] = []
+                deadline: float | None = None
+                try:
+                    while len(batch) < batch_size:
+                        if deadline is None and reading is None:
+                            batch.append(await anext(iterator))
+                        else:
+                            # a task, as cancelling the read on a timeout would close an async generator source
+                            if reading is None:
+                                reading = asyncio.ensure_future(_read(iterator))
+                            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+                            done, _ = await asyncio.wait({reading}, timeout=timeout)
+                            if not done:
+                                break
+                            read, sample = reading.result()
+                            reading = None
+                            if not read:
+                                raise StopAsyncIteration
+                            batch.append(sample)
+                        if deadline is None and batch_timeout is not None:
+                            deadline = loop.time() + batch_timeout
+                except StopAsyncIteration:
+                    exhausted = True
+                except asyncio.CancelledError:
+                    cancelled = True
+                if not batch:
+                    break
+
+                if thread_threshold is not None and seconds_per_sample > thread_threshold:
+                    evaluation = loop.run_in_executor(None, self._trigger_batch, batch)
+                    try:
+                        results, elapsed = await asyncio.shield(evaluation)
+                    except asyncio.CancelledError:
+                        cancelled = True
+                        await asyncio.wait([evaluation])
+                        results, elapsed = evaluation.result()
+                else:
+                    results, elapsed = self._trigger_batch(batch)
+                # exponential moving average, so a few slow samples don't move evaluation off the event loop
+                seconds_per_sample += 0.2 * (elapsed / len(batch) - seconds_per_sample)
+
+                for result in results:
+                    yield result
+            if cancelled:
+                raise asyncio.CancelledError
+        finally:
+            if reading is not None:
+                reading.cancel()
+                await asyncio.wait([reading])
+            close = getattr(iterator, "aclose", None)
+            if close is not None:
+                await close()
+
     @staticmethod
     def generate_sample(sample: EdapSample) -> EdapSample:
         """
@@ -0,0 +1,324 @@
+import operator
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Mapping, NamedTuple
+
+Evaluator = Callable[[Any], Any]
+"""A compiled expression, called with a sample, returning the value of the expression for it."""
+
+
+class ExpressionError(ValueError):
+    """Raised when a trigger expression can not be parsed."""
+
+
+class _Token(NamedTuple):
+    kind: str
+    text: str
+    position: int
+
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*|`[^`]+`)
+  | (?P<operator><=|>=|==|!=|<|>|\+|-|\*|/|\(|\)|\{|\}|\[|\]|,)
+""", re.VERBOSE)
+
+_KEYWORDS = {"and", "or", "not", "in"}
+_CONSTANTS = {"true": True, "false": False, "none": None, "True": True, "False": False, "None": None}
+_ESCAPES = {"n": "\n", "t": "\t"}
+
+
+def _tokenize(text: str) -> list[_Token]:
+    tokens: list[_Token] = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise ExpressionError(f"Unexpected character {text[position]!r} at {position} in {text!r}")
+        kind = match.lastgroup or ""
+        if kind != "space":
+            value = match.group()
+            if kind == "name" and value in _KEYWORDS:
+                kind = value
+            tokens.append(_Token(kind, value, position))
+        position = match.end()
+    tokens.append(_Token("end", "", len(text)))
+    return tokens
+
+
+def _string_value(text: str) -> str:
+    return re.sub(r"\\(.)", lambda match: _ESCAPES.get(match.group(1), match.group(1)), text[1:-1])
+
+
+def _safe(compare: Callable[[Any, Any], bool]) -> Callable[[Any, Any], bool]:
+    # comparing with a missing value, or values of incompatible types, is false rather than an error
+    def safe_compare(left: Any, right: Any) -> bool:
+        try:
+            return bool(compare(left, right))
+        except TypeError:
+            return False
+    return safe_compare
+
+
+def _contains(left: Any, right: Any) -> bool:
+    return left in right
+
+
+def _not_contains(left: Any, right: Any) -> bool:
+    return left not in right
+
+
+_COMPARISONS: dict[str, Callable[[Any, Any], bool]] = {
+    "<": _safe(operator.lt),
+    "<=": _safe(operator.le),
+    ">": _safe(operator.gt),
+    ">=": _safe(operator.ge),
+    "==": operator.eq,
+    "!=": operator.ne,
+    "in": _safe(_contains),
+    "not in": _safe(_not_contains),
+}
+
+
+def _arithmetic(apply: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    # arithmetic on missing or non numeric values gives a missing value, which compares false with anything
+    def safe_apply(left: Any, right: Any) -> Any:
+        if not isinstance(left, int | float) or not isinstance(right, int | float):
+            return None
+        try:
+            return apply(left, right)
+        except ZeroDivisionError:
+            return None
+    return safe_apply
+
+
+_ARITHMETIC: dict[str, Callable[[Any, Any], Any]] = {
+    "+": _arithmetic(operator.add),
+    "-": _arithmetic(operator.sub),
+    "*": _arithmetic(operator.mul),
+    "/": _arithmetic(operator.truediv),
+}
+
+
+class _Node(NamedTuple):
+    evaluate: Evaluator
+    # set for constant sub-expressions, which are folded at compile time
+    constant: bool = False
+    value: Any = None
+
+
+def _constant(value: Any) -> _Node:
+    return _Node(lambda _: value, True, value)
+
+
+class _Parser:
+    """Recursive descent parser, building closures for the expression while parsing it."""
+
+    def __init__(self, text: str, lookup: Callable[[Any, str], Any]) -> None:
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.index = 0
+        self.lookup = lookup
+        self.names: set[str] = set()
+
+    def peek(self, *kinds: str) -> bool:
+        return self.tokens[self.index].kind in kinds or self.tokens[self.index].text in kinds
+
+    def take(self) -> _Token:
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def expect(self, text: str) -> None:
+        token = self.take()
+        if token.text != text:
+            raise ExpressionError(f"Expected {text!r} at {token.position} in {self.text!r}")
+
+    def parse(self) -> _Node:
+        node = self.parse_or()
+        token = self.tokens[self.index]
+        if token.kind != "end":
+            raise ExpressionError(f"Unexpected {token.text!r} at {token.position} in {self.text!r}")
+        return node
+
+    def parse_or(self) -> _Node:
+        operands = [self.parse_and()]
+        while self.peek("or"):
+            self.take()
+            operands.append(self.parse_and())
+        if len(operands) == 1:
+            return operands[0]
+        evaluators = tuple(operand.evaluate for operand in operands)
+
+        def evaluate_or(sample: Any) -> Any:
+            for evaluate in evaluators:
+                if evaluate(sample):
+                    return True
+            return False
+        return _Node(evaluate_or)
+
+    def parse_and(self) -> _Node:
+        operands = [self.parse_not()]
+        while self.peek("and"):
+            self.take()
+            operands.append(self.parse_not())
+        if len(operands) == 1:
+            return operands[0]
+        evaluators = tuple(operand.evaluate for operand in operands)
+
+        def evaluate_and(sample: Any) -> Any:
+            for evaluate in evaluators:
+                if not evaluate(sample):
+                    return False
+            return True
+        return _Node(evaluate_and)
+
+    def parse_not(self) -> _Node:
+        if self.peek("not"):
+            self.take()
+            operand = self.parse_not().evaluate
+            return _Node(lambda sample: not operand(sample))
+        return self.parse_comparison()
+
+    def parse_comparison(self) -> _Node:
+        left = self.parse_sum()
+        comparisons: list[tuple[Callable[[Any, Any], bool], _Node]] = []
+        while self.peek("<", "<=", ">", ">=", "==", "!=", "in", "not"):
+            token = self.take()
+            symbol = token.text
+            if symbol == "not":
+                if not self.peek("in"):
+                    raise ExpressionError(f"Expected 'in' after 'not' at {token.position} in {self.text!r}")
+                self.take()
+                symbol = "not in"
+            comparisons.append((_COMPARISONS[symbol], self.parse_sum()))
+        if not comparisons:
+            return left
+
+        # comparisons are chained like in Python, a < b < c means a < b and b < c
+        operands = (left.evaluate, *(operand.evaluate for _, operand in comparisons))
+        compares = tuple(compare for compare, _ in comparisons)
+        if len(compares) == 1:
+            compare, evaluate_left, evaluate_right = compares[0], operands[0], operands[1]
+            if comparisons[0][1].constant:
+                right_value = comparisons[0][1].value
+                return _Node(lambda sample: compare(evaluate_left(sample), right_value))
+            return _Node(lambda sample: compare(evaluate_left(sample), evaluate_right(sample)))
+
+        def evaluate_chain(sample: Any) -> bool:
+            left_value = operands[0](sample)
+            for compare, evaluate_right in zip(compares, operands[1:]):
+                right_value = evaluate_right(sample)
+                if not compare(left_value, right_value):
+                    return False
+                left_value = right_value
+            return True
+        return _Node(evaluate_chain)
+
+    def parse_sum(self) -> _Node:
+        node = self.parse_product()
+        while self.peek("+", "-"):
+            node = self.binary(_ARITHMETIC[self.take().text], node, self.parse_product())
+        return node
+
+    def parse_product(self) -> _Node:
+        node = self.parse_unary()
+        while self.peek("*", "/"):
+            node = self.binary(_ARITHMETIC[self.take().text], node, self.parse_unary())
+        return node
+
+    @staticmethod
+    def binary(apply: Callable[[Any, Any], Any], left: _Node, right: _Node) -> _Node:
+        if left.constant and right.constant:
+            return _constant(apply(left.value, right.value))
+        evaluate_left, evaluate_right = left.evaluate, right.evaluate
+        return _Node(lambda sample: apply(evaluate_left(sample), evaluate_right(sample)))
+
+    def parse_unary(self) -> _Node:
+        if self.peek("-"):
+            self.take()
+            return self.binary(_ARITHMETIC["-"], _constant(0), self.parse_unary())
+        return self.parse_atom()
+
+    def parse_atom(self) -> _Node:
+        token = self.take()
+        if token.kind == "number":
+            return _constant(int(token.text) if token.text.isdigit() else float(token.text))
+        if token.kind == "string":
+            return _constant(_string_value(token.text))
+        if token.kind == "name":
+            if token.text in _CONSTANTS:
+                return _constant(_CONSTANTS[token.text])
+            name = token.text.strip("`")
+            self.names.add(name)
+            lookup = self.lookup
+            return _Node(lambda sample: lookup(sample, name))
+        if token.text == "(":
+            node = self.parse_or()
+            self.expect(")")
+            return node
+        if token.text in ("{", "["):
+            return self.parse_collection("}" if token.text == "{" else "]")
+        raise ExpressionError(f"Unexpected {token.text or 'end'!r} at {token.position} in {self.text!r}")
+
+    def parse_collection(self, closing: str) -> _Node:
+        items: list[_Node] = []
+        while not self.peek(closing):
+            items.append(self.parse_or())
+            if not self.peek(","):
+                break
+            self.take()
+        self.expect(closing)
+        if all(item.constant for item in items):
+            values = [item.value for item in items]
+            try:
+                return _constant(frozenset(values))
+            except TypeError:
+                return _constant(tuple(values))
+        evaluators = tuple(item.evaluate for item in items)
+        return _Node(lambda sample: tuple(evaluate(sample) for evaluate in evaluators))
+
+
+class CompiledExpression(NamedTuple):
+    evaluate: Evaluator
+    names: frozenset[str]
+    """The sample properties and sensors the expression reads."""
+
+
+def _sample_lookup(sample: Any, name: str) -> Any:
+    # same lookup as for trigger properties: sample properties first, then sensors,
+    # and values that are not measurements are treated as missing
+    value = sample[name] if name in sample else (sample.get("sensors") or {}).get(name)
+    if not isinstance(value, int | float | str | bool | datetime):
+        return None
+    return value
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(text: str) -> CompiledExpression:
+    """
+    Compile a trigger expression, such as `power > 5 and soc < 0.2 or mode in {"eco", "off"}`, into a closure
+    that evaluates it for a sample. Expressions support `and`, `or` and `not` (short-circuiting), comparisons
+    (`<`, `<=`, `>`, `>=`, `==`, `!=`, `in`, `not in`, chained like in Python), arithmetic (`+`, `-`, `*`, `/`),
+    number and string literals, `true`, `false`, `none`, set or list literals, and names of sample properties
+    or sensors (quoted with backticks if they are not identifiers). Nothing is ever passed to `eval`.
+    Missing properties are None, and comparisons that are not possible (e.g. with None) are false.
+    Compiled expressions are cached, so compiling the same expression again is cheap.
+    """
+    if not isinstance(text, str):
+        raise ExpressionError(f"Expression must be a string, not {type(text).__name__}")
+    parser = _Parser(text, _sample_lookup)
+    try:
+        return CompiledExpression(parser.parse().evaluate, frozenset(parser.names))
+    except RecursionError:
+        raise ExpressionError("Expression is nested too deeply") from None
+
+
+def compile_expressions(triggers: Iterable[Mapping[str, Any]]) -> dict[str, CompiledExpression]:
+    """The compiled expressions of triggers by their text, as passed to EdapDevice.apply_trigger.
+    Raises an ExpressionError for invalid expressions."""
+    return {trigger["expr"]: compile_expression(trigger["expr"])
+            for trigger in triggers if trigger.get("expr") is not None}
@@ -0,0 +1,90 @@
+from typing import TYPE_CHECKING, Any, Mapping, Sequence
+
+from edap.expr import compile_expression
+
+if TYPE_CHECKING:
+    from edap.edap import EdapSample, Trigger
+
+_MISSING: Any = object()
+
+
+def _time_dependent(trigger: Mapping[str, Any]) -> bool:
+    # the outcome of these triggers changes with the time of the sample alone
+    if trigger.get("property") == "time" or "deviation" in trigger:
+        return True
+    expr = trigger.get("expr")
+    return expr is not None and "time" in compile_expression(expr).names
+
+
+class TriggerPlan:
+    """
+    What the activation of a set of triggers depends on: the sample properties and sensors they read (their
+    `property` and the names in their `expr`), and the triggers whose outcome also depends on the time of the
+    sample: time triggers, trajectory triggers, expressions reading `time`, and triggers with conditions
+    that do.
+    As long as no trigger is activated the trigger state does not change, so a sample with the same
+    fingerprint as the previous one activates none of the other triggers either, and only `recheck` (the time
+    dependent triggers, and the conditions they refer to) needs to be evaluated for it.
+    """
+    __slots__ = ("triggers", "names", "recheck")
+
+    def __init__(self, triggers: Sequence["Trigger"]) -> None:
+        self.triggers = triggers
+        names: dict[str, None] = {}
+        for trigger in triggers:
+            if trigger.get("property") is not None:
+                names[trigger["property"]] = None
+            if trigger.get("expr") is not None:
+                names.update(dict.fromkeys(compile_expression(trigger["expr"]).names))
+        # the time is not part of the fingerprint, time dependent triggers are evaluated for every sample
+        names.pop("time", None)
+        self.names = tuple(names)
+
+        # conditions are looked up by name, the last trigger with a name wins like in apply_trigger
+        conditions = {trigger["condition"]: trigger for trigger in triggers if trigger.get("condition") is not None}
+        dependent = {id(trigger) for trigger in triggers if _time_dependent(trigger)}
+        changed = True
+        while changed:
+            changed = False
+            for trigger in triggers:
+                if id(trigger) not in dependent and any(
+                    condition in conditions and id(conditions[condition]) in dependent
+                    for condition in trigger.get("conditions") or []
+                ):
+                    dependent.add(id(trigger))
+                    changed = True
+
+        # the conditions the time dependent triggers refer to, directly or through other conditions
+        referenced: set[str] = set()
+        pending = [trigger for trigger in triggers if "id" in trigger and id(trigger) in dependent]
+        while pending:
+            for condition in pending.pop().get("conditions") or []:
+                if condition in conditions and condition not in referenced:
+                    referenced.add(condition)
+                    pending.append(conditions[condition])
+        self.recheck: list["Trigger"] = []
+        if any("id" in trigger and id(trigger) in dependent for trigger in triggers):
+            self.recheck = [
+                trigger for trigger in triggers
+                if ("id" in trigger and id(trigger) in dependent) or trigger.get("condition") in referenced
+            ]
+
+    def fingerprint(self, sample: "EdapSample") -> list:
+        """The values of the sample the triggers read, looked up as EdapDevice.apply_trigger does: from the sample
+        properties first, then from the sensors."""
+        sensors = sample.get("sensors") or {}
+        return [sample[name] if name in sample else sensors.get(name, _MISSING)  # type: ignore[literal-required]
+                for name in self.names]
+
+    @staticmethod
+    def unchanged(previous: list | None, current: list) -> bool:
+        """If two fingerprints are equal, with values of the same types (so 0, 0.0 and False differ)."""
+        if previous is None:
+            return False
+        try:
+            if previous != current:
+                return False
+        except Exception:
+            # values that are not measurements (the triggers ignore them) may not be comparable
+            return False
+        return list(map(type, previous)) == list(map(type, current))
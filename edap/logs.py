@@ -0,0 +1,57 @@
+import logging
+import time
+from threading import Lock
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Logging filter that lets through at most `burst` records of the same kind every `interval` seconds.
+    Records are of the same kind when they come from the same logger, with the same level and message
+    template (or the same "message" key for dict payloads). Records below `level` are never limited.
+    The first record let through after some were dropped gets a "suppressed" attribute with their count.
+    Kinds of records that were not logged for an interval are forgotten, those with suppressed records after
+    another interval, so their count is reported if they are logged again by then.
+    """
+    def __init__(self, interval: float = 60.0, burst: int = 1, level: int = logging.WARNING) -> None:
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.level = level
+        self._windows: dict[tuple, list[float | int]] = {}
+        self._last_eviction = time.monotonic()
+        self._lock = Lock()
+
+    @staticmethod
+    def _key(record: logging.LogRecord) -> tuple:
+        message = record.msg
+        if isinstance(message, dict):
+            message = message.get("message")
+        return (record.name, record.levelno, str(message))
+
+    def _evict(self, now: float) -> None:
+        # called with the lock held, at most once an interval, so the windows don't grow with every kind of
+        # record that was ever logged
+        self._windows = {key: window for key, window in self._windows.items()
+                         if now - window[0] < (2 if window[2] else 1) * self.interval}
+        self._last_eviction = now
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level:
+            return True
+        key = self._key(record)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_eviction >= self.interval:
+                self._evict(now)
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
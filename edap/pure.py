@@ -0,0 +1,48 @@
+from collections import ChainMap
+from types import MappingProxyType
+from typing import Any, Mapping, Sequence
+
+from edap.edap import EdapDevice, EdapSample, Trigger
+from edap.expr import compile_expressions
+
+TriggerState = tuple[Mapping[str, Any], ...]
+"""The state of a trigger set: for every trigger, by position, the state keys that changed since it was set."""
+
+_NO_STATE: Mapping[str, Any] = MappingProxyType({})
+
+
+def initial_state(triggers: Sequence[Mapping[str, Any]]) -> TriggerState:
+    """The state of triggers that were just set. Their initial values are read from their definitions."""
+    return (_NO_STATE,) * len(triggers)
+
+
+def evaluate(
+    sample: EdapSample, triggers: Sequence[Mapping[str, Any]], state: TriggerState | None = None
+) -> tuple[EdapSample | None, TriggerState]:
+    """
+    Evaluate a sample with the same rules as EdapDevice.apply_trigger, without changing the triggers or the state:
+    returns the triggered sample (or None) and the new state. The triggers are only read, so a single (read-only)
+    trigger set can be shared by any number of devices and threads, each with its own state. The new state shares
+    the entries of the triggers that were not activated with the given state, and is the given state itself when
+    nothing was activated. Keeping the previous state around makes retrying a sample, or rolling back the
+    trigger state when sending a triggered sample failed, a matter of evaluating with the previous state again.
+    """
+    if state is None:
+        state = initial_state(triggers)
+    elif len(state) != len(triggers):
+        raise ValueError(f"The state has {len(state)} entries, for {len(triggers)} triggers")
+
+    # apply_trigger writes the new trigger state to the first map of every overlay
+    overlays: list[Any] = [ChainMap({}, entry, trigger) for entry, trigger in zip(state, triggers)]
+    triggered = EdapDevice.apply_trigger(sample, overlays, compile_expressions(triggers))
+    if triggered is None:
+        return None, state
+    return triggered, tuple(
+        entry if not overlay.maps[0] else MappingProxyType({**entry, **overlay.maps[0]})
+        for entry, overlay in zip(state, overlays)
+    )
+
+
+def materialize(triggers: Sequence[Trigger], state: TriggerState) -> list[Trigger]:
+    """Copies of the triggers with their state applied, as EdapDevice.apply_trigger would have left them."""
+    return [{**trigger, **entry} for trigger, entry in zip(triggers, state)]  # type: ignore[misc]
@@ -0,0 +1,425 @@
+import logging
+from contextlib import suppress
+from copy import deepcopy
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, NamedTuple, Protocol
+
+from edap.edap import EdapDevice, EdapSample, Trigger
+from edap.expr import compile_expression
+from edap.pure import evaluate, initial_state, materialize
+from edap.template import TriggerTemplate
+
+try:
+    from edap.whatif import Sweep, sweepable
+except ImportError:
+    # edap.whatif requires numpy, without it the whatif engine is left out of ENGINES
+    Sweep = None  # type: ignore[assignment,misc]
+
+# The trigger engine as implemented by EdapDevice.apply_trigger when it was frozen, kept as the reference that
+# faster engines (and later changes to EdapDevice) are checked against, see tests/test_reference.py.
+# Do not change its semantics: fix or change EdapDevice, and only change the reference along with it when
+# the change in semantics is deliberate. Expressions are evaluated with edap.expr like in EdapDevice.
+
+_logger = logging.getLogger(__name__)
+
+_MeasurementValue = int | float | str | bool | datetime | None
+
+
+class _SampleValue(NamedTuple):
+    exists: bool
+    value: _MeasurementValue
+
+
+def _delta_triggered(current_sample_value: _MeasurementValue, trigger: Trigger) -> bool:
+    if "delta" not in trigger:
+        return False
+    if "value" not in trigger:
+        return True
+    if not isinstance(current_sample_value, float | int | bool):
+        return False
+    trigger_value = trigger["value"]
+    if not isinstance(trigger_value, float | int | bool):
+        return False
+    delta = trigger["delta"]
+    if delta is None or delta == 0:
+        return current_sample_value != trigger_value
+    return abs(current_sample_value - trigger_value) > delta
+
+
+def _seconds_since_value(sample_time: datetime | None, trigger: Trigger) -> float | None:
+    value_time = trigger.get("value_time")
+    if not isinstance(sample_time, datetime) or not isinstance(value_time, datetime):
+        return None
+    with suppress(TypeError):
+        return (sample_time - value_time).total_seconds()
+    return None
+
+
+def _trajectory_triggered(
+    current_sample_value: _MeasurementValue, sample_time: datetime | None, trigger: Trigger
+) -> bool:
+    if "deviation" not in trigger:
+        return False
+    if "value" not in trigger:
+        return True
+    if not isinstance(current_sample_value, float | int):
+        return False
+    trigger_value = trigger["value"]
+    if not isinstance(trigger_value, float | int):
+        return False
+    # the value the signal is expected to have, continuing the last segment from its end
+    predicted = trigger_value
+    elapsed = _seconds_since_value(sample_time, trigger)
+    if elapsed is not None and elapsed > 0:
+        predicted += trigger.get("slope", 0.0) * elapsed
+    return abs(current_sample_value - predicted) > (trigger["deviation"] or 0)
+
+
+def _start_segment(trigger: Trigger, sample_time: datetime | None, sample_value: _MeasurementValue) -> None:
+    slope = 0.0
+    trigger_value = trigger.get("value")
+    elapsed = _seconds_since_value(sample_time, trigger)
+    if (elapsed is not None and elapsed > 0 and isinstance(trigger_value, float | int)
+            and isinstance(sample_value, float | int)):
+        slope = (sample_value - trigger_value) / elapsed
+    trigger["slope"] = slope
+    trigger["value_time"] = sample_time
+
+
+def _get_sample_value(sample: EdapSample | None, key: str | None) -> _SampleValue:
+    if sample is None or key is None:
+        return _SampleValue(False, None)
+    if key not in sample:
+        sensors = sample.get('sensors', {})
+        if key not in sensors:
+            return _SampleValue(False, None)
+        value = sensors[key]
+    else:
+        value = sample.get(key)
+    if not isinstance(value, _MeasurementValue):
+        return _SampleValue(False, None)
+    return _SampleValue(True, value)
+
+
+def _level_triggered(sample_value: _MeasurementValue, trigger: Trigger) -> bool:
+    if "levels" not in trigger:
+        return False
+    if not isinstance(sample_value, float | int):
+        return False
+    levels: list[float] = trigger["levels"] or []
+    if "value" not in trigger:
+        return sample_value not in levels
+    trigger_value = trigger["value"]
+    if not isinstance(trigger_value, float | int):
+        return False
+    for level in levels:
+        if trigger_value > level > sample_value or trigger_value < level < sample_value:
+            return True
+    return False
+
+
+def _tolerance_triggered(current_sample_value: _SampleValue, trigger: Trigger) -> bool:
+    if "tolerance" not in trigger or trigger.get("tolerance") is None:
+        return False
+    trigger_value = trigger.get("value", trigger.get("tolerance"))
+    has_value = current_sample_value.exists and current_sample_value.value is not None
+    if (trigger_value is None and has_value) or (trigger_value is not None and not has_value):
+        return True
+    return False
+
+
+def _is_time_triggered(sample_time: datetime | None, trigger: Trigger) -> bool:
+    if sample_time is None:
+        return False
+    delta_time = trigger.get('delta')
+    last_trigger_time = trigger.get('value')
+
+    if not isinstance(last_trigger_time, datetime):
+        if isinstance(last_trigger_time, str):
+            try:
+                last_trigger_time = datetime.fromisoformat(last_trigger_time)
+            except ValueError:
+                last_trigger_time = None
+        elif isinstance(last_trigger_time, (int, float)):
+            try:
+                last_trigger_time = datetime.fromtimestamp(last_trigger_time, tz=timezone.utc)
+            except (ValueError, TypeError):
+                last_trigger_time = None
+    elif last_trigger_time.tzinfo is None:
+        last_trigger_time = last_trigger_time.replace(tzinfo=timezone.utc)
+
+    if isinstance(delta_time, str):
+        try:
+            delta_time = float(delta_time)
+        except ValueError:
+            delta_time = None
+
+    delta = timedelta(seconds=float(delta_time)) if delta_time is not None else timedelta(seconds=60)
+
+    if last_trigger_time is not None:
+        with suppress(TypeError):
+            return sample_time - last_trigger_time >= delta
+    return True
+
+
+def _condition_triggered(current_sample_value: _MeasurementValue, trigger: Trigger) -> bool:
+    if not ("greater" in trigger or "less" in trigger or "in" in trigger):
+        return False
+    limit_greater = trigger.get("greater")
+    if limit_greater is not None and (
+        not isinstance(current_sample_value, float | int)
+        or current_sample_value <= limit_greater
+    ):
+        return False
+    limit_less = trigger.get("less")
+    if limit_less is not None and (
+        not isinstance(current_sample_value, float | int)
+        or current_sample_value >= limit_less
+    ):
+        return False
+    values_in = trigger.get("in")
+    if values_in is not None and current_sample_value not in values_in:
+        return False
+    return True
+
+
+def _single_trigger_activated(
+    current_sample: EdapSample,
+    trigger: Trigger,
+    conditions: dict[str, Trigger],
+) -> bool:
+    trigger_property: str | None = trigger.get('property')
+    expr: str | None = trigger.get('expr')
+    if trigger_property is None and expr is None:
+        return False
+    try:
+        if "conditions" in trigger:
+            for condition in trigger.get("conditions") or []:
+                if condition in conditions and not _single_trigger_activated(
+                    current_sample, conditions.get(condition, {}), conditions
+                ):
+                    return False
+
+        # an expression gates the trigger like its conditions do, and a trigger with only an
+        # expression (no property) is activated whenever the expression holds
+        if expr is not None and not compile_expression(expr).evaluate(current_sample):
+            return False
+        if trigger_property is None:
+            return True
+
+        if trigger_property == "time":
+            return _is_time_triggered(current_sample.get('time'), trigger)
+        current_sample_value = _get_sample_value(current_sample, trigger_property)
+
+        # A missing or None sample value must not activate any trigger other than the
+        # tolerance trigger, which deliberately fires on value<->no-value transitions
+        # (and only when it has been given a value different from None).
+        if not (current_sample_value.exists and current_sample_value.value is not None):
+            return _tolerance_triggered(current_sample_value, trigger)
+
+        if "condition" in trigger and _condition_triggered(current_sample_value.value, trigger):
+            return True
+
+        return (
+            _tolerance_triggered(current_sample_value, trigger)
+            or _level_triggered(current_sample_value.value, trigger)
+            or _delta_triggered(current_sample_value.value, trigger)
+            or _trajectory_triggered(current_sample_value.value, current_sample.get('time'), trigger)
+        )
+    except Exception as e:
+        _logger.error("EdapDevice error: Error processing trigger %s: %s", trigger, e, exc_info=True)
+
+    return False
+
+
+def apply_trigger(sample: EdapSample, triggers: list[Trigger]) -> EdapSample | None:
+    """EdapDevice.apply_trigger as it was frozen: whether a sample activates any triggers, returning the triggered
+    sample or None, and updating the values of the activated triggers and their conditions in place."""
+    conditions: dict[str, Trigger] = {}
+    for t in triggers:
+        condition = t.get("condition")
+        if condition is not None:
+            conditions[condition] = t
+
+    return _triggered_sample(sample, [trigger for trigger in triggers
+                                      if "id" in trigger and _single_trigger_activated(sample, trigger, conditions)],
+                             conditions)
+
+
+def _triggered_sample(sample: EdapSample, full_activated_triggers: list[Trigger],
+                      conditions: dict[str, Trigger]) -> EdapSample | None:
+    """The triggered sample for the activated triggers, updating their values and those of their conditions."""
+    if not full_activated_triggers:
+        return None
+
+    result = generate_sample(sample)
+    sensors: dict = sample.get('sensors') or {}
+
+    for trigger in full_activated_triggers:
+        trigger_property = trigger.get('property')
+
+        trigger_value = _get_sample_value(sample, trigger_property)
+        if trigger_value.exists:
+            if "deviation" in trigger:
+                _start_segment(trigger, sample.get('time'), trigger_value.value)
+            trigger['value'] = trigger_value.value
+        for condition in trigger.get("conditions") or []:
+            condition_property = conditions.get(condition, {}).get('property', None)
+            if condition_property:
+                condition_value = _get_sample_value(sample, condition_property)
+                if condition_value.exists:
+                    conditions[condition]['value'] = condition_value.value
+
+        trigger_id = trigger.get("id")
+        if trigger.get('discard_sample', False):
+            trigger_id = f"#{trigger_id}"
+
+        if trigger_id:
+            result['triggers'].append(trigger_id)
+
+        if len(result['sensors']) == len(sensors):
+            continue
+
+        trigger_sensors: list[str] | None = trigger.get('sensors')
+        if trigger_sensors is None:
+            result['sensors'] = deepcopy(sensors)
+        else:
+            for trigger_sensor in trigger_sensors:
+                sensor_value = sensors.get(trigger_sensor)
+                if sensor_value is not None:
+                    result['sensors'][trigger_sensor] = sensor_value
+
+    return deepcopy(result)
+
+
+def generate_sample(sample: EdapSample) -> EdapSample:
+    """The base of a triggered sample, as EdapDevice.generate_sample generates it."""
+    return {
+        "time": sample.get("time"),
+        "power": sample.get("power"),
+        "energy": sample.get("energy"),
+        "triggers": [],
+        "sensors": {}
+    }
+
+
+class Engine(Protocol):
+    """A trigger engine evaluating the samples of a single device."""
+    def trigger(self, sample: EdapSample) -> EdapSample | None: ...
+
+    def set_triggers(self, triggers: list[Trigger]) -> None:
+        """Replace the triggers, like EdapDevice.set_triggers. Engines with a template update it instead, which
+        keeps the state of the triggers whose id and property are unchanged."""
+        ...
+
+    def triggers(self) -> list[dict[str, Any]]:
+        """The triggers with their current state, as plain dicts."""
+        ...
+
+
+def _plain(trigger: Any) -> dict[str, Any]:
+    # compact triggers and templates store the lists of the definition as tuples
+    return {key: list(value) if isinstance(value, tuple) else value for key, value in trigger.items()}
+
+
+class ReferenceEngine:
+    """The reference engine, with its own copy of the triggers."""
+    def __init__(self, triggers: list[Trigger]) -> None:
+        self._triggers = deepcopy(triggers)
+
+    def trigger(self, sample: EdapSample) -> EdapSample | None:
+        return apply_trigger(sample, self._triggers)
+
+    def set_triggers(self, triggers: list[Trigger]) -> None:
+        self._triggers = deepcopy(triggers)
+
+    def triggers(self) -> list[dict[str, Any]]:
+        return [_plain(trigger) for trigger in self._triggers]
+
+
+class DeviceEngine:
+    """An EdapDevice (of a given class) evaluating the samples, optionally with the triggers of a template."""
+    def __init__(self, triggers: list[Trigger], device_class: type[EdapDevice] = EdapDevice,
+                 template: bool = False) -> None:
+        self.device = device_class()
+        self.template = TriggerTemplate(triggers) if template else None
+        if self.template is not None:
+            self.device.set_template(self.template)
+        else:
+            self.device.set_triggers(triggers)
+
+    def trigger(self, sample: EdapSample) -> EdapSample | None:
+        return self.device.trigger(sample)
+
+    def set_triggers(self, triggers: list[Trigger]) -> None:
+        # the triggers are passed on as they are, devices must not depend on getting a list of their own
+        if self.template is not None:
+            self.template.update(triggers)
+        else:
+            self.device.set_triggers(triggers)
+
+    def triggers(self) -> list[dict[str, Any]]:
+        return [_plain(trigger) for trigger in self.device.get_triggers()]
+
+
+class PureEngine:
+    """edap.pure.evaluate, threading the trigger state from sample to sample."""
+    def __init__(self, triggers: list[Trigger]) -> None:
+        self.set_triggers(triggers)
+
+    def trigger(self, sample: EdapSample) -> EdapSample | None:
+        triggered, self._state = evaluate(sample, self._triggers, self._state)
+        return triggered
+
+    def set_triggers(self, triggers: list[Trigger]) -> None:
+        self._triggers = deepcopy(triggers)
+        self._state = initial_state(self._triggers)
+
+    def triggers(self) -> list[dict[str, Any]]:
+        return [_plain(trigger) for trigger in materialize(self._triggers, self._state)]
+
+
+class WhatifEngine:
+    """edap.whatif, with every trigger evaluated as a sweep of a single variant. Trigger sets that can not be swept
+    (with conditions, expressions, tolerances, ...) are evaluated with the reference instead."""
+    def __init__(self, triggers: list[Trigger]) -> None:
+        self.set_triggers(triggers)
+
+    def trigger(self, sample: EdapSample) -> EdapSample | None:
+        if self._sweeps is None:
+            return apply_trigger(sample, self._triggers)
+        return _triggered_sample(sample, [trigger for trigger, sweep in zip(self._triggers, self._sweeps)
+                                          if sweep.update(sample)[0]], {})
+
+    def set_triggers(self, triggers: list[Trigger]) -> None:
+        self._triggers = deepcopy(triggers)
+        self._sweeps: list[Sweep] | None = None
+        if all(sweepable(trigger) for trigger in self._triggers):
+            self._sweeps = [Sweep(trigger) for trigger in self._triggers]
+
+    def triggers(self) -> list[dict[str, Any]]:
+        return [_plain(trigger) for trigger in self._triggers]
+
+
+class _FullDevice(EdapDevice):
+    # evaluates every trigger for every sample, see EdapDevice.short_circuit
+    short_circuit = False
+
+
+class _CompactDevice(EdapDevice):
+    compact_storage = True
+
+
+ENGINES: dict[str, Callable[[list[Trigger]], Engine]] = {
+    "reference": ReferenceEngine,
+    "device": DeviceEngine,
+    "device_full": lambda triggers: DeviceEngine(triggers, _FullDevice),
+    "compact": lambda triggers: DeviceEngine(triggers, _CompactDevice),
+    "template": lambda triggers: DeviceEngine(triggers, template=True),
+    "pure": PureEngine,
+}
+"""The trigger engines of the package by name, each created from a trigger set. All of them must evaluate
+every sample stream like the reference engine: the same triggered samples and the same trigger state."""
+if Sweep is not None:
+    ENGINES["whatif"] = WhatifEngine
+
@@ -0,0 +1,316 @@
+import argparse
+import json
+import math
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterable, Iterator, NamedTuple
+
+from edap.edap import EdapDevice, EdapSample, Trigger
+
+_MAGIC = b"EDAPREC2"
+# recordings of the first version stored every column as float64, with NaN for both None and missing values
+_MAGIC_V1 = b"EDAPREC1"
+_CHUNK_HEADER = struct.Struct("<I")
+_SENSOR_PREFIX = "sensors."
+
+# Column kinds. Floats and times are stored as float64 arrays, ints as int64 arrays, booleans as byte arrays,
+# anything else (and ints beyond 64 bits) as an int64 index into a per-chunk table of values.
+_FLOAT = "f"
+_INT = "i"
+_BOOL = "b"
+_TABLE = "t"
+_TIME = "time"
+_TYPECODES = {_FLOAT: "d", _INT: "q", _BOOL: "B", _TABLE: "q", _TIME: "d"}
+
+# Every column is preceded by a byte per sample telling if the value is in the sample, and if it is None.
+_ABSENT = 0
+_NONE = 1
+_PRESENT = 2
+_NOT_RECORDED = object()
+
+
+class ReplayEvent(NamedTuple):
+    """A triggered sample produced while replaying a recording."""
+    device: str | None
+    time: datetime | None
+    triggers: list[str]
+    sample: EdapSample
+
+
+def _kind(value) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return _BOOL
+    if isinstance(value, int):
+        return _INT if -2 ** 63 <= value < 2 ** 63 else _TABLE
+    if isinstance(value, float):
+        return _FLOAT
+    if isinstance(value, datetime):
+        return _TIME
+    return _TABLE
+
+
+def _merge_kinds(kind: str | None, other: str | None) -> str | None:
+    if kind is None or kind == other:
+        return other
+    if other is None:
+        return kind
+    if {kind, other} == {_INT, _FLOAT}:
+        return _FLOAT
+    return _TABLE
+
+
+class SampleRecorder:
+    """
+    Records samples to a compact, columnar file: samples are buffered and written in chunks, with one array
+    per property and sensor, typed by the values in it (a column with both ints and floats is stored as floats),
+    and whether every value is in the sample at all. Use `read_samples` to read them back, and `replay` to feed
+    them through EdapDevices.
+    Samples can be recorded and flushed from different threads, e.g. recorded on an event loop with
+    `flush=False`, and flushed from a worker thread once the recorder is `full`.
+    """
+    def __init__(self, file: str | BinaryIO, chunk_size: int = 4096) -> None:
+        if isinstance(file, str):
+            self._file: BinaryIO = open(file, "wb")
+            self._owns_file = True
+        else:
+            self._file = file
+            self._owns_file = False
+        self._file.write(_MAGIC)
+        self.chunk_size = chunk_size
+        self._rows: list[dict] = []
+        # guards the buffered rows, and makes chunks get written one at a time, in order
+        self._rows_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @property
+    def full(self) -> bool:
+        """If a chunk worth of samples is buffered."""
+        return len(self._rows) >= self.chunk_size
+
+    def record(self, sample: EdapSample, device: str | None = None, flush: bool = True) -> None:
+        """Buffer a sample, writing a chunk to the file once enough samples are buffered, unless `flush` is
+        False."""
+        row = {key: value for key, value in sample.items() if key not in ("sensors", "triggers")}
+        for sensor, value in (sample.get("sensors") or {}).items():
+            row[f"{_SENSOR_PREFIX}{sensor}"] = value
+        if device is not None:
+            row["device"] = device
+        with self._rows_lock:
+            self._rows.append(row)
+        if flush and self.full:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered samples as a chunk."""
+        with self._write_lock:
+            with self._rows_lock:
+                rows, self._rows = self._rows, []
+            if rows:
+                self._write_chunk(rows)
+
+    def _write_chunk(self, rows: list[dict]) -> None:
+        kinds: dict[str, str | None] = {}
+        for row in rows:
+            for name, value in row.items():
+                kinds[name] = _merge_kinds(kinds.get(name), _kind(value))
+
+        table: list = []
+        table_index: dict[str, int] = {}
+        columns: list[dict] = []
+        data = bytearray()
+        for name, kind in kinds.items():
+            kind = kind or _FLOAT
+            presence = bytearray(len(rows))
+            column = array(_TYPECODES[kind])
+            for i, row in enumerate(rows):
+                value = row.get(name, _NOT_RECORDED)
+                if value is _NOT_RECORDED or value is None:
+                    presence[i] = _ABSENT if value is _NOT_RECORDED else _NONE
+                    column.append(0)
+                    continue
+                presence[i] = _PRESENT
+                if kind == _TIME:
+                    if value.tzinfo is None:
+                        value = value.replace(tzinfo=timezone.utc)
+                    column.append(value.timestamp())
+                elif kind == _TABLE:
+                    key = json.dumps(value, default=str)
+                    if key not in table_index:
+                        table_index[key] = len(table)
+                        table.append(value if not isinstance(value, datetime) else value.isoformat())
+                    column.append(table_index[key])
+                else:
+                    column.append(value)
+            if sys.byteorder != "little":
+                column.byteswap()
+            columns.append({"name": name, "kind": kind})
+            data += presence
+            data += column.tobytes()
+
+        header = json.dumps({"count": len(rows), "columns": columns, "table": table},
+                            default=str).encode()
+        self._file.write(_CHUNK_HEADER.pack(len(header)))
+        self._file.write(header)
+        self._file.write(data)
+        self._file.flush()
+
+    def close(self) -> None:
+        """Write the remaining buffered samples and close the file, if it was opened by the recorder."""
+        self.flush()
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self) -> "SampleRecorder":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def _column_values(kind: str, column: array, presence: Iterable[int], table: list) -> list:
+    values: list = []
+    for value, present in zip(column, presence):
+        if present == _ABSENT:
+            values.append(_NOT_RECORDED)
+        elif present == _NONE:
+            values.append(None)
+        elif kind == _TIME:
+            values.append(datetime.fromtimestamp(value, tz=timezone.utc))
+        elif kind == _TABLE:
+            values.append(table[int(value)])
+        elif kind == _BOOL:
+            values.append(value != 0.0)
+        elif kind == _INT:
+            values.append(int(value))
+        else:
+            values.append(value)
+    return values
+
+
+def read_samples(file: str | BinaryIO) -> Iterator[tuple[str | None, EdapSample]]:
+    """Lazily read the (device, sample) pairs of a recording, one chunk in memory at a time."""
+    if isinstance(file, str):
+        with open(file, "rb") as opened:
+            yield from read_samples(opened)
+        return
+    magic = file.read(len(_MAGIC))
+    if magic not in (_MAGIC, _MAGIC_V1):
+        raise ValueError("Not an EDAP sample recording")
+    legacy = magic == _MAGIC_V1
+    while True:
+        size = file.read(_CHUNK_HEADER.size)
+        if not size:
+            return
+        header = json.loads(file.read(_CHUNK_HEADER.unpack(size)[0]))
+        count = header["count"]
+        columns: dict[str, list] = {}
+        for column in header["columns"]:
+            name, kind = column["name"], column["kind"]
+            presence: Iterable[int] = b"" if legacy else file.read(count)
+            values = array("d" if legacy else _TYPECODES[kind])
+            values.frombytes(file.read(count * values.itemsize))
+            if sys.byteorder != "little":
+                values.byteswap()
+            if legacy:
+                # NaN was read back as None for properties, and as a missing sensor
+                missing = _ABSENT if name.startswith(_SENSOR_PREFIX) else _NONE
+                presence = [missing if math.isnan(value) else _PRESENT for value in values]
+            columns[name] = _column_values(kind, values, presence, header["table"])
+
+        for i in range(count):
+            sample: EdapSample = {"sensors": {}}
+            device = None
+            for name, values in columns.items():
+                value = values[i]
+                if value is _NOT_RECORDED:
+                    continue
+                if name == "device":
+                    device = value
+                elif name.startswith(_SENSOR_PREFIX):
+                    sample["sensors"][name[len(_SENSOR_PREFIX):]] = value
+                else:
+                    sample[name] = value
+            yield device, sample
+
+
+def replay(
+    samples: Iterable[tuple[str | None, EdapSample]],
+    devices: EdapDevice | dict[str | None, EdapDevice],
+) -> Iterator[ReplayEvent]:
+    """
+    Feed recorded samples through EdapDevice.trigger, as fast as possible, and yield the triggered samples.
+    Time is driven by the "time" of the samples, never by the wall clock. When a single device is given,
+    all samples are fed through it, otherwise each sample goes to the device recorded with it, and samples
+    of devices that are not given are skipped.
+    """
+    for device_id, sample in samples:
+        device = devices if isinstance(devices, EdapDevice) else devices.get(device_id)
+        if device is None:
+            continue
+        triggered = device.trigger(sample)
+        if triggered is not None:
+            yield ReplayEvent(device_id, triggered.get("time"), list(triggered["triggers"]), triggered)
+
+
+def _serialize(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return str(obj)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Replay a recording through a trigger configuration and report what would have been sent."""
+    parser = argparse.ArgumentParser(prog="python -m edap.replay", description=main.__doc__)
+    parser.add_argument("recording", help="file written by SampleRecorder")
+    parser.add_argument("triggers", help="JSON file with the list of triggers, as sent with set_triggers")
+    parser.add_argument("--events", action="store_true", help="print every triggered sample")
+    args = parser.parse_args(argv)
+
+    with open(args.triggers, encoding="utf-8") as triggers_file:
+        triggers: list[Trigger] = json.load(triggers_file)
+
+    devices: dict[str | None, EdapDevice] = {}
+    samples = 0
+    messages = 0
+    uplink_bytes = 0
+    trigger_counts: dict[str, int] = {}
+
+    def with_devices():
+        nonlocal samples
+        for device_id, sample in read_samples(args.recording):
+            samples += 1
+            if device_id not in devices:
+                devices[device_id] = EdapDevice(json.loads(json.dumps(triggers)))
+            yield device_id, sample
+
+    started = time.process_time()
+    for event in replay(with_devices(), devices):
+        messages += 1
+        payload = json.dumps(event.sample, default=_serialize)
+        uplink_bytes += len(payload)
+        for trigger_id in event.triggers:
+            trigger_counts[trigger_id] = trigger_counts.get(trigger_id, 0) + 1
+        if args.events:
+            print(json.dumps({"device": event.device, "time": event.time, "triggers": event.triggers},
+                             default=_serialize))
+    cpu_seconds = time.process_time() - started
+
+    print(json.dumps({
+        "devices": len(devices),
+        "samples": samples,
+        "messages": messages,
+        "uplink_bytes": uplink_bytes,
+        "triggers": trigger_counts,
+        "cpu_seconds": round(cpu_seconds, 6),
+        "samples_per_cpu_second": round(samples / cpu_seconds) if cpu_seconds else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
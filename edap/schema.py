@@ -0,0 +1,122 @@
+import threading
+from typing import TYPE_CHECKING, Iterable
+
+from edap.codec import REMOVED_SENSORS
+
+if TYPE_CHECKING:
+    from edap.edap import Trigger
+
+# Fields of a sample that are never given ids, as they are part of every sample anyway.
+_FIXED_FIELDS = ("time", "triggers", "sensors")
+SCHEMA_VERSION = "schema"
+
+
+class SampleSchema:
+    """
+    Versioned registry mapping the property and sensor names of a device to small integer ids.
+    Ids are assigned in order and never change or get reused, extending the schema with new names only
+    bumps its version, so state that is keyed by id stays valid. The schema is sent to the receiver
+    once (see `to_dict`) and again whenever its version changes, after which samples can be sent keyed
+    by id rather than by name (see `encode` and `decode`).
+    The schema of a device is extended while its samples are evaluated and encoded from other threads, so it
+    is changed and read under a lock of its own.
+    """
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self._lock = threading.Lock()
+        self.version = 0
+        self._names: list[str] = []
+        self._ids: dict[str, int] = {}
+        self.extend(names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._ids
+
+    @property
+    def names(self) -> tuple[str, ...]:
+        with self._lock:
+            return tuple(self._names)
+
+    def extend(self, names: Iterable[str]) -> bool:
+        """Add the names that are not in the schema yet, returning if the schema changed."""
+        with self._lock:
+            return self._extend(names)
+
+    def _extend(self, names: Iterable[str]) -> bool:
+        # called with the lock held
+        added = False
+        for name in names:
+            if name in self._ids or name in _FIXED_FIELDS:
+                continue
+            self._ids[name] = len(self._names)
+            self._names.append(name)
+            added = True
+        if added:
+            self.version += 1
+        return added
+
+    def extend_from_triggers(self, triggers: Iterable["Trigger"]) -> bool:
+        """Add the properties and sensors referenced by triggers, returning if the schema changed."""
+        names: list[str] = []
+        for trigger in triggers:
+            trigger_property = trigger.get("property")
+            if trigger_property is not None:
+                names.append(trigger_property)
+            names.extend(trigger.get("sensors") or [])
+        return self.extend(names)
+
+    def id(self, name: str) -> int | None:
+        return self._ids.get(name)
+
+    def name(self, id_: int) -> str:
+        return self._names[id_]
+
+    def to_dict(self) -> dict:
+        """The schema as sent to the receiver."""
+        with self._lock:
+            return {"version": self.version, "names": list(self._names)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SampleSchema":
+        schema = cls(data.get("names") or [])
+        schema.version = data.get("version", schema.version)
+        return schema
+
+    def update(self, data: dict) -> None:
+        """Update the schema from a newer version received from the sender."""
+        with self._lock:
+            self._extend((data.get("names") or [])[len(self._names):])
+            self.version = data.get("version", self.version)
+
+    def encode(self, sample: dict) -> dict:
+        """Replace the sensor names of a sample (or a delta encoded frame) with their ids, as strings since
+        this is meant for JSON. Sensors that are not in the schema extend it, so check the version before
+        and after encoding, and send the schema again when it changed."""
+        encoded = dict(sample)
+        with self._lock:
+            sensors = sample.get("sensors")
+            if sensors:
+                self._extend(sensors)
+                encoded["sensors"] = {str(self._ids[name]): value for name, value in sensors.items()}
+            removed_sensors = sample.get(REMOVED_SENSORS)
+            if removed_sensors:
+                self._extend(removed_sensors)
+                encoded[REMOVED_SENSORS] = [self._ids[name] for name in removed_sensors]
+            encoded[SCHEMA_VERSION] = self.version
+        return encoded
+
+    def decode(self, encoded: dict) -> dict:
+        """Restore the sensor names of a sample encoded with `encode`."""
+        if encoded.get(SCHEMA_VERSION, 0) > self.version:
+            raise KeyError(f"Unknown schema version {encoded[SCHEMA_VERSION]}, latest is {self.version}")
+        sample = dict(encoded)
+        del sample[SCHEMA_VERSION]
+        sensors = encoded.get("sensors")
+        if sensors:
+            sample["sensors"] = {self._names[int(id_)]: value for id_, value in sensors.items()}
+        removed_sensors = encoded.get(REMOVED_SENSORS)
+        if removed_sensors:
+            sample[REMOVED_SENSORS] = [self._names[id_] for id_ in removed_sensors]
+        return sample
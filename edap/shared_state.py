@@ -0,0 +1,279 @@
+import argparse
+import heapq
+import json
+import struct
+import sys
+import time
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from typing import TYPE_CHECKING, Any, Iterator, NamedTuple
+
+if TYPE_CHECKING:
+    from edap.edap import EdapSample, Trigger
+
+DEFAULT_DEVICES = 64
+DEFAULT_SLOTS = 32
+DEFAULT_SAMPLE_SIZE = 2048
+DEFAULT_READ_RETRIES = 1000
+
+_MAGIC = b"EDAPSTT2"
+# magic, devices, trigger slots per device, bytes reserved for the last sample of a device
+_HEADER = struct.Struct("<8sIII")
+# sequence number (odd while the row is being written), time of the write in ns since the epoch,
+# device id, number of used trigger slots, length of the last sample
+_ROW_HEADER = struct.Struct("<Qq64sHH")
+# trigger id, value kind, numeric value (a float64, or an int64 for ints), text value
+_SLOT = struct.Struct("<48sB8s32s")
+_FLOAT64 = struct.Struct("<d")
+_INT64 = struct.Struct("<q")
+_ID_SIZE = 48
+_TEXT_SIZE = 32
+
+# Value kinds of the trigger slots.
+_NO_VALUE = 0
+_NONE = 1
+_BOOL = 2
+_INT = 3
+_FLOAT = 4
+_TEXT = 5
+_TIME = 6
+
+
+class DeviceState(NamedTuple):
+    """Snapshot of the trigger state of a device, as read from a TriggerStateTable."""
+    device_id: str
+    updated: float
+    values: dict[str, Any]
+    """The current value of every trigger that has one, by trigger id."""
+    last_sample: dict | None
+    """The last triggered sample, decoded from JSON, so its time is an ISO 8601 string."""
+
+
+class StateTableError(RuntimeError):
+    """Raised when a consistent snapshot of a row can not be read."""
+
+
+def _encode_text(text: str, size: int) -> bytes:
+    encoded = text.encode("utf-8")
+    if len(encoded) > size:
+        encoded = encoded[:size].decode("utf-8", errors="ignore").encode("utf-8")
+    return encoded
+
+
+def _decode_text(data: bytes) -> str:
+    return data.rstrip(b"\0").decode("utf-8", errors="replace")
+
+
+def _encode_value(trigger: "Trigger") -> tuple[int, bytes, bytes]:
+    if "value" not in trigger:
+        return _NO_VALUE, b"", b""
+    value = trigger["value"]
+    if value is None:
+        return _NONE, b"", b""
+    if isinstance(value, bool):
+        return _BOOL, _INT64.pack(value), b""
+    if isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+        # not as a float, which only holds ints up to 2**53 exactly
+        return _INT, _INT64.pack(value), b""
+    if isinstance(value, float):
+        return _FLOAT, _FLOAT64.pack(value), b""
+    if isinstance(value, datetime):
+        return _TIME, _FLOAT64.pack(value.timestamp()), _encode_text(value.isoformat(), _TEXT_SIZE)
+    return _TEXT, b"", _encode_text(str(value), _TEXT_SIZE)
+
+
+def _decode_value(kind: int, number: bytes, text: bytes) -> Any:
+    if kind == _NONE:
+        return None
+    if kind == _BOOL:
+        return bool(_INT64.unpack(number)[0])
+    if kind == _INT:
+        return _INT64.unpack(number)[0]
+    if kind == _FLOAT:
+        return _FLOAT64.unpack(number)[0]
+    if kind == _TIME:
+        return datetime.fromisoformat(_decode_text(text))
+    return _decode_text(text)
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # processes that only attach must not remove the table when they exit, which the
+    # resource tracker does for every shared memory it knows of before Python 3.13
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    memory = shared_memory.SharedMemory(name)
+    resource_tracker.unregister(memory._name, "shared_memory")  # type: ignore[attr-defined]
+    return memory
+
+
+class TriggerStateTable:
+    """
+    Table of the trigger state of the devices of a process (the trigger values and the last triggered
+    sample) in shared memory, so other local processes, such as monitoring tools, can read it without going
+    through the process that evaluates the triggers. Every device has a fixed size row with `slots` trigger
+    slots, written by a single writer (the device, see EdapDevice.attach_state_table) and read lock-free:
+    every row has a sequence number that is odd while the row is being written, and readers retry until they
+    copied the row while the sequence number was even and unchanged (a seqlock).
+    Ints are stored as int64 and floats as float64, so both are read back exactly (ints beyond 64 bits as text).
+    Trigger ids are truncated to 48 bytes and text values to 32 bytes, triggers beyond the slots of a row and
+    last samples larger than `sample_size` bytes (as JSON) are left out.
+    With `replace`, a table with the same name that was left behind (e.g. by a process that crashed before
+    unlinking it) is removed and created again, instead of raising FileExistsError. The devices of the creating
+    process get a row each with `acquire_row`.
+    """
+    def __init__(self, name: str | None = None, devices: int = DEFAULT_DEVICES, slots: int = DEFAULT_SLOTS,
+                 sample_size: int = DEFAULT_SAMPLE_SIZE, create: bool = True, replace: bool = False) -> None:
+        if create:
+            size = _HEADER.size + devices * (_ROW_HEADER.size + slots * _SLOT.size + sample_size)
+            try:
+                self._memory = shared_memory.SharedMemory(name, create=True, size=size)
+            except FileExistsError:
+                if not replace or name is None:
+                    raise
+                # attached with the resource tracker, which the unlink unregisters from again
+                stale = shared_memory.SharedMemory(name)
+                stale.close()
+                stale.unlink()
+                self._memory = shared_memory.SharedMemory(name, create=True, size=size)
+            _HEADER.pack_into(self._memory.buf, 0, _MAGIC, devices, slots, sample_size)
+        else:
+            if name is None:
+                raise ValueError("The name of the table is needed to attach to it")
+            self._memory = _attach(name)
+            magic, devices, slots, sample_size = _HEADER.unpack_from(self._memory.buf, 0)
+            if magic != _MAGIC:
+                self._memory.close()
+                raise ValueError(f"Shared memory {name} is not a trigger state table")
+        self.devices = devices
+        self.slots = slots
+        self.sample_size = sample_size
+        self._row_size = _ROW_HEADER.size + slots * _SLOT.size + sample_size
+        # the rows that no device of this process writes to
+        self._free_rows = list(range(devices))
+
+    @classmethod
+    def attach(cls, name: str) -> "TriggerStateTable":
+        """Attach to a table created by another process."""
+        return cls(name, create=False)
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    def _offset(self, row: int) -> int:
+        if not 0 <= row < self.devices:
+            raise IndexError(f"Row {row} is not in the table of {self.devices} devices")
+        return _HEADER.size + row * self._row_size
+
+    def acquire_row(self) -> int:
+        """A row that no other device of this process writes to, until it is given back with `release_row`.
+        Raises IndexError when every row is taken."""
+        if not self._free_rows:
+            raise IndexError(f"Every row of the table of {self.devices} devices is taken")
+        return heapq.heappop(self._free_rows)
+
+    def release_row(self, row: int) -> None:
+        """Clear a row acquired with `acquire_row`, so readers no longer see its device, and make it available."""
+        self.clear(row)
+        if row not in self._free_rows:
+            heapq.heappush(self._free_rows, row)
+
+    def clear(self, row: int) -> None:
+        """Remove the state of a device from a row, it is read as never written to."""
+        offset = self._offset(row)
+        buffer = self._memory.buf
+        sequence = struct.unpack_from("<Q", buffer, offset)[0]
+        struct.pack_into("<Q", buffer, offset, sequence + 1)
+        buffer[offset + 8:offset + self._row_size] = bytes(self._row_size - 8)
+        struct.pack_into("<Q", buffer, offset, sequence + 2)
+
+    def write(self, row: int, device_id: str, triggers: list["Trigger"], last_sample: "EdapSample | None") -> None:
+        """Publish the state of a device. Only one writer per row is supported."""
+        offset = self._offset(row)
+        buffer = self._memory.buf
+        sequence = struct.unpack_from("<Q", buffer, offset)[0]
+        sample = json.dumps(last_sample, default=_json_default).encode("utf-8") if last_sample is not None else b""
+        if len(sample) > self.sample_size:
+            sample = b""
+        slots = [trigger for trigger in triggers if "id" in trigger][:self.slots]
+
+        struct.pack_into("<Q", buffer, offset, sequence + 1)
+        _ROW_HEADER.pack_into(buffer, offset, sequence + 1, time.time_ns(),
+                              _encode_text(str(device_id), 64), len(slots), len(sample))
+        slot_offset = offset + _ROW_HEADER.size
+        for trigger in slots:
+            kind, number, text = _encode_value(trigger)
+            _SLOT.pack_into(buffer, slot_offset, _encode_text(str(trigger["id"]), _ID_SIZE), kind, number, text)
+            slot_offset += _SLOT.size
+        sample_offset = offset + _ROW_HEADER.size + self.slots * _SLOT.size
+        buffer[sample_offset:sample_offset + len(sample)] = sample
+        struct.pack_into("<Q", buffer, offset, sequence + 2)
+
+    def read(self, row: int, retries: int = DEFAULT_READ_RETRIES) -> DeviceState | None:
+        """Read a consistent snapshot of a row, or None if nothing was written to it yet (or it was cleared).
+        Raises StateTableError if the row kept changing while being read."""
+        offset = self._offset(row)
+        buffer = self._memory.buf
+        for _ in range(retries):
+            sequence = struct.unpack_from("<Q", buffer, offset)[0]
+            if sequence % 2 == 0:
+                data = bytes(buffer[offset:offset + self._row_size])
+                if struct.unpack_from("<Q", buffer, offset)[0] == sequence:
+                    # a cleared row has no time of the write
+                    return self._decode(data) if sequence and _ROW_HEADER.unpack_from(data, 0)[1] else None
+            # let a writer in the same process finish
+            time.sleep(0)
+        raise StateTableError(f"Row {row} kept changing while reading it")
+
+    def _decode(self, data: bytes) -> DeviceState:
+        _, updated, device_id, count, sample_length = _ROW_HEADER.unpack_from(data, 0)
+        values: dict[str, Any] = {}
+        for slot in range(count):
+            trigger_id, kind, number, text = _SLOT.unpack_from(data, _ROW_HEADER.size + slot * _SLOT.size)
+            if kind != _NO_VALUE:
+                values[_decode_text(trigger_id)] = _decode_value(kind, number, text)
+        sample_offset = _ROW_HEADER.size + self.slots * _SLOT.size
+        last_sample = json.loads(data[sample_offset:sample_offset + sample_length]) if sample_length else None
+        return DeviceState(_decode_text(device_id), updated / 1e9, values, last_sample)
+
+    def states(self) -> Iterator[tuple[int, DeviceState]]:
+        """The rows that were written to, with their state."""
+        for row in range(self.devices):
+            state = self.read(row)
+            if state is not None:
+                yield row, state
+
+    def close(self) -> None:
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """Remove the table, once every process is done with it. Only the creating process should do this."""
+        self._memory.unlink()
+
+    def __enter__(self) -> "TriggerStateTable":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Print the trigger state of every device in a trigger state table, as JSON lines."""
+    parser = argparse.ArgumentParser(prog="python -m edap.shared_state", description=main.__doc__)
+    parser.add_argument("name", help="name of the shared memory of the table")
+    args = parser.parse_args(argv)
+
+    with TriggerStateTable.attach(args.name) as table:
+        for row, state in table.states():
+            json.dump({"row": row, **state._asdict()}, sys.stdout, default=_json_default)
+            sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
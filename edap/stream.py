@@ -0,0 +1,121 @@
+import csv
+from copy import deepcopy
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, Mapping, overload
+
+from edap.edap import EdapDevice, EdapSample, Trigger
+from edap.expr import CompiledExpression, compile_expressions
+
+DEFAULT_BATCH_SIZE = 65536
+_SAMPLE_FIELDS = ("time", "power", "energy")
+
+
+def _parse_value(text: str) -> Any:
+    lowered = text.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def _parse_time(value: Any) -> datetime | None:
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, int | float):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    return datetime.fromisoformat(str(value))
+
+
+def _to_sample(row: Mapping[str, Any], time_column: str) -> EdapSample:
+    sample: Any = {"sensors": {}}
+    for name, value in row.items():
+        if value is None:
+            continue
+        if name == time_column:
+            sample["time"] = _parse_time(value)
+        elif name in _SAMPLE_FIELDS:
+            sample[name] = value
+        else:
+            sample["sensors"][name] = value
+    return sample
+
+
+def read_csv(path: str, time_column: str = "time", **reader_options: Any) -> Iterator[EdapSample]:
+    """
+    Lazily read samples from a CSV file with a header, one row at a time. The time column holds ISO 8601 times
+    or POSIX timestamps, "power" and "energy" become sample properties and every other column becomes a sensor.
+    Values are parsed as booleans, integers or floats where possible, and empty values are left out.
+    """
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        for row in csv.DictReader(csv_file, **reader_options):
+            yield _to_sample({name: _parse_value(value) if value != "" else None
+                              for name, value in row.items()}, time_column)
+
+
+def read_parquet(path: str, time_column: str = "time", batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[EdapSample]:
+    """
+    Lazily read samples from a Parquet file, holding one batch of `batch_size` rows in memory at a time.
+    Columns are mapped to samples like in `read_csv`. Requires pyarrow.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as ex:
+        raise ImportError("Reading Parquet files requires pyarrow, install it with `pip install pyarrow`") from ex
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        columns = batch.to_pydict()
+        names = list(columns)
+        for values in zip(*columns.values()):
+            yield _to_sample(dict(zip(names, values)), time_column)
+
+
+@overload
+def evaluate(samples: Iterable[EdapSample], triggers: list[Trigger]) -> Iterator[EdapSample]: ...
+
+
+@overload
+def evaluate(samples: Iterable[EdapSample], triggers: Mapping[str, list[Trigger]]) -> Iterator[tuple[str, EdapSample]]: ...
+
+
+def evaluate(samples, triggers):
+    """
+    Evaluate triggers over a (lazy) iterable of samples, yielding the triggered samples as they are produced,
+    so memory use does not depend on the number of samples.
+    `triggers` is either a single list of triggers, or a mapping of names to alternative trigger sets. In the
+    latter case every set is evaluated in the same pass over the samples, and (name, triggered sample) pairs
+    are yielded, so configurations can be compared without reading the samples more than once.
+    The triggers are copied first, the given definitions are never updated. Their expressions are compiled once,
+    when `evaluate` is called, so invalid ones raise an ExpressionError right away.
+    """
+    if isinstance(triggers, Mapping):
+        return _evaluate_sets(samples, triggers, {name: compile_expressions(trigger_set)
+                                                  for name, trigger_set in triggers.items()})
+    return _evaluate_set(samples, triggers, compile_expressions(triggers))
+
+
+def _evaluate_set(samples: Iterable[EdapSample], triggers: list[Trigger],
+                  expressions: Mapping[str, CompiledExpression]) -> Iterator[EdapSample]:
+    evaluated = deepcopy(triggers)
+    apply_trigger = EdapDevice.apply_trigger
+    for sample in samples:
+        triggered = apply_trigger(sample, evaluated, expressions)
+        if triggered is not None:
+            yield triggered
+
+
+def _evaluate_sets(samples: Iterable[EdapSample], trigger_sets: Mapping[str, list[Trigger]],
+                   expressions: Mapping[str, Mapping[str, CompiledExpression]]) -> Iterator[tuple[str, EdapSample]]:
+    evaluated = [(name, deepcopy(triggers), expressions[name]) for name, triggers in trigger_sets.items()]
+    apply_trigger = EdapDevice.apply_trigger
+    for sample in samples:
+        for name, triggers, set_expressions in evaluated:
+            triggered = apply_trigger(sample, triggers, set_expressions)
+            if triggered is not None:
+                yield name, triggered
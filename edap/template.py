@@ -0,0 +1,65 @@
+import threading
+from typing import Any, Iterable, Mapping
+
+from edap.compact import STATE_KEYS, CompactTrigger, shared_definition
+from edap.edap import Trigger
+from edap.expr import CompiledExpression, compile_expression
+
+
+def _key(trigger: Mapping[str, Any]) -> tuple[Any, Any]:
+    return trigger.get("id", trigger.get("condition")), trigger.get("property")
+
+
+class TriggerTemplate:
+    """
+    Immutable trigger set shared by reference by any number of devices (see EdapDevice.set_template), which
+    only keep the state of the triggers (their value, and for trajectory triggers their slope and value time)
+    as one CompactTrigger per trigger. Expressions are compiled and the definitions interned once per template,
+    not once per device.
+    `update` replaces the triggers of every device of the template at once: devices pick up the new triggers
+    before evaluating their next sample, keeping the state of the triggers whose id and property did not change.
+    """
+    def __init__(self, triggers: Iterable[Trigger | Mapping[str, Any]] = ()) -> None:
+        self._lock = threading.Lock()
+        self.version = 0
+        self.definitions: tuple[Mapping[str, Any], ...] = ()
+        self.initial_states: tuple[dict[str, Any], ...] = ()
+        self.names: tuple[str, ...] = ()
+        self.expressions: Mapping[str, CompiledExpression] = {}
+        self.update(triggers)
+
+    def update(self, triggers: Iterable[Trigger | Mapping[str, Any]]) -> None:
+        """Replace the triggers of the template, and so of every device of the template.
+        Raises an ExpressionError for invalid expressions, leaving the template as it was."""
+        triggers = list(triggers)
+        definitions = tuple(shared_definition(trigger) for trigger in triggers)
+        # the state a trigger is defined with, e.g. its initial value, is where the state of every device starts
+        initial_states = tuple({key: trigger[key] for key in STATE_KEYS if key in trigger} for trigger in triggers)
+        names: list[str] = []
+        expressions: dict[str, CompiledExpression] = {}
+        for definition in definitions:
+            if definition.get("expr") is not None:
+                expressions[definition["expr"]] = compile_expression(definition["expr"])
+                names.extend(expressions[definition["expr"]].names)
+            if definition.get("property") is not None:
+                names.append(definition["property"])
+            names.extend(definition.get("sensors") or [])
+        with self._lock:
+            # the definitions and their version are replaced together, devices read both at once
+            self.definitions, self.initial_states = definitions, initial_states
+            self.names, self.expressions, self.version = tuple(names), expressions, self.version + 1
+
+    def instantiate(self, previous: Iterable[Trigger] = ()) -> tuple[int, list[Trigger]]:
+        """The triggers of a device of the template, with the state of the previous triggers of the device
+        whose id and property are unchanged, and the version of the template they are for."""
+        with self._lock:
+            version, definitions, initial_states = self.version, self.definitions, self.initial_states
+        states = {_key(trigger): {key: trigger[key] for key in STATE_KEYS if key in trigger} for trigger in previous}
+        triggers: list[Any] = [
+            CompactTrigger.from_definition(definition, states.get(_key(definition), initial_state))
+            for definition, initial_state in zip(definitions, initial_states)
+        ]
+        return version, triggers
+
+    def __len__(self) -> int:
+        return len(self.definitions)
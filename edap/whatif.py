@@ -0,0 +1,192 @@
+from datetime import datetime, timezone
+from typing import Any, Iterable, NamedTuple, Sequence
+
+try:
+    import numpy as np
+except ImportError as ex:
+    raise ImportError("edap.whatif requires numpy, install it with `pip install edap[whatif]`") from ex
+
+from edap.edap import EdapDevice, EdapSample, Trigger
+
+_SWEEPABLE = ("delta", "levels")
+_UNSUPPORTED = ("conditions", "condition", "expr", "tolerance", "in", "greater", "less", "deviation")
+_DEFAULT_TIME_DELTA = 60.0
+
+
+class SweepResult(NamedTuple):
+    """Outcome of a sweep: for every variant its parameters, how often it was activated, and when."""
+    variants: list[Trigger]
+    counts: "np.ndarray"
+    times: list[list[datetime | None]]
+
+    def within_budget(self, max_activations: int) -> list[int]:
+        """Indices of the variants that were activated at most `max_activations` times."""
+        return [int(i) for i in np.flatnonzero(self.counts <= max_activations)]
+
+
+def _variants(trigger: Trigger, parameters: dict[str, Sequence]) -> list[Trigger]:
+    unknown = set(parameters) - set(_SWEEPABLE)
+    if unknown:
+        raise ValueError(f"Only {', '.join(_SWEEPABLE)} can be swept, not {', '.join(sorted(unknown))}")
+    sizes = {len(values) for values in parameters.values() if len(values) != 1}
+    if len(sizes) > 1:
+        raise ValueError("Swept parameters must have the same number of values, or a single one")
+    count = sizes.pop() if sizes else 1
+    variants = []
+    for i in range(count):
+        variant: Any = dict(trigger)
+        for name, values in parameters.items():
+            variant[name] = values[i if len(values) > 1 else 0]
+        variants.append(variant)
+    return variants
+
+
+def _initial_value(trigger: Trigger) -> tuple[float, bool]:
+    """Initial state of a variant as (value, blocked). NaN means no value yet, and blocked variants never
+    activate, like triggers that were given a value they can not compare with."""
+    if "value" not in trigger:
+        return np.nan, False
+    value = trigger["value"]
+    if isinstance(value, float | int):
+        return float(value), False
+    return np.nan, True
+
+
+def _initial_time(trigger: Trigger) -> tuple[float, bool]:
+    """Initial state of a time trigger as (POSIX timestamp, naive), NaN when it has no time yet. Like in
+    apply_trigger, only a time parsed from a string stays naive, and naive times are taken as UTC."""
+    value = trigger.get("value")
+    naive = False
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return np.nan, False
+        naive = value.tzinfo is None
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp(), naive
+    if isinstance(value, int | float):
+        return float(value), False
+    return np.nan, False
+
+
+def _delta(variant: Trigger, is_time: bool) -> float:
+    delta = variant.get("delta")
+    if is_time:
+        # like apply_trigger, a delta that is not a number is the default delta
+        if isinstance(delta, str):
+            try:
+                delta = float(delta)
+            except ValueError:
+                delta = None
+        return float(delta) if delta is not None else _DEFAULT_TIME_DELTA
+    if delta is None:
+        return 0.0
+    # apply_trigger can not compare values with a delta that is not a number, such a trigger only takes a value
+    return float(delta) if isinstance(delta, float | int) else np.inf
+
+
+def sweepable(trigger: Trigger) -> bool:
+    """If a trigger can be swept: it has a property, and none of the keys that sweeps do not support."""
+    return trigger.get("property") is not None and not any(key in trigger for key in _UNSUPPORTED)
+
+
+class Sweep:
+    """
+    The state of K variants of the same trigger, updated one sample at a time with `update`, see `sweep`.
+    """
+    def __init__(self, trigger: Trigger, **parameters: Sequence) -> None:
+        for key in _UNSUPPORTED:
+            if key in trigger:
+                raise ValueError(f"Triggers with {key!r} can not be swept")
+        self.variants = _variants(trigger, parameters)
+        self.property = trigger.get("property")
+        if self.property is None:
+            raise ValueError("Only triggers with a property can be swept")
+        # triggers without an id are never activated
+        self._active = "id" in trigger
+        self._is_time = self.property == "time"
+        k = len(self.variants)
+
+        if self._is_time:
+            initial_value, naive = _initial_time(trigger)
+            blocked = False
+            self._naive = np.full(k, naive)
+        else:
+            initial_value, blocked = _initial_value(trigger)
+        self.values = np.full(k, initial_value)
+        # variants whose value can not be compared with numbers never activate again, like in apply_trigger
+        self._blocked = np.full(k, blocked)
+        self.counts = np.zeros(k, dtype=np.int64)
+        self.times: list[list[datetime | None]] = [[] for _ in range(k)]
+
+        self._has_delta = np.array(["delta" in variant for variant in self.variants])
+        self._deltas = np.array([_delta(variant, self._is_time) for variant in self.variants])
+        self._has_levels = np.array(["levels" in variant for variant in self.variants])
+        width = max((len(variant.get("levels") or []) for variant in self.variants), default=0)
+        self._levels = np.full((k, max(width, 1)), np.nan)
+        for i, variant in enumerate(self.variants):
+            variant_levels = variant.get("levels") or []
+            self._levels[i, :len(variant_levels)] = variant_levels
+
+    def update(self, sample: EdapSample) -> "np.ndarray":
+        """Evaluate a sample for every variant, returning which of them were activated by it."""
+        fired = np.zeros(len(self.variants), dtype=bool)
+        if not self._active:
+            return fired
+        values = self.values
+        if self._is_time:
+            sample_time = sample.get("time")
+            if not isinstance(sample_time, datetime):
+                return fired
+            naive = sample_time.tzinfo is None
+            x = (sample_time.replace(tzinfo=timezone.utc) if naive else sample_time).timestamp()
+            # a naive time can not be compared with an aware one, which activates the trigger in apply_trigger
+            fired = np.isnan(values) | (self._naive != naive) | (x - values >= self._deltas)
+            self._naive = np.where(fired, False, self._naive)
+        else:
+            sample_value = EdapDevice._get_sample_value(sample, self.property)
+            x = sample_value.value
+            if not sample_value.exists or x is None:
+                return fired
+            no_value = np.isnan(values) & ~self._blocked
+            if not isinstance(x, float | int):
+                # a delta trigger without a value takes any value, after which it is stuck on it
+                fired = self._has_delta & no_value
+                self._blocked |= fired
+                x = np.nan
+            else:
+                x = float(x)
+                levels = self._levels
+                with np.errstate(invalid="ignore"):
+                    delta_fired = self._has_delta & (no_value | np.where(
+                        self._deltas == 0, x != values, np.abs(x - values) > self._deltas))
+                    crossed = (((values[:, None] > levels) & (levels > x))
+                               | ((values[:, None] < levels) & (levels < x))).any(axis=1)
+                on_level = (levels == x).any(axis=1)
+                level_fired = self._has_levels & np.where(no_value, ~on_level, crossed)
+                fired = (delta_fired | level_fired) & ~self._blocked
+
+        if fired.any():
+            self.values = np.where(fired, x, values)
+            self.counts += fired
+            for i in np.flatnonzero(fired):
+                self.times[i].append(sample.get("time"))
+        return fired
+
+    def result(self) -> SweepResult:
+        return SweepResult(self.variants, self.counts, self.times)
+
+
+def sweep(samples: Iterable[EdapSample], trigger: Trigger, **parameters: Sequence) -> SweepResult:
+    """
+    Evaluate K variants of the same trigger in a single pass over the samples, e.g.
+    `sweep(samples, {"id": "power", "property": "power"}, delta=[0.5, 1, 2, 5])` or a sweep of `levels` grids.
+    Parameters with a single value apply to every variant. The K trigger values are kept as a NumPy vector,
+    so the cost per sample barely depends on K. Supports delta and level triggers on numeric properties and
+    time triggers (by sweeping "delta"), with the same activation rules as EdapDevice.apply_trigger.
+    """
+    state = Sweep(trigger, **parameters)
+    for sample in samples:
+        state.update(sample)
+    return state.result()
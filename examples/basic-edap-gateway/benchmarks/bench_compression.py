@@ -0,0 +1,166 @@
+"""Compression benchmark of the uplink.
+
+Generates realistic triggered-sample traffic, dummy batteries with a random walk of their power evaluated
+with the triggers of the stand-in proxy, encodes it as the gateway would (optionally delta and schema
+encoded), and compresses it with every uplink compression setting: none, permessage-deflate with several
+window bits, levels and with or without context takeover (using the same extension as websockets), and
+zstd with and without a dictionary trained on other samples. For every setting it reports the bytes per
+message, and the bytes per second and CPU seconds per second at the given message rate.
+The dictionary for `UPLINK_ZSTD_DICTIONARY` is trained with `--train dictionary.zstd`.
+
+Run it from the gateway directory with `python -m benchmarks.bench_compression --help`.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Iterator, Optional
+
+from edap import EdapDevice
+from edap.codec import DeltaEncoder
+from edap.schema import SampleSchema
+
+from benchmarks.stand_in_proxy import DEFAULT_TRIGGERS
+from src.utils import json_serialize
+
+DEFAULT_DEVICES = 20
+DEFAULT_SAMPLES = 3600
+DEFAULT_RATE = 100.0
+DEFAULT_DICTIONARY_SIZE = 16384
+
+Compress = Callable[[str], bytes | str]
+
+
+def triggered_samples(devices: int, samples: int, seed: int) -> Iterator[dict]:
+    """Triggered samples of dummy batteries polled every second, in the order they would be sent."""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for device in range(devices):
+        triggers = json.loads(json.dumps(DEFAULT_TRIGGERS))
+        power, soc, energy = rng.uniform(-50, 50), rng.random(), 0.0
+        for second in range(samples):
+            power = max(-100.0, min(100.0, power + rng.gauss(0, 3)))
+            soc = max(0.0, min(1.0, soc + power / 3600 / 100))
+            energy += power / 3600
+            sample = {
+                "time": start + timedelta(seconds=second, milliseconds=rng.randrange(1000)),
+                "power": round(power, 3),
+                "energy": round(energy, 4),
+                "sensors": {"soc": round(soc, 4), "remaining_energy": round(soc * 100, 3),
+                            "temperature": round(25 + 5 * math.sin(second / 600) + rng.gauss(0, 0.2), 2),
+                            "device": device},
+            }
+            triggered = EdapDevice.apply_trigger(sample, triggers)
+            if triggered is not None:
+                yield triggered
+
+
+def encoded_messages(samples: Iterator[dict], delta: bool, schema: bool) -> list[str]:
+    """The JSON messages the gateway sends for the samples."""
+    encoder = DeltaEncoder() if delta else None
+    sample_schema = SampleSchema() if schema else None
+    messages = []
+    for sample in samples:
+        data: Any = sample
+        if encoder is not None:
+            data = encoder.encode(data)
+        if sample_schema is not None:
+            data = sample_schema.encode(data)
+        messages.append(json.dumps(data, default=json_serialize))
+    return messages
+
+
+def deflate(window_bits: int, level: int, context_takeover: bool) -> Compress:
+    """permessage-deflate as negotiated by the gateway, compressing like websockets does."""
+    from websockets.extensions.permessage_deflate import PerMessageDeflate
+    from websockets.frames import Frame, Opcode
+    extension = PerMessageDeflate(
+        remote_no_context_takeover=False,
+        local_no_context_takeover=not context_takeover,
+        remote_max_window_bits=15,
+        local_max_window_bits=window_bits,
+        compress_settings={"level": level, "memLevel": 5},
+    )
+    return lambda message: extension.encode(Frame(Opcode.TEXT, message.encode('utf-8'))).data
+
+
+def zstd(level: int, dictionary: Any = None) -> Compress:
+    """zstd compression of every message, as with UPLINK_COMPRESSION=zstd."""
+    import zstandard
+    compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+    return lambda message: compressor.compress(message.encode('utf-8'))
+
+
+def train_dictionary(messages: list[str], size: int) -> Any:
+    """Train a zstd dictionary on messages."""
+    import zstandard
+    return zstandard.train_dictionary(size, [message.encode('utf-8') for message in messages])
+
+
+def measure(compress: Compress, messages: list[str], rate: float) -> dict:
+    """Bytes per message, and bytes and CPU seconds per second at the message rate."""
+    started = time.process_time()
+    compressed = sum(len(compress(message)) for message in messages)
+    cpu = time.process_time() - started
+    uncompressed = sum(len(message.encode('utf-8')) for message in messages)
+    return {
+        "bytes_per_message": round(compressed / len(messages), 1),
+        "ratio": round(uncompressed / compressed, 2),
+        "bytes_per_s": round(compressed / len(messages) * rate),
+        "cpu_s_per_s": round(cpu / len(messages) * rate, 6),
+        "cpu_us_per_message": round(cpu / len(messages) * 1e6, 2),
+    }
+
+
+def settings(training: list[str], dictionary_size: int) -> Iterator[tuple[str, Callable[[], Compress]]]:
+    """The compression settings to compare, with a factory for their compressor."""
+    yield "none", lambda: (lambda message: message.encode('utf-8'))
+    for window_bits in (9, 12, 15):
+        for level in (1, 6):
+            for context_takeover in (True, False):
+                name = f"deflate window_bits={window_bits} level={level}" + (
+                    "" if context_takeover else " no_context_takeover")
+                yield name, lambda w=window_bits, l=level, c=context_takeover: deflate(w, l, c)
+    try:
+        import zstandard  # noqa: F401  pylint: disable=unused-import,import-outside-toplevel
+    except ImportError:
+        print("zstandard is not installed, skipping zstd", file=sys.stderr)
+        return
+    dictionary = train_dictionary(training, dictionary_size)
+    for level in (1, 3, 9):
+        yield f"zstd level={level}", lambda l=level: zstd(l)
+        yield f"zstd level={level} dictionary", lambda l=level: zstd(l, dictionary)
+
+
+def main(argv: Optional[list[str]] = None):
+    """Parses the arguments and runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=DEFAULT_DEVICES)
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='samples per device')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help='triggered samples per second sent by the gateway')
+    parser.add_argument('--delta', action='store_true', help='delta encode the samples first')
+    parser.add_argument('--schema', action='store_true', help='schema encode the samples first')
+    parser.add_argument('--dictionary-size', type=int, default=DEFAULT_DICTIONARY_SIZE)
+    parser.add_argument('--train', metavar='PATH',
+                        help='only train a zstd dictionary and write it to PATH, for UPLINK_ZSTD_DICTIONARY')
+    args = parser.parse_args(argv)
+
+    # the dictionary is trained on other devices than it is measured on
+    training = encoded_messages(triggered_samples(args.devices, args.samples, seed=1), args.delta, args.schema)
+    if args.train:
+        with open(args.train, 'wb') as dictionary_file:
+            dictionary_file.write(train_dictionary(training, args.dictionary_size).as_bytes())
+        return
+
+    messages = encoded_messages(triggered_samples(args.devices, args.samples, seed=2), args.delta, args.schema)
+    results = {name: measure(factory(), messages, args.rate)
+               for name, factory in settings(training, args.dictionary_size)}
+    print(json.dumps({"messages": len(messages), "rate": args.rate, "settings": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Startup import time benchmark of the gateway.
+
+Imports what the gateway imports before it starts (`main`, the log formatter, the mediator and the configured device driver)
+in a fresh interpreter with `python -X importtime`, reports the modules that take the most time, and
+checks the total against a budget, exiting with a non-zero status when it is exceeded.
+The best of a few runs is reported, as the first run also pays for compiling and caching the bytecode.
+
+Run it from the gateway directory with `python -m benchmarks.bench_startup --help`.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Optional
+
+DEFAULT_BUDGET_MS = 150.0
+DEFAULT_RUNS = 5
+DEFAULT_TOP = 15
+
+STARTUP_IMPORTS = (
+    "import main\n"
+    "import os\n"
+    "from src.Mediator import Mediator\n"
+    "from src.drivers import DEFAULT_DRIVER, load_driver\n"
+    "load_driver(os.environ.get('DEVICE_DRIVER', DEFAULT_DRIVER))\n"
+    "if os.environ.get('LOG_FORMAT', main.DEFAULT_LOG_FORMAT).lower() != 'text':\n"
+    "    import src.CustomJsonFormatter\n"
+)
+
+
+def measure_imports() -> dict[str, tuple[int, int]]:
+    """Self and cumulative import time in microseconds of every module imported at startup."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_IMPORTS],
+                            capture_output=True, text=True, check=True, env=os.environ.copy())
+    modules: dict[str, tuple[int, int]] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # nested imports are indented below the module importing them
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def main(argv: Optional[list[str]] = None):
+    """Parses the arguments and runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help='maximum total import time in milliseconds')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS)
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='number of slowest modules to report')
+    args = parser.parse_args(argv)
+
+    best: Optional[dict[str, tuple[int, int]]] = None
+    best_total = float('inf')
+    for _ in range(args.runs):
+        modules = measure_imports()
+        total = sum(self_us for self_us, _ in modules.values()) / 1000
+        if total < best_total:
+            best, best_total = modules, total
+
+    slowest = sorted(best.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    print(json.dumps({
+        "total_ms": round(best_total, 1),
+        "budget_ms": args.budget_ms,
+        "modules": len(best),
+        "slowest_cumulative_ms": {name: round(cumulative_us / 1000, 1) for name, (_, cumulative_us) in slowest},
+        "websockets_imported": any(name.startswith("websockets") for name in best),
+        "pythonjsonlogger_imported": any(name.startswith("pythonjsonlogger") for name in best),
+    }, indent=2))
+    if best_total > args.budget_ms:
+        print(f"Startup imports take {best_total:.1f} ms, over the budget of {args.budget_ms:.1f} ms",
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""End-to-end load generator for the gateway.
+
+Spins up N gateway mediators in a single process, each with a `DummyDeviceConnection` producing random
+data (`RANDOM_DUMMY_DATA`) and a `DummyEdapBattery`, all polled by one shared `PollingScheduler`, and
+connects them to a (stand-in) proxy. Reports the gateway side throughput; latencies are recorded by
+the stand-in proxy, see `benchmarks.stand_in_proxy`.
+
+Run it from the gateway directory with `python -m benchmarks.load_generator --help`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+from contextlib import suppress
+from datetime import timedelta
+from typing import Any, Optional
+
+from src.Fleet import Fleet
+from src.Mediator import EventType, Mediator
+from src.PollingScheduler import PollingScheduler
+
+logger = logging.getLogger("load_generator")
+
+
+class CountingMediator(Mediator):
+    """Mediator that counts the events passing through it."""
+    events: Counter
+
+    def __init__(self, event_loop: asyncio.AbstractEventLoop, events: Counter, **kwargs):
+        super().__init__(event_loop, **kwargs)
+        self.events = events
+
+    def notify(self, event: EventType, data: Any = None):
+        self.events[event] += 1
+        super().notify(event, data)
+
+
+def summary(events: Counter, polling_scheduler: PollingScheduler, devices: int, elapsed: float) -> dict:
+    """Gateway side throughput statistics."""
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "devices": devices,
+        "samples_per_s": round(events["sample_received"] / elapsed, 3),
+        "triggered_samples_per_s": round(events["trigger_activated"] / elapsed, 3),
+        "commands_per_s": round(events["command_received"] / elapsed, 3),
+        "polling": polling_scheduler.metrics(),
+    }
+
+
+async def run(devices: int, duration: float, report_interval: float):
+    """Run the mediators for the given duration, reporting statistics periodically."""
+    event_loop = asyncio.get_running_loop()
+    polling_scheduler = PollingScheduler(event_loop)
+    # metrics are reset when logged, so let the load generator report them instead
+    polling_scheduler.metrics_interval = timedelta(seconds=duration + report_interval)
+    events: Counter = Counter()
+    # a single fleet, so fan-out commands received by any of the devices address all of them
+    fleet = Fleet()
+    # and a single trigger state table, with a row per device
+    trigger_state_table = None
+    trigger_state_table_name = os.environ.get('TRIGGER_STATE_TABLE')
+    if trigger_state_table_name:
+        from edap.shared_state import TriggerStateTable
+        trigger_state_table = TriggerStateTable(trigger_state_table_name, devices=devices, replace=True)
+    mediators = [CountingMediator(event_loop, events, device_id=str(uuid.uuid4()),
+                                  polling_scheduler=polling_scheduler, fleet=fleet,
+                                  trigger_state_table=trigger_state_table)
+                 for _ in range(devices)]
+    started = time.monotonic()
+    await asyncio.gather(*(mediator.start() for mediator in mediators))
+
+    deadline = started + duration
+    try:
+        while time.monotonic() < deadline:
+            await asyncio.sleep(max(min(report_interval, deadline - time.monotonic()), 0))
+            logger.info(json.dumps(summary(events, polling_scheduler, devices, time.monotonic() - started)))
+    finally:
+        print(json.dumps(summary(events, polling_scheduler, devices, time.monotonic() - started), indent=2))
+        for mediator in mediators:
+            await mediator.stop()
+        await polling_scheduler.stop()
+        if trigger_state_table is not None:
+            trigger_state_table.close()
+            trigger_state_table.unlink()
+
+
+def main(argv: Optional[list[str]] = None):
+    """Parses the arguments and runs the load generator."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--proxy-url', default='ws://127.0.0.1:8000/ws/edap/',
+                        help='base url of the (stand-in) proxy, the device id is appended to it')
+    parser.add_argument('--polling-interval', type=int, default=1, help='seconds')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds')
+    parser.add_argument('--report-interval', type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    os.environ['COMMANDER_PROXY_BASE_URL'] = args.proxy_url
+    os.environ['DEVICE_POLLING_INTERVAL'] = str(args.polling_interval)
+    os.environ['RANDOM_DUMMY_DATA'] = 'true'
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    with suppress(KeyboardInterrupt):
+        asyncio.run(run(args.devices, args.duration, args.report_interval))
+
+
+if __name__ == '__main__':
+    main()
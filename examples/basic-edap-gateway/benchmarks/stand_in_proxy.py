@@ -0,0 +1,304 @@
+"""Local stand-in for the Emulate Commander proxy, for load testing gateways.
+
+Accepts gateway connections on `ws://<host>:<port>/ws/edap/<device id>`, issues `set`, `set_triggers`
+and `ping` commands to every connected device at configurable rates, and records:
+- the latency from the `time` of every triggered sample until it is received by the proxy,
+- the round trip time of every command, and the durations reported in the command responses,
+- the resumed sessions, and the commands resent to gateways that reconnected before responding to them,
+- the commands that were not answered within the command timeout.
+
+Run it from the gateway directory with `python -m benchmarks.stand_in_proxy --help`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from itertools import count
+from random import random
+from contextlib import suppress
+from datetime import datetime, timezone
+from typing import Optional
+
+import websockets.server as ws_server
+import websockets.exceptions as ws_exceptions
+from edap.codec import DeltaDecoder
+from edap.schema import SCHEMA_VERSION, SampleSchema
+
+from benchmarks.stats import LatencyRecorder
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+# durations reported by the gateway in the command responses
+COMMAND_STAGES = ("duration", "queue_duration", "execute_duration", "send_duration")
+# COMMAND_TIMEOUT of the gateway
+DEFAULT_COMMAND_TIMEOUT = 10.0
+
+DEFAULT_TRIGGERS = [
+    {"id": "time", "property": "time", "delta": 10},
+    {"id": "power", "property": "power", "delta": 5},
+    {"id": "soc", "property": "soc", "levels": [0.2, 0.5, 0.8], "sensors": ["soc"]},
+]
+
+
+class StandInProxy:
+    """Stand-in proxy that issues commands to connected gateways and records latencies."""
+
+    def __init__(self, command_rates: dict[str, float], triggers: list[dict], acknowledge: bool = False,
+                 acknowledge_schema: bool = False,
+                 command_ids: bool = False, zstd_dictionary: Optional[str] = None,
+                 command_timeout: float = DEFAULT_COMMAND_TIMEOUT):
+        self.command_rates = command_rates
+        self.command_timeout = command_timeout
+        self.triggers = triggers
+        self.acknowledge = acknowledge
+        self.acknowledge_schema = acknowledge_schema
+        self.command_ids = command_ids
+        self.connections = 0
+        self.connects = 0
+        self.resumes = 0
+        self.commands_resent = 0
+        self.samples = 0
+        self.messages = 0
+        self.bytes_received = 0
+        self.sample_latency = LatencyRecorder()
+        self.command_round_trip: dict[str, LatencyRecorder] = {
+            name: LatencyRecorder() for name in command_rates}
+        self.command_stages: dict[str, dict[str, LatencyRecorder]] = {
+            name: {stage: LatencyRecorder() for stage in COMMAND_STAGES} for name in command_rates}
+        self.command_errors = 0
+        self.commands_unanswered = 0
+        self.decode_errors = 0
+        # when the commands waiting for a response were sent, by device, command and time, oldest first
+        self._pending: dict[tuple[str, str, str], float] = {}
+        # per device, the session of the gateway and the commands with an id it has not responded to
+        self._sessions: dict[str, str] = {}
+        self._unacknowledged: dict[str, OrderedDict[int, str]] = {}
+        self._command_ids = count(1)
+        # binary messages are zstd compressed JSON, see UPLINK_COMPRESSION=zstd
+        self._decompressor = None
+        with suppress(ImportError):
+            import zstandard
+            from src.UplinkCompression import UplinkCompression
+            self._decompressor = zstandard.ZstdDecompressor(
+                dict_data=UplinkCompression.zstd_dictionary(zstd_dictionary))
+        self._started = time.monotonic()
+
+    def command_data(self, command_name: str):
+        """Data sent along with a command of the given kind."""
+        match command_name:
+            case "set":
+                return {"power": round(random() * 100, 3)}
+            case "set_triggers":
+                return self.triggers
+            case _:
+                return {}
+
+    async def _send_command(self, websocket, command: dict):
+        if self.command_ids:
+            command["id"] = next(self._command_ids)
+            message = json.dumps(command)
+            self._unacknowledged.setdefault(websocket.path, OrderedDict())[command["id"]] = message
+        else:
+            message = json.dumps(command)
+        await websocket.send(message)
+
+    async def _issue_commands(self, websocket, command_name: str, rate: float):
+        interval = 1 / rate
+        # random phase, so the commands to the different devices are spread out
+        await asyncio.sleep(random() * interval)
+        while True:
+            command_time = datetime.now(tz=timezone.utc).strftime(TIME_FORMAT)
+            self._prune_pending()
+            self._pending[(websocket.path, command_name, command_time)] = time.monotonic()
+            await self._send_command(websocket, {command_name: self.command_data(command_name),
+                                                 "time": command_time})
+            await asyncio.sleep(interval)
+
+    def _prune_pending(self):
+        """Drop the commands that were not answered within the command timeout, counting them."""
+        expired = time.monotonic() - self.command_timeout
+        while self._pending:
+            key, sent_at = next(iter(self._pending.items()))
+            if sent_at > expired:
+                break
+            del self._pending[key]
+            self.commands_unanswered += 1
+
+    async def _resume(self, websocket, resume: dict):
+        """Answers the resume message of a gateway, resending the commands it did not respond to
+        when it resumes the same session, i.e. the gateway reconnected rather than restarted."""
+        device = websocket.path
+        unacknowledged = self._unacknowledged.setdefault(device, OrderedDict())
+        resent = 0
+        if self._sessions.get(device) == resume.get("session"):
+            self.resumes += 1
+            for message in list(unacknowledged.values()):
+                await websocket.send(message)
+                resent += 1
+            self.commands_resent += resent
+        else:
+            unacknowledged.clear()
+        self._sessions[device] = resume.get("session")
+        await websocket.send(json.dumps({"resumed": {"session": resume.get("session"), "resent": resent}}))
+
+    def _decompress(self, message: str | bytes) -> str | bytes:
+        if isinstance(message, bytes) and self._decompressor is not None:
+            return self._decompressor.decompress(message)
+        return message
+
+    def _receive(self, device: str, message: str | bytes, decoder: DeltaDecoder,
+                 schema: SampleSchema) -> Optional[dict]:
+        """Records a message from a gateway, returning the acknowledgement to answer it with, if any."""
+        received_at = time.monotonic()
+        self.messages += 1
+        self.bytes_received += len(message)
+        payload = json.loads(self._decompress(message))
+        if isinstance(payload.get(SCHEMA_VERSION), dict):
+            schema.update(payload[SCHEMA_VERSION])
+            return {"schema_ack": schema.version} if self.acknowledge_schema else None
+        if SCHEMA_VERSION in payload:
+            try:
+                payload = schema.decode(payload)
+            except KeyError:
+                self.decode_errors += 1
+                return None
+        sequence = None
+        if DeltaDecoder.is_frame(payload):
+            sequence = payload["seq"]
+            try:
+                payload = decoder.decode(payload)
+            except KeyError:
+                self.decode_errors += 1
+                return None
+        if "command" in payload:
+            if payload.get("id") is not None:
+                self._unacknowledged.get(device, {}).pop(payload["id"], None)
+            command_name = payload["command"]
+            sent_at = self._pending.pop((device, command_name, payload.get("time")), None)
+            if sent_at is not None and command_name in self.command_round_trip:
+                self.command_round_trip[command_name].add((received_at - sent_at) * 1000)
+                for stage, recorder in self.command_stages[command_name].items():
+                    if stage in payload:
+                        recorder.add(payload[stage])
+            if payload.get("result", {}).get("result") == "error":
+                self.command_errors += 1
+        elif "triggers" in payload and payload.get("time"):
+            self.samples += 1
+            sample_time = datetime.fromisoformat(payload["time"])
+            latency = datetime.now(tz=timezone.utc) - sample_time
+            self.sample_latency.add(latency.total_seconds() * 1000)
+        return {"ack": sequence} if sequence is not None and self.acknowledge else None
+
+    async def handle(self, websocket):
+        """Handles a single gateway connection."""
+        self.connections += 1
+        self.connects += 1
+        command_tasks: list[asyncio.Task] = []
+        decoder = DeltaDecoder()
+        schema = SampleSchema()
+        try:
+            # gateways start every connection with a resume message
+            first = json.loads(self._decompress(await websocket.recv()))
+            if "resume" in first:
+                await self._resume(websocket, first["resume"])
+            # commands are issued to a device once its triggers are set, so the first one always goes out first
+            command_time = datetime.now(tz=timezone.utc).strftime(TIME_FORMAT)
+            await self._send_command(websocket, {"set_triggers": self.triggers, "time": command_time})
+            command_tasks = [asyncio.create_task(self._issue_commands(websocket, name, rate))
+                             for name, rate in self.command_rates.items() if rate > 0]
+            if "resume" not in first:
+                self._receive(websocket.path, json.dumps(first), decoder, schema)
+            async for message in websocket:
+                acknowledgement = self._receive(websocket.path, message, decoder, schema)
+                if acknowledgement is not None:
+                    await websocket.send(json.dumps(acknowledgement))
+        except ws_exceptions.ConnectionClosed:
+            ...
+        finally:
+            self.connections -= 1
+            for task in command_tasks:
+                task.cancel()
+                with suppress(asyncio.CancelledError, ws_exceptions.ConnectionClosed):
+                    await task
+
+    def summary(self) -> dict:
+        """Throughput and latency statistics since the proxy was started."""
+        elapsed = time.monotonic() - self._started
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "connections": self.connections,
+            "connects": self.connects,
+            "resumes": self.resumes,
+            "commands_resent": self.commands_resent,
+            "messages_per_s": round(self.messages / elapsed, 3),
+            "samples_per_s": round(self.samples / elapsed, 3),
+            "bytes_per_s": round(self.bytes_received / elapsed, 3),
+            "sample_to_proxy_latency": self.sample_latency.summary(),
+            "command_round_trip": {name: recorder.summary()
+                                   for name, recorder in self.command_round_trip.items()},
+            "command_stages": {name: {stage: recorder.summary() for stage, recorder in stages.items()}
+                               for name, stages in self.command_stages.items()},
+            "command_errors": self.command_errors,
+            "commands_unanswered": self.commands_unanswered,
+            "decode_errors": self.decode_errors,
+        }
+
+
+async def run(host: str, port: int, proxy: StandInProxy, duration: Optional[float], report_interval: float):
+    """Serve the stand-in proxy, reporting statistics periodically, and finally once more."""
+    async with ws_server.serve(proxy.handle, host, port, max_size=None):
+        logging.info("Stand-in proxy listening on ws://%s:%s/ws/edap/", host, port)
+        deadline = None if duration is None else time.monotonic() + duration
+        while deadline is None or time.monotonic() < deadline:
+            sleep = report_interval if deadline is None else min(report_interval, deadline - time.monotonic())
+            await asyncio.sleep(max(sleep, 0))
+            logging.info(json.dumps(proxy.summary()))
+    print(json.dumps(proxy.summary(), indent=2))
+
+
+def main(argv: Optional[list[str]] = None):
+    """Parses the arguments and runs the stand-in proxy."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--set-rate', type=float, default=0.1,
+                        help='set commands per second per device')
+    parser.add_argument('--set-triggers-rate', type=float, default=0.0,
+                        help='set_triggers commands per second per device')
+    parser.add_argument('--ping-rate', type=float, default=1.0,
+                        help='ping commands per second per device')
+    parser.add_argument('--triggers', help='JSON file with the triggers to set on the devices')
+    parser.add_argument('--ack', action='store_true',
+                        help='acknowledge delta encoded samples (for UPLINK_DELTA_ACKNOWLEDGED=true)')
+    parser.add_argument('--schema-ack', action='store_true',
+                        help='acknowledge schema updates (for UPLINK_SCHEMA_ACKNOWLEDGED=true)')
+    parser.add_argument('--zstd-dictionary',
+                        help='dictionary of zstd compressed uplink messages (for UPLINK_ZSTD_DICTIONARY)')
+    parser.add_argument('--command-ids', action='store_true',
+                        help='give commands an id, and resend the unanswered ones when a gateway resumes')
+    parser.add_argument('--command-timeout', type=float, default=DEFAULT_COMMAND_TIMEOUT,
+                        help='seconds after which a command without a response is counted as unanswered')
+    parser.add_argument('--duration', type=float, help='seconds to run for, forever if not given')
+    parser.add_argument('--report-interval', type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    triggers = DEFAULT_TRIGGERS
+    if args.triggers:
+        with open(args.triggers, encoding='utf-8') as triggers_file:
+            triggers = json.load(triggers_file)
+
+    proxy = StandInProxy({"set": args.set_rate,
+                          "set_triggers": args.set_triggers_rate,
+                          "ping": args.ping_rate}, triggers, acknowledge=args.ack,
+                         acknowledge_schema=args.schema_ack,
+                         command_ids=args.command_ids, zstd_dictionary=args.zstd_dictionary,
+                         command_timeout=args.command_timeout)
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+    with suppress(KeyboardInterrupt):
+        asyncio.run(run(args.host, args.port, proxy, args.duration, args.report_interval))
+
+
+if __name__ == '__main__':
+    main()
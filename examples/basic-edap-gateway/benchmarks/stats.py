@@ -0,0 +1,31 @@
+"""Small helpers for summarizing benchmark measurements."""
+from statistics import quantiles
+
+
+class LatencyRecorder:
+    """Collects latency measurements (in milliseconds) and summarizes them as percentiles."""
+    values: list[float]
+
+    def __init__(self):
+        self.values = []
+
+    def add(self, value_ms: float):
+        """Record a single measurement."""
+        self.values.append(value_ms)
+
+    def summary(self) -> dict:
+        """Count and p50/p90/p99/max of the recorded measurements."""
+        if not self.values:
+            return {"count": 0}
+        if len(self.values) == 1:
+            p50 = p90 = p99 = self.values[0]
+        else:
+            percentiles = quantiles(self.values, n=100, method='inclusive')
+            p50, p90, p99 = percentiles[49], percentiles[89], percentiles[98]
+        return {
+            "count": len(self.values),
+            "p50_ms": round(p50, 3),
+            "p90_ms": round(p90, 3),
+            "p99_ms": round(p99, 3),
+            "max_ms": round(max(self.values), 3),
+        }
@@ -0,0 +1 @@
+# the gateway tests import its modules as `src.*`, like main.py and the benchmarks, from this directory
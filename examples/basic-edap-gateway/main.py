@@ -1,34 +1,87 @@
 """Entrypoint of the application."""
 import asyncio
 import logging
+import queue
 import sys
 import os
-from src.utils import CustomJsonFormatter
-from src.Mediator import Mediator
+from typing import Optional
+from logging.handlers import QueueListener
+from edap import RateLimitFilter
+from src.utils import DeferredQueueHandler
+
+DEFAULT_LOG_RATE_LIMIT_INTERVAL = 60
+DEFAULT_LOG_FORMAT = 'json'
+
+def device_ids() -> list[Optional[str]]:
+    """The ids of the devices of the process: the comma separated DEVICE_IDS, or the single DEVICE_ID."""
+    ids = [device_id.strip() for device_id in os.environ.get('DEVICE_IDS', '').split(',') if device_id.strip()]
+    if len(ids) > 1 and '{device_id}' not in os.environ.get('SAMPLE_RECORDING_PATH', '{device_id}'):
+        raise ValueError("SAMPLE_RECORDING_PATH needs a {device_id} placeholder when recording several devices")
+    return ids or [os.environ.get('DEVICE_ID')]
 
 def main(event_loop: asyncio.AbstractEventLoop):
-    """Runs the gateway application."""
-    mediator = Mediator(event_loop)
+    """Runs the gateway application, with a mediator for every device of the process."""
+    # imported here, so logging is set up before the device driver and its dependencies are imported
+    from src.Fleet import Fleet
+    from src.Mediator import Mediator
+    from src.PollingScheduler import PollingScheduler
+    ids = device_ids()
+    # the mediators share the fleet, so fan-out commands can address all of them, the polling scheduler,
+    # and the trigger state table, with a row per device
+    fleet = Fleet()
+    polling_scheduler = PollingScheduler(event_loop)
+    trigger_state_table = None
+    if os.environ.get('TRIGGER_STATE_TABLE'):
+        from edap.shared_state import TriggerStateTable
+        trigger_state_table = TriggerStateTable(os.environ['TRIGGER_STATE_TABLE'], devices=len(ids), replace=True)
+    mediators = [Mediator(event_loop, device_id=device_id, polling_scheduler=polling_scheduler, fleet=fleet,
+                          trigger_state_table=trigger_state_table)
+                 for device_id in ids]
     try:
-        mediator.start()
+        event_loop.run_until_complete(asyncio.gather(*(mediator.start() for mediator in mediators)))
         event_loop.run_forever()
     except KeyboardInterrupt:
         ...
     finally:
-        event_loop.run_until_complete(mediator.stop())
+        for mediator in mediators:
+            event_loop.run_until_complete(mediator.stop())
+        event_loop.run_until_complete(polling_scheduler.stop())
+        if trigger_state_table is not None:
+            trigger_state_table.close()
+            trigger_state_table.unlink()
 
-def setup_logging():
-    """Sets up the logging configuration."""
+def setup_logging() -> QueueListener:
+    """Sets up the logging configuration. Records are only put on a queue by the logging calls,
+    formatting and writing them happens on the thread of the returned listener.
+    Repeated warnings and errors are rate limited. Records are formatted as JSON, unless
+    LOG_FORMAT is set to text, in which case python-json-logger is not imported at all."""
     logging.basicConfig(stream=sys.stdout, level=os.environ.get('LOG_LEVEL', 'INFO').upper())
     logger = logging.getLogger()
     logger.handlers.clear()
     log_handler = logging.StreamHandler()
-    formatter = CustomJsonFormatter(service_name='edap-gateway')
+    if os.environ.get('LOG_FORMAT', DEFAULT_LOG_FORMAT).lower() == 'text':
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s')
+    else:
+        from src.CustomJsonFormatter import CustomJsonFormatter
+        formatter = CustomJsonFormatter(service_name='edap-gateway')
     log_handler.setFormatter(formatter)
-    logger.addHandler(log_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    rate_limit_interval = float(os.environ.get('LOG_RATE_LIMIT_INTERVAL', DEFAULT_LOG_RATE_LIMIT_INTERVAL))
+    if rate_limit_interval > 0:
+        queue_handler.addFilter(RateLimitFilter(interval=rate_limit_interval))
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, log_handler, respect_handler_level=True)
+    listener.start()
+    return listener
 
 if __name__ == '__main__':
-    setup_logging()
+    log_listener = setup_logging()
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    main(loop)
+    try:
+        main(loop)
+    finally:
+        log_listener.stop()
@@ -0,0 +1,220 @@
+"""Executes the commands received from the proxy, and sends their responses."""
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import suppress
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional
+
+DEFAULT_COMMAND_TIMEOUT = 10.0
+DEFAULT_IDEMPOTENCY_CACHE_SIZE = 1024
+
+CommandHandler = Callable[[str, Any], Awaitable[dict]]
+ResponseSender = Callable[[dict], Awaitable[None]]
+
+
+@dataclass
+class CommandJob:
+    """A single command waiting to be executed, with the timings of its stages."""
+    name: str
+    data: Any
+    command_time: datetime
+    received_at: float
+    idempotency_key: Optional[str] = None
+    # overrides the timeout of the executor, for commands that are expected to take longer
+    timeout: Optional[float] = None
+    # commands that are part of a fan-out are answered by the fan-out, not on their own
+    send_response: bool = True
+    started_at: Optional[float] = None
+    executed_at: Optional[float] = None
+    result: Optional[asyncio.Future] = field(default=None, repr=False)
+    # the key its result is cached under for duplicates, if it has an idempotency key
+    cache_key: Optional[str] = None
+
+
+class CommandExecutor:
+    """Executes commands with per-device ordering but concurrency across devices.
+    Every device gets its own queue and worker, so a slow command only delays later commands for the
+    same device. Commands are executed with a timeout: a command that times out is answered with an error,
+    but the next command of the device waits until it finished, as it may still be running on the device.
+    Commands with an idempotency key that succeeded recently are not executed again, the response of the
+    first execution is sent instead, failed ones are executed again when retried.
+    Responses report the time spent queued, executing and getting the response out separately,
+    all measured on the monotonic clock of the gateway."""
+    _event_loop: asyncio.AbstractEventLoop
+    timeout: float
+
+    def __init__(self, event_loop: asyncio.AbstractEventLoop, handler: CommandHandler,
+                 send_response: ResponseSender):
+        self._event_loop = event_loop
+        self._handler = handler
+        self._send_response = send_response
+        self.timeout = float(os.environ.get('COMMAND_TIMEOUT', DEFAULT_COMMAND_TIMEOUT))
+        self.idempotency_cache_size = int(os.environ.get('COMMAND_IDEMPOTENCY_CACHE_SIZE',
+                                                         DEFAULT_IDEMPOTENCY_CACHE_SIZE))
+
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+        self._results: OrderedDict[str, asyncio.Future] = OrderedDict()
+        self._stopped = False
+
+    def submit(self, device_key: str, job: CommandJob):
+        """Queue a command for a device, starting a worker for the device if needed."""
+        if job.idempotency_key is not None:
+            cache_key = f'{device_key}/{job.name}/{job.idempotency_key}'
+            cached = self._results.get(cache_key)
+            if cached is not None and cached.cancelled():
+                # nobody got the result of the first execution, execute the command again
+                del self._results[cache_key]
+                cached = None
+            if cached is not None:
+                logging.info({"message": "Duplicate command, not executing it again",
+                              "command": job.name,
+                              "id": job.idempotency_key})
+                self._results.move_to_end(cache_key)
+                self._event_loop.create_task(self._send_duplicate_response(device_key, job, cached))
+                return
+            if job.result is None:
+                job.result = self._event_loop.create_future()
+            job.cache_key = cache_key
+            self._results[cache_key] = job.result
+            while len(self._results) > self.idempotency_cache_size:
+                self._results.popitem(last=False)
+
+        queue = self._queues.get(device_key)
+        if queue is None:
+            queue = self._queues[device_key] = asyncio.Queue()
+            self._workers[device_key] = self._event_loop.create_task(self._worker(queue))
+        queue.put_nowait(job)
+
+    async def run(self, device_key: str, job: CommandJob) -> dict:
+        """Queue a command for a device like `submit`, and wait for its result instead of sending a response."""
+        job.send_response = False
+        job.result = self._event_loop.create_future()
+        self.submit(device_key, job)
+        return await job.result
+
+    async def _execute(self, job: CommandJob) -> tuple[dict, Optional[asyncio.Task]]:
+        """The result of a command, and the command itself if it is still running after timing out."""
+        timeout = job.timeout if job.timeout is not None else self.timeout
+        task = self._event_loop.create_task(self._handler(job.name, job.data))
+        try:
+            # not wait_for: cancelling a command does not stop the work it handed to a thread, e.g. a `set` that
+            # is still being sent to the device
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if not done:
+            logging.warning({"message": "Command timed out",
+                             "command": job.name,
+                             "timeout": timeout})
+            return {"result": "error", "error": f"timed out after {timeout} s"}, task
+        try:
+            return task.result(), None
+        except Exception as ex:
+            return {"result": "error", "error": repr(ex)}, None
+
+    async def _finish(self, job: CommandJob, task: asyncio.Task):
+        """Wait for a command that timed out to finish, so the next command of the device is not executed
+        while it still runs: the commands of a device are executed one at a time, in order."""
+        logging.warning({"message": "Holding the next commands of the device until the command that timed out "
+                                    "finishes",
+                         "command": job.name})
+        try:
+            await task
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        except Exception:
+            pass
+        logging.info({"message": "Command that timed out finished", "command": job.name,
+                      "duration": round((self._event_loop.time() - job.started_at) * 1000, 4)})
+
+    async def _worker(self, queue: asyncio.Queue):
+        with suppress(asyncio.CancelledError):
+            while True:
+                job: CommandJob = await queue.get()
+                if job.result is not None and job.result.cancelled():
+                    # whoever was waiting for the result gave up on it, a retry executes the command again
+                    self._forget(job)
+                    continue
+                job.started_at = self._event_loop.time()
+                try:
+                    result, running = await self._execute(job)
+                except asyncio.CancelledError:
+                    if job.result is not None:
+                        job.result.cancel()
+                    raise
+                job.executed_at = self._event_loop.time()
+                if result.get("result") == "error":
+                    # only successful results are kept, a retry of a failed command executes it again
+                    self._forget(job)
+                if job.result is not None and not job.result.done():
+                    job.result.set_result(result)
+                if job.send_response:
+                    await self._respond(job, result, job.started_at, job.executed_at)
+                if running is not None:
+                    await self._finish(job, running)
+
+    def _forget(self, job: CommandJob):
+        if job.cache_key is not None and self._results.get(job.cache_key) is job.result:
+            del self._results[job.cache_key]
+
+    async def _respond(self, job: CommandJob, result: dict, started_at: float, executed_at: float,
+                       duplicate: bool = False):
+        if not result:
+            return
+        now = self._event_loop.time()
+        response = {
+            "command": job.name,
+            "duration": round((now - job.received_at) * 1000, 4),
+            "queue_duration": round((started_at - job.received_at) * 1000, 4),
+            "execute_duration": round((executed_at - started_at) * 1000, 4),
+            "send_duration": round((now - executed_at) * 1000, 4),
+            "time": job.command_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            "result": result,
+        }
+        if job.idempotency_key is not None:
+            response["id"] = job.idempotency_key
+        if duplicate:
+            response["duplicate"] = True
+        await self._send_response(response)
+
+    async def _send_duplicate_response(self, device_key: str, job: CommandJob, cached: asyncio.Future):
+        with suppress(asyncio.CancelledError):
+            try:
+                # shielded, so a duplicate that is run (see `run`) and gives up does not cancel the first execution
+                result = await asyncio.shield(cached)
+            except asyncio.CancelledError:
+                if not cached.cancelled() or self._stopped:
+                    raise
+                # whoever ran the first execution gave up on it before it was executed, execute the duplicate
+                self.submit(device_key, job)
+                return
+            now = self._event_loop.time()
+            if job.result is not None and not job.result.done():
+                job.result.set_result(result)
+            if job.send_response:
+                await self._respond(job, result, now, now, duplicate=True)
+
+    async def stop(self):
+        """Stop the workers, dropping the commands that were not executed yet. Whoever waits for the result of
+        a dropped command, including its duplicates, is cancelled."""
+        self._stopped = True
+        for task in self._workers.values():
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        for queue in self._queues.values():
+            while not queue.empty():
+                job = queue.get_nowait()
+                if job.result is not None:
+                    job.result.cancel()
+        for result in self._results.values():
+            result.cancel()
+        self._results.clear()
+        self._workers.clear()
+        self._queues.clear()
@@ -1,61 +1,223 @@
 """Handles the WebSocket connection to the Emulate Commander proxy."""
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Callable, Optional
 import asyncio
 import logging
 import json
 import os
+import random
 import traceback
+import uuid
 from contextlib import suppress
-import websockets.client as ws_client
-import websockets.exceptions as ws_exceptions
+from functools import cache
+from types import ModuleType
 
-from src.utils import json_serialize
+from src.UplinkCompression import UplinkCompression
+from src.utils import debug_enabled, json_serialize
+
+if TYPE_CHECKING:
+    import websockets.client as ws_client
+
+@cache
+def _websockets() -> tuple[ModuleType, ModuleType]:
+    """The websockets client and exceptions modules. They are imported when first connecting,
+    on a worker thread, rather than at startup."""
+    import websockets.client
+    import websockets.exceptions
+    return websockets.client, websockets.exceptions
+
+DEFAULT_RECONNECT_FIRST_DELAY = 0.5
+DEFAULT_RECONNECT_BASE_DELAY = 1.0
+DEFAULT_RECONNECT_MAX_DELAY = 60.0
+DEFAULT_RECONNECT_STABLE_AFTER = 30.0
+DEFAULT_PING_INTERVAL = 15.0
+DEFAULT_PING_TIMEOUT = 10.0
+RTT_SMOOTHING = 0.2
+
+class Backoff:
+    """Exponential backoff with full jitter. The first delay is drawn from [0, first_delay], for a fast
+    first retry, and the n-th delay after it from [0, min(max_delay, base_delay * 2**n)], so gateways that
+    lost the proxy at the same moment spread out their retries instead of retrying in lockstep."""
+    attempts: int
+
+    def __init__(self, first_delay: float, base_delay: float, max_delay: float,
+                 uniform: Callable[[float, float], float] = random.uniform):
+        self.first_delay = first_delay
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._uniform = uniform
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        """Delay before the next attempt."""
+        if self.attempts == 0:
+            ceiling = self.first_delay
+        else:
+            # capped before raising it to a power, as the attempts keep counting while the proxy is down
+            ceiling = min(self.max_delay, self.base_delay * 2 ** min(self.attempts - 1, 32))
+        self.attempts += 1
+        return self._uniform(0, ceiling)
+
+    def reset(self):
+        """Start over from the fast first retry."""
+        self.attempts = 0
 
 class ConnectionManager:
-    """Handles the WebSocket connection to the Emulate Commander proxy."""
-    def __init__(self, mediator: Optional[None] = None) -> None:
-        self.__proxy_connection: Optional[ws_client.WebSocketClientProtocol] = None
+    """Handles the WebSocket connection to the Emulate Commander proxy.
+    Lost connections are retried with a jittered exponential backoff (see Backoff). The health of the
+    connection is tracked by pinging the proxy, and a connection that does not answer pings in time is
+    closed and reconnected. After connecting, the gateway first sends a resume message with its session
+    id and the id of the last command it received, so the proxy can resend the commands it has no
+    response for; commands with an id are only executed once (see CommandExecutor)."""
+    def __init__(self, mediator: Optional[None] = None,
+                 commander_proxy_base_url: Optional[str] = None,
+                 device_id: Optional[str] = None) -> None:
+        self.__proxy_connection: Optional["ws_client.WebSocketClientProtocol"] = None
 
-        self.__commander_proxy_base_url: Optional[str] = os.environ.get('COMMANDER_PROXY_BASE_URL')
-        self.__device_id: Optional[str] = os.environ.get('DEVICE_ID')
+        self.__commander_proxy_base_url: Optional[str] = (
+            commander_proxy_base_url or os.environ.get('COMMANDER_PROXY_BASE_URL'))
+        self.__device_id: Optional[str] = device_id or os.environ.get('DEVICE_ID')
 
         self.__connect_task: Optional[asyncio.Task] = None
         self.__poll_task: Optional[asyncio.Task] = None
         self.__close_proxy_connection_task: Optional[asyncio.Task] = None
+        self.__health_task: Optional[asyncio.Task] = None
+        self.__stopped = False
+
+        self.backoff = Backoff(
+            first_delay=float(os.environ.get('RECONNECT_FIRST_DELAY', DEFAULT_RECONNECT_FIRST_DELAY)),
+            base_delay=float(os.environ.get('RECONNECT_BASE_DELAY', DEFAULT_RECONNECT_BASE_DELAY)),
+            max_delay=float(os.environ.get('RECONNECT_MAX_DELAY', DEFAULT_RECONNECT_MAX_DELAY)))
+        # a connection that stayed up this long resets the backoff, one that drops sooner keeps backing off
+        self.stable_after = float(os.environ.get('RECONNECT_STABLE_AFTER', DEFAULT_RECONNECT_STABLE_AFTER))
+        self.ping_interval = float(os.environ.get('PROXY_PING_INTERVAL', DEFAULT_PING_INTERVAL))
+        self.ping_timeout = float(os.environ.get('PROXY_PING_TIMEOUT', DEFAULT_PING_TIMEOUT))
+        self.compression = UplinkCompression()
+
+        # identifies this gateway process to the proxy across reconnects
+        self.session_id = uuid.uuid4().hex
+        self.__last_command_id: Optional[Any] = None
+        self.__reconnecting = False
+        self.__connected_at: Optional[float] = None
+        self.__reconnects = 0
+        self.__rtt: Optional[float] = None
+        self.__rtt_average: Optional[float] = None
 
         self.mediator = mediator
 
-    async def __connect(self, retry_interval: int = 20):
+    async def __connect(self):
         if self.is_connected():
             return
         url = f'{self.__commander_proxy_base_url}{self.__device_id}'
+        ws_client, ws_exceptions = await asyncio.to_thread(_websockets)
+        if self.__reconnecting:
+            # also wait before the first retry, as the other gateways lost the proxy at the same moment
+            await asyncio.sleep(self.backoff.next_delay())
         while True:
             try:
-                self.__proxy_connection = await ws_client.connect(uri=url, ping_interval=15)
+                # pings are sent by the health monitor, which also measures their round trip time
+                self.__proxy_connection = await ws_client.connect(uri=url, ping_interval=None,
+                                                                  close_timeout=self.ping_timeout,
+                                                                  **self.compression.connect_options())
+                self.compression.apply_write_limits(self.__proxy_connection)
+                self.__connected_at = asyncio.get_running_loop().time()
+                self.__rtt = self.__rtt_average = None
+                if self.__reconnecting:
+                    self.__reconnects += 1
                 logging.info({"message": "Connected to proxy",
-                              "url": url})
+                              "url": url,
+                              "attempts": self.backoff.attempts})
+                await self.__resume()
+                if self.mediator:
+                    self.mediator.notify("proxy_connected")
                 return
             except (ws_exceptions.WebSocketException, OSError) as ex:
+                retry_interval = self.backoff.next_delay()
                 logging.warning({"message": "Could not connect to proxy",
-                                 "retry_interval": retry_interval,
+                                 "retry_interval": round(retry_interval, 3),
+                                 "attempts": self.backoff.attempts,
                                  "url": url,
                                  "error": repr(ex),
                                  "traceback": traceback.format_exc()})
                 await asyncio.sleep(retry_interval)
 
+    async def __resume(self):
+        """Sends the resume message, the first message on every connection. The proxy can resend
+        the commands after `last_command` it did not get a response for, and replies with `resumed`."""
+        await self.__proxy_connection.send(self.compression.encode(json.dumps({"resume": {
+            "session": self.session_id,
+            "last_command": self.__last_command_id,
+        }}, default=json_serialize)))
+
+    async def __monitor_health(self):
+        """Pings the proxy every ping interval, tracking the round trip time, and closes the
+        connection when a ping is not answered in time, so it is reconnected."""
+        _, ws_exceptions = _websockets()
+        connection = self.__proxy_connection
+        loop = asyncio.get_running_loop()
+        with suppress(ws_exceptions.ConnectionClosed):
+            while connection is not None and connection.open:
+                await asyncio.sleep(self.ping_interval)
+                sent_at = loop.time()
+                pong_waiter = await connection.ping()
+                try:
+                    await asyncio.wait_for(pong_waiter, self.ping_timeout)
+                except asyncio.TimeoutError:
+                    logging.warning({"message": "Proxy did not answer ping in time, reconnecting",
+                                     "ping_timeout": self.ping_timeout,
+                                     "rtt_average_ms": self.__ms(self.__rtt_average)})
+                    await connection.close()
+                    return
+                self.__rtt = loop.time() - sent_at
+                if self.__rtt_average is None:
+                    self.__rtt_average = self.__rtt
+                else:
+                    self.__rtt_average += RTT_SMOOTHING * (self.__rtt - self.__rtt_average)
+
+    @staticmethod
+    def __ms(seconds: Optional[float]) -> Optional[float]:
+        return None if seconds is None else round(seconds * 1000, 3)
+
+    def health(self) -> dict:
+        """Health of the proxy connection: the last and average ping round trip times, how long the
+        connection is up, the bytes waiting in its write buffer, how often it was reconnected, and the
+        attempts since it was last stable."""
+        connected_for = None
+        write_buffer_size = None
+        if self.is_connected():
+            if self.__connected_at is not None:
+                connected_for = round(asyncio.get_event_loop().time() - self.__connected_at, 3)
+            write_buffer_size = self.__proxy_connection.transport.get_write_buffer_size()
+        return {
+            "connected": self.is_connected(),
+            "connected_for_s": connected_for,
+            "write_buffer_size": write_buffer_size,
+            "rtt_ms": self.__ms(self.__rtt),
+            "rtt_average_ms": self.__ms(self.__rtt_average),
+            "reconnects": self.__reconnects,
+            "reconnect_attempts": self.backoff.attempts,
+        }
+
     async def __poll_proxy_connection(self):
         if not self.is_connected():
             logging.warning({"message": "Not connected, polling won't start"})
             return
+        _, ws_exceptions = _websockets()
         try:
             logging.info({"message": "Started to poll for proxy messages"})
             while True:
                 received = await self.__proxy_connection.recv()
                 try:
                     message = json.loads(received)
+                    if isinstance(message, dict):
+                        if "resumed" in message:
+                            logging.info({"message": "Session resumed", "resumed": message.pop("resumed")})
+                            if not message:
+                                continue
+                        if message.get("id") is not None:
+                            self.__last_command_id = message["id"]
                     if self.mediator:
                         try:
-                            await self.mediator.notify("command_received", message)
+                            self.mediator.notify("command_received", message)
                         except Exception as ex:
                             logging.error({"message": "Error occurred while handling command",
                                            "error": repr(ex),
@@ -74,25 +236,40 @@ class ConnectionManager:
     def __poll_task_done(self, _: asyncio.Task):
         logging.info({"message": "Poll task done"})
         self.__poll_task = None
+        if self.__health_task is not None:
+            self.__health_task.cancel()
+            self.__health_task = None
+        if self.__stopped:
+            return
+        self.__reconnecting = True
+        if (self.__connected_at is not None
+                and asyncio.get_event_loop().time() - self.__connected_at >= self.stable_after):
+            self.backoff.reset()
         self.__close_proxy_connection_task = asyncio.get_event_loop().create_task(
             self.__close_proxy_connection())
         self.__close_proxy_connection_task.add_done_callback(
             self.__close_proxy_connection_task_done)
 
-    async def send_to_proxy(self, payload: dict):
-        """Sends a JSON payload to the proxy."""
+    async def send_to_proxy(self, payload: dict) -> bool:
+        """Sends a JSON payload to the proxy, returning if it was sent."""
+        if not self.is_connected():
+            logging.warning({"message": "Could not send, not connected to proxy"})
+            return False
+        _, ws_exceptions = _websockets()
         try:
-            if self.is_connected():
-                await self.__proxy_connection.send(json.dumps(payload, default=json_serialize))
+            message = self.compression.encode(json.dumps(payload, default=json_serialize))
+            # waits while the write buffer is above its high water mark, see UplinkCompression
+            await self.__proxy_connection.send(message)
+            if debug_enabled():
                 logging.debug({"message": "Payload to proxy sent",
                               "payload": payload})
-            else:
-                logging.warning({"message": "Could not send, not connected to proxy"})
+            return True
         except ws_exceptions.WebSocketException as ex:
             logging.warning({"message": "Could not send payload",
                             "payload": payload,
                             "error": repr(ex),
                             "traceback": traceback.format_exc()})
+        return False
 
     async def __close_proxy_connection(self):
         if self.__proxy_connection is not None and not self.__proxy_connection.closed:
@@ -101,7 +278,8 @@ class ConnectionManager:
 
     def __close_proxy_connection_task_done(self, _: asyncio.Task):
         self.__close_proxy_connection_task = None
-        self.start()
+        if not self.__stopped:
+            self.start()
 
     def is_connected(self) -> bool:
         """If the proxy connection is open."""
@@ -113,9 +291,12 @@ class ConnectionManager:
             return
         self.__poll_task = asyncio.get_event_loop().create_task(self.__poll_proxy_connection())
         self.__poll_task.add_done_callback(self.__poll_task_done)
+        if self.is_connected() and self.ping_interval > 0:
+            self.__health_task = asyncio.get_event_loop().create_task(self.__monitor_health())
 
     def start(self):
         """Start polling for messages from the proxy."""
+        self.__stopped = False
         if self.__connect_task is not None:
             return
         self.__connect_task = asyncio.get_event_loop().create_task(self.__connect())
@@ -123,7 +304,8 @@ class ConnectionManager:
 
     async def stop(self):
         """Stop polling and disconnect from the proxy."""
-        tasks = [self.__connect_task, self.__poll_task, self.__close_proxy_connection_task]
+        self.__stopped = True
+        tasks = [self.__connect_task, self.__poll_task, self.__health_task, self.__close_proxy_connection_task]
         for task in tasks:
             if task is not None and not task.done() and not task.cancelled():
                 task.cancel()
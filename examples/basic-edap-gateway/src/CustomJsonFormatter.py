@@ -0,0 +1,27 @@
+"""JSON formatter of the log records."""
+import logging
+from typing import Any
+from datetime import datetime, timezone
+from pythonjsonlogger import jsonlogger
+
+class CustomJsonFormatter(jsonlogger.JsonFormatter):
+    """Custom JSON Formatter class for logging"""
+    service_name: str
+
+    def __init__(self, service_name: str):
+        super().__init__()
+        self.service_name = service_name
+
+    def add_fields(self, log_record: dict[str, Any], record: logging.LogRecord,
+                   message_dict: dict[str, Any]):
+        """Add custom fields to the log record."""
+        super().add_fields(log_record, record, message_dict)
+        log_record['service'] = self.service_name
+        if not log_record.get('timestamp'):
+            # records are formatted on the logging thread, so use the time they were created
+            created = datetime.fromtimestamp(record.created, tz=timezone.utc)
+            log_record['timestamp'] = created.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        if log_record.get('level'):
+            log_record['level'] = log_record['level'].lower()
+        else:
+            log_record['level'] = record.levelname.lower()
@@ -1,12 +1,16 @@
 """Abstract class that is responsible for managing the connection to the device/backend."""
 import os
 import asyncio
+import inspect
 import logging
 from contextlib import suppress
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from datetime import timedelta
 from abc import ABC, abstractmethod
 
+if TYPE_CHECKING:
+    from src.PollingScheduler import PollingScheduler
+
 DEFAULT_POLLING_INTERVAL = timedelta(seconds=1)
 
 class DeviceConnection(ABC):
@@ -23,6 +27,7 @@ class DeviceConnection(ABC):
         self.polling_interval = timedelta(seconds=polling_interval_s)
 
         self._polling_loop_task: Optional[asyncio.Task] = None
+        self._polling_scheduler: Optional["PollingScheduler"] = None
 
     @abstractmethod
     def connect(self):
@@ -39,16 +44,34 @@ class DeviceConnection(ABC):
 
     @abstractmethod
     def _poll(self) -> dict:
+        """Should read a sample from the device. Can also be a coroutine, for devices with
+        asynchronous drivers."""
         return {}
 
-    def start(self):
-        """Connect if needed, and start the polling loop."""
-        self.connect()
+    async def poll(self):
+        """Read a single sample from the device and pass it onto the mediator."""
+        data = self._poll()
+        if inspect.isawaitable(data):
+            data = await data
+        self.mediator.notify("sample_received", data)
+
+    def start(self, polling_scheduler: Optional["PollingScheduler"] = None,
+              interval_function=None, connect: bool = True):
+        """Connect if needed, and start polling. When a shared polling scheduler is given,
+        the polling is left to it, otherwise the connection runs its own polling loop.
+        Pass `connect=False` when `connect` was already called."""
+        if connect:
+            self.connect()
         logging.info({
             "message": "Starting device polling loop",
-            "polling_interval": self.polling_interval.total_seconds()
+            "polling_interval": self.polling_interval.total_seconds(),
+            "shared_scheduler": polling_scheduler is not None
         })
-        self._polling_loop_task = self._event_loop.create_task(self._polling_loop())
+        if polling_scheduler is not None:
+            self._polling_scheduler = polling_scheduler
+            polling_scheduler.add(self, interval_function)
+        else:
+            self._polling_loop_task = self._event_loop.create_task(self._polling_loop())
 
     async def _polling_loop(self):
         # The following generator keeps a counter tracking when the next tick
@@ -63,13 +86,15 @@ class DeviceConnection(ABC):
         g = g_tick()
         with suppress(asyncio.CancelledError):
             while True:
-                data = self._poll()
-                self.mediator.notify("sample_received", data)
+                await self.poll()
                 await asyncio.sleep(next(g))
 
 
     def stop(self):
         """Disconnect if needed, and stop the polling loop."""
         self.disconnect()
+        if self._polling_scheduler is not None:
+            self._polling_scheduler.remove(self)
+            self._polling_scheduler = None
         if self._polling_loop_task:
             self._polling_loop_task.cancel()
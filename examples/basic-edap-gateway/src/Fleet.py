@@ -0,0 +1,114 @@
+"""Registry of the mediators of the gateway process, and fan-out of commands over them."""
+import os
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from src.CommandExecutor import CommandJob
+
+if TYPE_CHECKING:
+    from src.Mediator import Mediator
+
+DEFAULT_FAN_OUT_PARALLELISM = 64
+DEFAULT_FAN_OUT_TIMEOUT = 60.0
+# commands that can be fanned out, profiles and fan-outs themselves apply to the whole process already
+FAN_OUT_COMMANDS = ("set", "set_triggers", "set_derived_sensors", "ping")
+
+
+class Fleet:
+    """The mediators of the devices of the gateway process, by device id, with their tags.
+    A `fan_out` command received by any of them, e.g.
+    `{"fan_out": {"devices": {"tags": ["site-1"]}, "command": {"set_triggers": [...]}}}`, executes the command for
+    every selected device, at most `FAN_OUT_PARALLELISM` (default 64) at a time, and is answered with a single
+    response with the result and timings of every device. Devices are selected by `ids`, by `tags` (any of them),
+    or with `"all": true`. The command of every device is queued behind the other commands of that device, so
+    the commands of a device are still executed in order, and has the usual command timeout. This includes the
+    device that received the fan-out, whose fan-outs are queued apart from its other commands (see
+    Mediator.handle_commands), so concurrent fan-outs received by different devices never wait for each other. Devices that did not
+    get to the command within `FAN_OUT_TIMEOUT` seconds (default 60) of the fan-out are reported as failed, and
+    don't execute it anymore.
+    `set_triggers` is set on every device as a single shared trigger template (see edap.template), instead of a
+    copy of the triggers per device."""
+
+    def __init__(self):
+        self._mediators: dict[str, "Mediator"] = {}
+        self.parallelism = int(os.environ.get('FAN_OUT_PARALLELISM', DEFAULT_FAN_OUT_PARALLELISM))
+        self.timeout = float(os.environ.get('FAN_OUT_TIMEOUT', DEFAULT_FAN_OUT_TIMEOUT))
+
+    def register(self, mediator: "Mediator"):
+        self._mediators[mediator.device_id] = mediator
+
+    def unregister(self, mediator: "Mediator"):
+        if self._mediators.get(mediator.device_id) is mediator:
+            del self._mediators[mediator.device_id]
+
+    def __len__(self) -> int:
+        return len(self._mediators)
+
+    def select(self, selector: dict) -> list["Mediator"]:
+        """The mediators of the devices matching a selector."""
+        if not isinstance(selector, dict) or not (selector.get('all') or selector.get('ids') or selector.get('tags')):
+            raise ValueError("Select devices with ids, tags or all")
+        if selector.get('all'):
+            return list(self._mediators.values())
+        ids = set(selector.get('ids') or [])
+        tags = set(selector.get('tags') or [])
+        return [mediator for device_id, mediator in self._mediators.items()
+                if device_id in ids or not tags.isdisjoint(mediator.tags)]
+
+    async def fan_out(self, data: dict) -> dict:
+        """Execute a command for the selected devices, returning the aggregated result."""
+        if not isinstance(data, dict):
+            raise ValueError("A fan-out needs the devices to select and the command to execute")
+        command = data.get('command')
+        if not isinstance(command, dict) or len(command) != 1:
+            raise ValueError("A fan-out executes a single command")
+        (command_name, command_data), = command.items()
+        if command_name not in FAN_OUT_COMMANDS:
+            raise ValueError(f"{command_name} can not be fanned out, only {', '.join(FAN_OUT_COMMANDS)}")
+        mediators = self.select(data.get('devices'))
+        parallelism = max(1, int(data.get('parallelism', self.parallelism)))
+
+        if command_name == 'set_triggers' and command_data is not None:
+            from edap.template import TriggerTemplate
+            command_data = TriggerTemplate(command_data)
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(parallelism)
+        deadline = loop.time() + self.timeout
+        command_time = datetime.now(tz=timezone.utc)
+
+        async def execute(mediator: "Mediator") -> tuple[str, dict]:
+            async with semaphore:
+                received_at = loop.time()
+                job = CommandJob(name=command_name, data=command_data, command_time=command_time,
+                                 received_at=received_at)
+                try:
+                    result = await asyncio.wait_for(mediator.command_executor.run(mediator.device_id, job),
+                                                    timeout=max(deadline - received_at, 0))
+                except asyncio.TimeoutError:
+                    result = {"result": "error", "error": f"not executed within {self.timeout} s"}
+                except Exception as ex:
+                    result = {"result": "error", "error": repr(ex)}
+                done_at = loop.time()
+                response = {"result": result, "duration": round((done_at - received_at) * 1000, 4)}
+                if job.started_at is not None and job.executed_at is not None:
+                    response["queue_duration"] = round((job.started_at - received_at) * 1000, 4)
+                    response["execute_duration"] = round((job.executed_at - job.started_at) * 1000, 4)
+                return mediator.device_id, response
+
+        responses = dict(await asyncio.gather(*(execute(mediator) for mediator in mediators)))
+        failed = sorted(device_id for device_id, response in responses.items()
+                        if response["result"].get("result") == "error")
+        if failed:
+            logging.warning({"message": "Fan-out failed for some devices", "command": command_name,
+                             "failed": len(failed), "devices": len(responses)})
+        return {
+            "result": "error" if failed else "success",
+            "command": command_name,
+            "devices": len(responses),
+            "succeeded": len(responses) - len(failed),
+            "failed": failed,
+            "responses": responses,
+        }
@@ -1,29 +1,122 @@
 """Central component that mediates between the device and the proxy."""
+import os
 import asyncio
-from typing import Any, Literal
+import inspect
+from collections import deque
+from typing import TYPE_CHECKING, Any, Literal, Optional, get_args
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
+from edap import EdapDevice
+from edap.template import TriggerTemplate
+
+from src.CommandExecutor import CommandExecutor, CommandJob
 from src.ConnectionManager import ConnectionManager
 from src.DeviceConnection import DeviceConnection
-from src.dummy.DummyDeviceConnection import DummyDeviceConnection
-from src.dummy.DummyEdapBattery import DummyEdapBattery
+from src.Fleet import Fleet
+from src.PollingScheduler import PollingScheduler
+from src.Profiler import DEFAULT_PROFILE_MAX_DURATION, Profiler
+from src.drivers import DEFAULT_DRIVER, load_driver
+from src.utils import debug_enabled
+
+if TYPE_CHECKING:
+    from edap.codec import DeltaEncoder
+    from edap.shared_state import TriggerStateTable
+
+EventType = Literal["sample_received", "trigger_activated", "command_received", "proxy_connected"]
+CommandType = Literal["set", "set_triggers", "set_derived_sensors", "ping", "profile", "fan_out"]
+COMMAND_TYPES = get_args(CommandType)
 
-EventType = Literal["sample_received", "trigger_activated", "command_received"]
-CommandType = Literal["set", "set_triggers", "ping"]
+DEFAULT_LEVEL_PROXIMITY = 0.05
+DEFAULT_FAST_POLLING_FACTOR = 4
+DEFAULT_UPLINK_BUFFER_SIZE = 1000
 
 class Mediator:
     """Class that acts as a mediator between the device and the proxy."""
     _event_loop: asyncio.AbstractEventLoop
     connection_manager: ConnectionManager
+    command_executor: CommandExecutor
+    polling_scheduler: PollingScheduler
     device_connection: DeviceConnection
-    device: DummyEdapBattery
+    device: EdapDevice
 
-    def __init__(self, event_loop: asyncio.AbstractEventLoop):
+    def __init__(self, event_loop: asyncio.AbstractEventLoop,
+                 device_id: Optional[str] = None,
+                 polling_scheduler: Optional[PollingScheduler] = None,
+                 fleet: Optional[Fleet] = None,
+                 tags: Optional[list[str]] = None,
+                 trigger_state_table: Optional["TriggerStateTable"] = None):
         self._event_loop = event_loop
-        self.connection_manager = ConnectionManager(self)
-        self.device_connection = DummyDeviceConnection(self, event_loop)
-        self.device = DummyEdapBattery(self)
+        self.device_id = device_id or os.environ.get('DEVICE_ID')
+        self.tags = set(tags if tags is not None
+                        else (tag.strip() for tag in os.environ.get('DEVICE_TAGS', '').split(',') if tag.strip()))
+        # the mediators of the process that fan-out commands can address, only this one unless a fleet is shared
+        self.fleet = fleet if fleet is not None else Fleet()
+        self.connection_manager = ConnectionManager(self, device_id=self.device_id)
+        self.command_executor = CommandExecutor(event_loop, self.execute_command,
+                                                self.connection_manager.send_to_proxy)
+        # a scheduler that is passed in is shared with other mediators, and is left to its owner to stop
+        self._owns_polling_scheduler = polling_scheduler is None
+        self.polling_scheduler = polling_scheduler or PollingScheduler(event_loop)
+        # only the configured driver is imported, as are the optional features below
+        self.driver = load_driver(os.environ.get('DEVICE_DRIVER', DEFAULT_DRIVER))
+        self.device_connection = self.driver.connection(self, event_loop)
+        self.device = self.driver.device(self)
+
+        sample_recording_path = os.environ.get('SAMPLE_RECORDING_PATH')
+        if sample_recording_path:
+            from edap.replay import SampleRecorder
+            # a file per device, when several devices of the process record their samples
+            self.device.sample_recorder = SampleRecorder(
+                sample_recording_path.replace('{device_id}', str(self.device_id)))
+
+        # optional table of the trigger state in shared memory, readable by local monitoring tools
+        # with `python -m edap.shared_state <name>`. A table that is passed in is shared with other mediators,
+        # every device writes a row of its own, and is left to its owner to unlink.
+        self.trigger_state_table = trigger_state_table
+        self._owns_trigger_state_table = False
+        trigger_state_table_name = os.environ.get('TRIGGER_STATE_TABLE')
+        if self.trigger_state_table is None and trigger_state_table_name:
+            from edap.shared_state import TriggerStateTable
+            # a table left behind by a gateway that did not shut down cleanly is replaced
+            self.trigger_state_table = TriggerStateTable(trigger_state_table_name, replace=True)
+            self._owns_trigger_state_table = True
+        self._trigger_state_row: Optional[int] = None
+        if self.trigger_state_table is not None:
+            self._trigger_state_row = self.trigger_state_table.acquire_row()
+            self.device.attach_state_table(self.trigger_state_table, row=self._trigger_state_row,
+                                           device_id=self.device_id)
+
+        # optional delta encoding of the triggered samples sent to the proxy
+        self.uplink_encoder: Optional["DeltaEncoder"] = None
+        if os.environ.get('UPLINK_DELTA_ENCODING', 'false').lower() == 'true':
+            from edap.codec import DEFAULT_KEYFRAME_INTERVAL, DeltaEncoder
+            self.uplink_encoder = DeltaEncoder(
+                keyframe_interval=int(os.environ.get('UPLINK_KEYFRAME_INTERVAL', DEFAULT_KEYFRAME_INTERVAL)),
+                acknowledged=os.environ.get('UPLINK_DELTA_ACKNOWLEDGED', 'false').lower() == 'true')
+
+        # optional encoding of the sensors of the triggered samples by their id in the schema of the device,
+        # the schema itself is sent after connecting and whenever it changes, and when the proxy acknowledges it,
+        # again with every sample until it acknowledged the current version
+        self.uplink_schema_encoding = os.environ.get('UPLINK_SCHEMA_ENCODING', 'false').lower() == 'true'
+        self.uplink_schema_acknowledged = \
+            os.environ.get('UPLINK_SCHEMA_ACKNOWLEDGED', 'false').lower() == 'true'
+        self._sent_schema_version: Optional[int] = None
+        self._acknowledged_schema_version: Optional[int] = None
+
+        # triggered samples that could not be sent yet, sent in order once the proxy is reachable again,
+        # the oldest are dropped when the buffer is full
+        self.pending_uplink: deque = deque(maxlen=int(os.environ.get('UPLINK_BUFFER_SIZE',
+                                                                     DEFAULT_UPLINK_BUFFER_SIZE)))
+        self.dropped_uplink = 0
+        self._flushing_uplink = False
+
+        self.level_proximity = float(os.environ.get('POLLING_LEVEL_PROXIMITY', DEFAULT_LEVEL_PROXIMITY))
+        self.fast_polling_factor = float(os.environ.get('FAST_POLLING_FACTOR', DEFAULT_FAST_POLLING_FACTOR))
+
+        # the profiler is only created when the first profile command is received
+        self.profile_max_duration = float(os.environ.get('PROFILE_MAX_DURATION', DEFAULT_PROFILE_MAX_DURATION))
+        self._profiler: Optional[Profiler] = None
 
     def notify(self, event: EventType, data: Any = None):
         """React to different kinds of events, triggered by one of the components."""
@@ -32,19 +125,74 @@ class Mediator:
     async def __inner_notify(self, event: EventType, data: Any):
         match event:
             case "trigger_activated":
-                await self.connection_manager.send_to_proxy(data)
-                logging.debug({"message": "Trigger activated", "trigger": data})
+                if len(self.pending_uplink) == self.pending_uplink.maxlen:
+                    self.dropped_uplink += 1
+                    logging.warning({"message": "Uplink buffer full, dropping the oldest sample",
+                                     "dropped": self.dropped_uplink})
+                self.pending_uplink.append(data)
+                await self.flush_uplink()
+                if debug_enabled():
+                    logging.debug({"message": "Trigger activated", "trigger": data})
             case "command_received":
                 self.handle_commands(data)
             case "sample_received":
                 self.device.update_from_sample(data)
+            case "proxy_connected":
+                # a new connection means a new decoder on the proxy side
+                if self.uplink_encoder is not None:
+                    self.uplink_encoder.request_keyframe()
+                self._sent_schema_version = None
+                self._acknowledged_schema_version = None
+                await self.flush_uplink()
             case _:
                 logging.error({"message": "Unknown event", "event": event})
                 return False
         return True
 
+    async def flush_uplink(self):
+        """Send the pending triggered samples in order, until the buffer is empty or sending fails.
+        Samples triggered while flushing are queued behind the pending ones, so order is kept."""
+        if self._flushing_uplink:
+            return
+        self._flushing_uplink = True
+        try:
+            while self.pending_uplink and self.connection_manager.is_connected():
+                if not await self.__send_sample(self.pending_uplink[0]):
+                    break
+                self.pending_uplink.popleft()
+        finally:
+            self._flushing_uplink = False
+
+    async def __send_sample(self, sample: dict) -> bool:
+        """Encode and send a single triggered sample, returning if it was sent."""
+        data = sample
+        if self.uplink_encoder is not None:
+            data = self.uplink_encoder.encode(data)
+        sent = True
+        if self.uplink_schema_encoding:
+            data = self.device.schema.encode(data)
+            if self._schema_outdated():
+                schema = self.device.schema.to_dict()
+                sent = await self.connection_manager.send_to_proxy({"schema": schema})
+                if sent:
+                    self._sent_schema_version = schema["version"]
+        sent = sent and await self.connection_manager.send_to_proxy(data)
+        if not sent and self.uplink_encoder is not None:
+            # the proxy can not decode anything based on a sample it never received
+            self.uplink_encoder.request_keyframe()
+        return sent
+
+    def _schema_outdated(self) -> bool:
+        """If the proxy may not have the current schema of the device, so it is sent before the next sample."""
+        version = self.device.schema.version
+        if self.uplink_schema_acknowledged:
+            return self._acknowledged_schema_version is None or self._acknowledged_schema_version < version
+        return version != self._sent_schema_version
+
     def handle_commands(self, command: dict):
-        """React to incoming command from the proxy."""
+        """React to incoming command from the proxy. The commands are queued on the command executor,
+        which executes them in order for the device, and sends the responses."""
+        received_at = self._event_loop.time()
         command_time: datetime = None
         if "time" in command:
             # no need to account for timestamps that end with Z since python 3.11
@@ -52,51 +200,111 @@ class Mediator:
             del command["time"]
         else:
             command_time = datetime.now(tz=timezone.utc)
+        # optional idempotency key, so commands that are retried by the proxy are only executed once
+        idempotency_key = command.pop("id", None)
+        # acknowledgement of a delta encoded sample, which becomes the base of the following ones
+        acknowledged = command.pop("ack", None)
+        if acknowledged is not None and self.uplink_encoder is not None:
+            self.uplink_encoder.acknowledge(acknowledged)
+        # acknowledgement of the schema version the proxy decodes the id encoded samples with
+        schema_acknowledged = command.pop("schema_ack", None)
+        if isinstance(schema_acknowledged, int):
+            self._acknowledged_schema_version = max(self._acknowledged_schema_version or 0, schema_acknowledged)
 
         for command_name, command_data in command.items():
-            match command_name:
-                case "set":
-                    try:
-                        self.device_connection.send(command_data)
-                        result = {"result": "success"}
-                    except Exception as ex:
-                        result = {"result": "error", "error": repr(ex)}
-                case "set_triggers":
-                    try:
-                        self.device.set_triggers(command_data)
-                        result = {"result": "success"}
-                    except Exception as ex:
-                        result = {"result": "error", "error": repr(ex)}
-                case "ping":
-                    result = {"result": "pong"}
-                case _:
-                    logging.error({"message": "Unknown command", "command": command_name})
-                    return
-            self._event_loop.create_task(
-                self.send_command_response(command_name, command_time, result))
-
-    async def send_command_response(self, command_name: str, command_time: datetime, result: dict):
-        """Constructs and sends a response to a command."""
-        if not result:
-            return
-        now = datetime.now(tz=timezone.utc)
-        duration_ms = round((now - command_time).total_seconds() * 1000, 4)
-        command_response = {
-            "command": command_name,
-            "duration": duration_ms,
-            "time": command_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
-            "result": result,
-        }
-        await self.connection_manager.send_to_proxy(command_response)
-
-    def start(self):
-        """Start the different components of the mediator."""
+            if command_name not in COMMAND_TYPES:
+                logging.error({"message": "Unknown command", "command": command_name})
+                return
+            # fan-outs queue commands for this device too, so they are queued apart from its other commands
+            device_key = self.device_id if command_name != "fan_out" else f"{self.device_id}/fan_out"
+            self.command_executor.submit(device_key, CommandJob(
+                name=command_name,
+                data=command_data,
+                command_time=command_time,
+                received_at=received_at,
+                idempotency_key=idempotency_key,
+                timeout=self.command_timeout(command_name),
+            ))
+
+    def command_timeout(self, command_name: str) -> Optional[float]:
+        """Timeout of a command, if it differs from the usual command timeout."""
+        match command_name:
+            case "profile":
+                # a profile runs for up to its maximum duration, on top of the usual command timeout
+                return self.command_executor.timeout + self.profile_max_duration
+            case "fan_out":
+                return self.command_executor.timeout + self.fleet.timeout
+        return None
+
+    async def execute_command(self, command_name: CommandType, command_data: Any) -> dict:
+        """Executes a single command, returning its result."""
+        match command_name:
+            case "set":
+                if inspect.iscoroutinefunction(self.device_connection.send):
+                    await self.device_connection.send(command_data)
+                else:
+                    # device drivers may block while talking to the hardware
+                    await asyncio.to_thread(self.device_connection.send, command_data)
+                return {"result": "success"}
+            case "set_triggers":
+                if isinstance(command_data, TriggerTemplate):
+                    # set by a fan-out, which shares a single template between the devices
+                    self.device.set_template(command_data)
+                else:
+                    self.device.set_triggers(command_data)
+                return {"result": "success"}
+            case "set_derived_sensors":
+                self.device.set_derived_sensors(command_data)
+                return {"result": "success"}
+            case "profile":
+                if self._profiler is None:
+                    self._profiler = Profiler(self.profile_max_duration)
+                # the profiler samples the event loop thread from a worker thread
+                return await asyncio.to_thread(self._profiler.profile, command_data)
+            case "fan_out":
+                return await self.fleet.fan_out(command_data)
+            case "ping":
+                return {"result": "pong",
+                        "connection": self.connection_manager.health(),
+                        "pending_uplink": len(self.pending_uplink)}
+        return {}
+
+    def polling_interval_for(self, device_connection: DeviceConnection) -> timedelta:
+        """Polling interval of a device connection, which is shortened while a level trigger
+        of the device is close to being crossed, so the crossing is reported sooner."""
+        is_near_level = getattr(self.device, 'is_near_level', None)
+        if is_near_level is not None and is_near_level(self.level_proximity):
+            return device_connection.polling_interval / self.fast_polling_factor
+        return device_connection.polling_interval
+
+    async def start(self):
+        """Start the different components of the mediator. The proxy connection and the device
+        connection are brought up concurrently, connecting to the device on a worker thread, as
+        device drivers may block while connecting."""
         logging.info("Starting the Edap gateway...")
+        self.fleet.register(self)
         self.connection_manager.start()
-        self.device_connection.start()
+        await asyncio.to_thread(self.device_connection.connect)
+        self.device_connection.start(self.polling_scheduler, self.polling_interval_for, connect=False)
+        self.polling_scheduler.start()
 
     async def stop(self):
         """Stop the different components of the mediator."""
         logging.info("Shutting down the Edap gateway...")
+        self.fleet.unregister(self)
         await self.connection_manager.stop()
+        await self.command_executor.stop()
         self.device_connection.stop()
+        if self._owns_polling_scheduler:
+            await self.polling_scheduler.stop()
+        sample_recorder = getattr(self.device, 'sample_recorder', None)
+        if sample_recorder is not None:
+            # waits for a chunk that is still being written in a worker thread
+            await asyncio.to_thread(sample_recorder.close)
+        if self.trigger_state_table is not None and self._trigger_state_row is not None:
+            self.device.attach_state_table(None)
+            self.trigger_state_table.release_row(self._trigger_state_row)
+            self._trigger_state_row = None
+            if self._owns_trigger_state_table:
+                self.trigger_state_table.close()
+                self.trigger_state_table.unlink()
@@ -0,0 +1,179 @@
+"""Shared scheduler that polls many device connections from a single task."""
+import os
+import heapq
+import asyncio
+import logging
+from random import uniform
+from contextlib import suppress
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Optional
+from datetime import timedelta
+
+if TYPE_CHECKING:
+    from src.DeviceConnection import DeviceConnection
+
+DEFAULT_MAX_CONCURRENT_POLLS = 64
+DEFAULT_POLLING_JITTER = 0.05
+DEFAULT_METRICS_INTERVAL = timedelta(seconds=60)
+
+# Successive multiples of the golden ratio (mod 1) are evenly spread over [0, 1), no matter
+# how many devices end up being added, so phases stay spread without knowing the fleet size.
+_GOLDEN_RATIO_CONJUGATE = 0.6180339887498949
+
+IntervalFunction = Callable[["DeviceConnection"], timedelta]
+
+
+class PollingScheduler:
+    """Owns the polling of all device connections of the gateway.
+    Instead of every connection waking up on its own (and all of them on the same second boundary),
+    one task keeps a heap of due times, spreads the phases of the devices across their interval,
+    adds a small jitter to every tick and limits how many polls are in flight at the same time.
+    A device has at most one poll in flight: while its previous poll is still waiting or running, its ticks are
+    skipped (and counted in `skipped_ticks`), so a hung device does not pile up polls."""
+    _event_loop: asyncio.AbstractEventLoop
+    max_concurrent_polls: int
+    jitter: float
+
+    def __init__(self, event_loop: asyncio.AbstractEventLoop):
+        self._event_loop = event_loop
+        self.max_concurrent_polls = int(os.environ.get('POLLING_MAX_CONCURRENCY',
+                                                       DEFAULT_MAX_CONCURRENT_POLLS))
+        self.jitter = float(os.environ.get('POLLING_JITTER', DEFAULT_POLLING_JITTER))
+        self.metrics_interval = DEFAULT_METRICS_INTERVAL
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_polls)
+        # (time to poll at, insertion counter, nominal tick time, device connection)
+        self._queue: list[tuple[float, int, float, "DeviceConnection"]] = []
+        self._interval_functions: dict["DeviceConnection", Optional[IntervalFunction]] = {}
+        # the poll of every device that is waiting for the semaphore or running
+        self._in_flight: dict["DeviceConnection", asyncio.Task] = {}
+        self._wakeup = asyncio.Event()
+        self._counter = 0
+
+        self._scheduler_task: Optional[asyncio.Task] = None
+        self._reset_metrics()
+
+    def add(self, device_connection: "DeviceConnection",
+            interval_function: Optional[IntervalFunction] = None):
+        """Start polling a device connection. The optional interval function is asked for the
+        interval before every tick, which allows polling faster when e.g. a trigger is near a level."""
+        if device_connection in self._interval_functions:
+            return
+        self._interval_functions[device_connection] = interval_function
+        phase = (len(self._interval_functions) * _GOLDEN_RATIO_CONJUGATE) % 1.0
+        interval = self._interval(device_connection)
+        self._push(self._event_loop.time() + phase * interval, device_connection, interval)
+
+    def remove(self, device_connection: "DeviceConnection"):
+        """Stop polling a device connection, dropping its queued tick."""
+        self._interval_functions.pop(device_connection, None)
+        # otherwise the tick would still be due after the device is added again, polling it twice as often
+        self._queue = [entry for entry in self._queue if entry[3] is not device_connection]
+        heapq.heapify(self._queue)
+
+    def _interval(self, device_connection: "DeviceConnection") -> float:
+        interval_function = self._interval_functions.get(device_connection)
+        if interval_function is None:
+            return device_connection.polling_interval.total_seconds()
+        return interval_function(device_connection).total_seconds()
+
+    def _push(self, tick: float, device_connection: "DeviceConnection", interval: float):
+        # the jitter is only applied to when the poll happens, not to the nominal tick time,
+        # so it does not accumulate into drift
+        poll_at = tick + uniform(-self.jitter, self.jitter) * interval
+        self._counter += 1
+        heapq.heappush(self._queue, (poll_at, self._counter, tick, device_connection))
+        self._wakeup.set()
+
+    def _reset_metrics(self):
+        self._ticks = 0
+        self._skipped_ticks = 0
+        self._lateness_sum = 0.0
+        self._lateness_max = 0.0
+
+    def metrics(self) -> dict:
+        """Tick lateness statistics since the last time the metrics were logged."""
+        return {
+            "devices": len(self._interval_functions),
+            "ticks": self._ticks,
+            "skipped_ticks": self._skipped_ticks,
+            "in_flight": len(self._in_flight),
+            "mean_lateness_ms": round(self._lateness_sum / self._ticks * 1000, 3) if self._ticks else 0.0,
+            "max_lateness_ms": round(self._lateness_max * 1000, 3),
+        }
+
+    async def _poll(self, device_connection: "DeviceConnection", poll_at: float):
+        async with self._semaphore:
+            lateness = max(self._event_loop.time() - poll_at, 0)
+            self._ticks += 1
+            self._lateness_sum += lateness
+            self._lateness_max = max(self._lateness_max, lateness)
+            try:
+                await device_connection.poll()
+            except Exception as ex:
+                logging.error({"message": "Error occurred while polling device",
+                               "error": repr(ex)})
+
+    def _poll_done(self, device_connection: "DeviceConnection", task: asyncio.Task):
+        if self._in_flight.get(device_connection) is task:
+            del self._in_flight[device_connection]
+
+    async def _scheduler_loop(self):
+        next_metrics_time = self._event_loop.time() + self.metrics_interval.total_seconds()
+        with suppress(asyncio.CancelledError):
+            while True:
+                now = self._event_loop.time()
+                if now >= next_metrics_time:
+                    logging.info({"message": "Polling scheduler metrics", **self.metrics()})
+                    self._reset_metrics()
+                    next_metrics_time = now + self.metrics_interval.total_seconds()
+
+                while self._queue and self._queue[0][0] <= now:
+                    poll_at, _, tick, device_connection = heapq.heappop(self._queue)
+                    if device_connection not in self._interval_functions:
+                        continue
+                    if device_connection in self._in_flight:
+                        # the previous poll has not finished yet
+                        self._skipped_ticks += 1
+                    else:
+                        task = self._event_loop.create_task(self._poll(device_connection, poll_at))
+                        self._in_flight[device_connection] = task
+                        task.add_done_callback(partial(self._poll_done, device_connection))
+
+                    interval = self._interval(device_connection)
+                    next_tick = tick + interval
+                    if next_tick <= now:
+                        # fell behind by more than a full interval, skip the missed ticks
+                        # instead of polling in a burst to catch up
+                        self._skipped_ticks += int((now - tick) // interval)
+                        next_tick = now + interval
+                    self._push(next_tick, device_connection, interval)
+
+                self._wakeup.clear()
+                timeout = next_metrics_time - now
+                if self._queue:
+                    timeout = min(timeout, self._queue[0][0] - now)
+                # not wait_for, which swallows a cancellation that arrives as the wakeup is set, so stop() would
+                # wait for the scheduler forever
+                with suppress(TimeoutError):
+                    async with asyncio.timeout(max(timeout, 0)):
+                        await self._wakeup.wait()
+
+    def start(self):
+        """Start the scheduler task."""
+        if self._scheduler_task is not None:
+            return
+        logging.info({"message": "Starting polling scheduler",
+                      "max_concurrent_polls": self.max_concurrent_polls,
+                      "jitter": self.jitter})
+        self._scheduler_task = self._event_loop.create_task(self._scheduler_loop())
+
+    async def stop(self):
+        """Stop the scheduler task and cancel the polls that are still in flight."""
+        tasks = [self._scheduler_task, *self._in_flight.values()]
+        for task in tasks:
+            if task is not None and not task.done():
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        self._scheduler_task = None
@@ -0,0 +1,143 @@
+"""On-demand sampling profiler of the live gateway process."""
+import concurrent.futures.thread
+import os
+import queue
+import selectors
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Optional
+
+DEFAULT_PROFILE_MAX_DURATION = 30.0
+DEFAULT_PROFILE_DURATION = 5.0
+DEFAULT_PROFILE_INTERVAL = 0.01
+MIN_PROFILE_INTERVAL = 0.001
+DEFAULT_PROFILE_TOP = 15
+MAX_STACK_DEPTH = 128
+
+# one profile at a time per process, also when several mediators share it
+_running = threading.Lock()
+
+# stacks whose innermost Python frame is in one of these modules are parked: waiting for a lock, a queue or
+# socket events, or idle executor workers waiting for work
+_IDLE_FILES = frozenset(module.__file__ for module in (threading, queue, selectors, concurrent.futures.thread))
+
+
+def _short_path(filename: str) -> str:
+    return '/'.join(filename.replace(os.sep, '/').split('/')[-2:])
+
+
+def _location(code) -> str:
+    return f"{_short_path(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+
+def _top(counter: Counter, samples: int, top: int) -> list[dict]:
+    return [{"function": function, "samples": count, "percent": round(100 * count / samples, 1)}
+            for function, count in counter.most_common(top)]
+
+
+class Profiler:
+    """Profiles the process it runs in for a bounded time, while the gateway keeps running.
+    - The CPU profile samples the Python stacks of all other threads every `interval` seconds from a
+      background thread, and reports the functions most often on top of a stack (self time) and on a stack
+      at all (total time). Stacks of threads that are parked (an idle event loop, executor or listener
+      thread) are only counted as idle samples, so they do not crowd out the threads doing work. Its overhead is one walk of every stack per interval, bounded by the minimum
+      interval of 1 ms and a stack depth of 128, and the CPU time of the sampler is reported.
+    - The memory profile traces allocations with tracemalloc during the profile, and reports the lines that
+      allocated the most memory that is still allocated at the end. Tracing slows down allocations, so it
+      is only on for the duration of the profile (unless it was already on).
+    Profiles are capped at `PROFILE_MAX_DURATION` seconds (default 30), and only one runs at a time."""
+    max_duration: float
+
+    def __init__(self, max_duration: Optional[float] = None):
+        self.max_duration = (max_duration if max_duration is not None
+                             else float(os.environ.get('PROFILE_MAX_DURATION', DEFAULT_PROFILE_MAX_DURATION)))
+
+    def profile(self, options: Optional[dict] = None) -> dict:
+        """Profile the process, blocking for the duration of the profile, so run it on a worker thread.
+        Options: `duration` (seconds, default 5), `interval` (seconds between stack samples, default 0.01),
+        `cpu` (default true), `memory` (default false) and `top` (entries per list, default 15)."""
+        options = options if isinstance(options, dict) else {}
+        duration = min(float(options.get('duration', DEFAULT_PROFILE_DURATION)), self.max_duration)
+        interval = max(float(options.get('interval', DEFAULT_PROFILE_INTERVAL)), MIN_PROFILE_INTERVAL)
+        top = int(options.get('top', DEFAULT_PROFILE_TOP))
+        cpu = bool(options.get('cpu', True))
+        memory = bool(options.get('memory', False))
+        if duration <= 0:
+            raise ValueError("The duration of a profile must be positive")
+        if not _running.acquire(blocking=False):
+            return {"result": "error", "error": "a profile is already running"}
+        try:
+            result: dict[str, Any] = {"result": "success", "duration": duration}
+            started_tracing = memory and not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            before = tracemalloc.take_snapshot() if memory else None
+            try:
+                if cpu:
+                    result["cpu"] = self._sample_stacks(duration, interval, top)
+                else:
+                    time.sleep(duration)
+                if before is not None:
+                    result["memory"] = self._allocations(before, top)
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+            return result
+        finally:
+            _running.release()
+
+    @staticmethod
+    def _sample_stacks(duration: float, interval: float, top: int) -> dict:
+        own_thread = threading.get_ident()
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        samples = 0
+        idle_samples = 0
+        sampler_started = time.thread_time()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                if frame.f_code.co_filename in _IDLE_FILES:
+                    idle_samples += 1
+                    continue
+                samples += 1
+                self_counts[_location(frame.f_code)] += 1
+                on_stack = set()
+                depth = 0
+                while frame is not None and depth < MAX_STACK_DEPTH:
+                    on_stack.add(_location(frame.f_code))
+                    frame = frame.f_back
+                    depth += 1
+                total_counts.update(on_stack)
+            time.sleep(interval)
+        return {
+            "interval": interval,
+            "samples": samples,
+            "idle_samples": idle_samples,
+            "sampler_cpu_s": round(time.thread_time() - sampler_started, 4),
+            "top_self": _top(self_counts, samples, top) if samples else [],
+            "top_total": _top(total_counts, samples, top) if samples else [],
+        }
+
+    @staticmethod
+    def _allocations(before: tracemalloc.Snapshot, top: int) -> dict:
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        # leave out the allocations of the profile itself
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        differences = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+        return {
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "top_allocations": [
+                {"site": f"{_short_path(difference.traceback[0].filename)}:{difference.traceback[0].lineno}",
+                 "size_diff": difference.size_diff,
+                 "count_diff": difference.count_diff}
+                for difference in differences[:top] if difference.size_diff > 0
+            ],
+        }
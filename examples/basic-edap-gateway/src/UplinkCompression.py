@@ -0,0 +1,101 @@
+"""Compression and frame size policy of the connection to the proxy."""
+import os
+from typing import Any, Literal, Optional, get_args
+
+CompressionType = Literal["none", "deflate", "zstd"]
+COMPRESSION_TYPES = get_args(CompressionType)
+
+DEFAULT_UPLINK_COMPRESSION = 'deflate'
+DEFAULT_DEFLATE_WINDOW_BITS = 15
+DEFAULT_DEFLATE_LEVEL = 6
+DEFAULT_DEFLATE_MEM_LEVEL = 5
+DEFAULT_ZSTD_LEVEL = 3
+DEFAULT_MAX_MESSAGE_SIZE = 2 ** 20
+DEFAULT_WRITE_HIGH_WATER = 2 ** 16
+
+class UplinkCompression:
+    """Compression of the messages sent to the proxy, and the limits of the connection, configured with
+    environment variables.
+    - `deflate` negotiates permessage-deflate, with the window bits, compression level and memory level
+      of the gateway side tunable. Smaller windows use less memory per connection, at some cost in ratio.
+      With context takeover (the default) every message is compressed relative to the previous ones.
+    - `zstd` sends every message as a binary message with the JSON compressed with zstd, optionally with
+      a dictionary trained on triggered samples (see `benchmarks.bench_compression`). Small messages
+      compress poorly on their own, which a dictionary of their common shape makes up for. The proxy has
+      to decompress them, with the same dictionary. Requires the zstandard package.
+    - `none` sends the JSON as is.
+    The write buffer of the connection has a high and a low water mark. Sending waits while the buffer is
+    above the high water mark, until it drained below the low water mark, which holds back the uplink:
+    triggered samples are kept in the pending uplink buffer of the mediator in the meantime."""
+    compression: CompressionType
+
+    def __init__(self, compression: Optional[str] = None):
+        compression = (compression or os.environ.get('UPLINK_COMPRESSION', DEFAULT_UPLINK_COMPRESSION)).lower()
+        if compression not in COMPRESSION_TYPES:
+            raise ValueError(f"Unknown uplink compression {compression!r}, "
+                             f"expected one of {', '.join(COMPRESSION_TYPES)}")
+        self.compression = compression
+        self.deflate_window_bits = int(os.environ.get('UPLINK_DEFLATE_WINDOW_BITS', DEFAULT_DEFLATE_WINDOW_BITS))
+        self.deflate_level = int(os.environ.get('UPLINK_DEFLATE_LEVEL', DEFAULT_DEFLATE_LEVEL))
+        self.deflate_mem_level = int(os.environ.get('UPLINK_DEFLATE_MEM_LEVEL', DEFAULT_DEFLATE_MEM_LEVEL))
+        self.deflate_context_takeover = (
+            os.environ.get('UPLINK_DEFLATE_CONTEXT_TAKEOVER', 'true').lower() == 'true')
+        self.zstd_level = int(os.environ.get('UPLINK_ZSTD_LEVEL', DEFAULT_ZSTD_LEVEL))
+        self.zstd_dictionary_path = os.environ.get('UPLINK_ZSTD_DICTIONARY')
+        self.max_message_size = int(os.environ.get('PROXY_MAX_MESSAGE_SIZE', DEFAULT_MAX_MESSAGE_SIZE))
+        self.write_high_water = int(os.environ.get('UPLINK_WRITE_HIGH_WATER', DEFAULT_WRITE_HIGH_WATER))
+        self.write_low_water = int(os.environ.get('UPLINK_WRITE_LOW_WATER', self.write_high_water // 4))
+        if not 0 <= self.write_low_water <= self.write_high_water:
+            raise ValueError("UPLINK_WRITE_LOW_WATER must be between 0 and UPLINK_WRITE_HIGH_WATER")
+
+        self._compressor: Any = None
+        if self.compression == 'zstd':
+            self._compressor = self.zstd_compressor(self.zstd_level, self.zstd_dictionary_path)
+
+    @staticmethod
+    def zstd_dictionary(path: Optional[str]) -> Any:
+        """Load a zstd dictionary, as trained by `benchmarks.bench_compression --train`."""
+        import zstandard
+        if not path:
+            return None
+        with open(path, 'rb') as dictionary_file:
+            return zstandard.ZstdCompressionDict(dictionary_file.read())
+
+    @classmethod
+    def zstd_compressor(cls, level: int, dictionary_path: Optional[str] = None) -> Any:
+        try:
+            import zstandard
+        except ImportError as ex:
+            raise ImportError("UPLINK_COMPRESSION=zstd requires zstandard, "
+                              "install it with `pip install zstandard`") from ex
+        return zstandard.ZstdCompressor(level=level, dict_data=cls.zstd_dictionary(dictionary_path))
+
+    def connect_options(self) -> dict:
+        """Keyword arguments for `websockets.client.connect`."""
+        options: dict[str, Any] = {
+            "max_size": self.max_message_size or None,
+            "write_limit": self.write_high_water,
+        }
+        if self.compression == 'deflate':
+            from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
+            options["compression"] = None
+            options["extensions"] = [ClientPerMessageDeflateFactory(
+                client_no_context_takeover=not self.deflate_context_takeover,
+                client_max_window_bits=self.deflate_window_bits,
+                compress_settings={"level": self.deflate_level, "memLevel": self.deflate_mem_level},
+            )]
+        else:
+            options["compression"] = None
+        return options
+
+    def apply_write_limits(self, connection) -> None:
+        """Set both water marks of the write buffer of a connection, websockets only sets the high one."""
+        transport = getattr(connection, 'transport', None)
+        if transport is not None:
+            transport.set_write_buffer_limits(high=self.write_high_water, low=self.write_low_water)
+
+    def encode(self, message: str) -> str | bytes:
+        """The message to send for the JSON of a payload."""
+        if self._compressor is not None:
+            return self._compressor.compress(message.encode('utf-8'))
+        return message
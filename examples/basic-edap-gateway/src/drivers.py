@@ -0,0 +1,57 @@
+"""Registry of device drivers, of which only the configured one is imported."""
+import importlib
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable
+
+if TYPE_CHECKING:
+    from edap import EdapDevice
+    from src.DeviceConnection import DeviceConnection
+
+# Drivers can be installed as packages that declare an entry point in this group,
+# pointing to a DeviceDriver or to a function returning one, e.g. in pyproject.toml:
+# [project.entry-points."edap_gateway.drivers"]
+# modbus-battery = "edap_modbus_battery:DRIVER"
+ENTRY_POINT_GROUP = 'edap_gateway.drivers'
+DEFAULT_DRIVER = 'dummy'
+
+# drivers that ship with the gateway, as "module:attribute" references so they are only imported when used
+BUILTIN_DRIVERS = {
+    'dummy': 'src.dummy.driver:DRIVER',
+}
+
+@dataclass(frozen=True)
+class DeviceDriver:
+    """A device driver, the connection to the device and the EDAP device that evaluates its samples.
+    The connection is created with the mediator and the event loop, the device with the mediator.
+    The device is passed every sample through `update_from_sample(data)`, and can implement
+    `is_near_level(margin)` to be polled faster while close to a level."""
+    connection: Callable[..., "DeviceConnection"]
+    device: Callable[..., "EdapDevice"]
+
+def _load_reference(reference: str) -> Any:
+    module_name, _, attribute = reference.partition(':')
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute) if attribute else module
+
+def available_drivers() -> list[str]:
+    """Names of the builtin drivers and the drivers installed as entry points."""
+    # only scanned when needed, as it reads the metadata of every installed package
+    from importlib.metadata import entry_points
+    return sorted(set(BUILTIN_DRIVERS) | {entry_point.name for entry_point in entry_points(group=ENTRY_POINT_GROUP)})
+
+def load_driver(name: str = DEFAULT_DRIVER) -> DeviceDriver:
+    """Import the driver with the given name, builtin or installed as an entry point."""
+    reference = BUILTIN_DRIVERS.get(name)
+    if reference is not None:
+        driver = _load_reference(reference)
+    else:
+        from importlib.metadata import entry_points
+        matches = list(entry_points(group=ENTRY_POINT_GROUP, name=name))
+        if not matches:
+            raise ValueError(f"Unknown device driver {name!r}, available drivers: {', '.join(available_drivers())}")
+        driver = matches[0].load()
+    if not isinstance(driver, DeviceDriver) and callable(driver):
+        driver = driver()
+    if not isinstance(driver, DeviceDriver):
+        raise TypeError(f"Device driver {name!r} is a {type(driver).__name__}, not a DeviceDriver")
+    return driver
@@ -5,6 +5,7 @@ import logging
 from random import random
 
 from src.DeviceConnection import DeviceConnection
+from src.utils import debug_enabled
 
 
 class DummyDeviceConnection(DeviceConnection):
@@ -26,7 +27,8 @@ class DummyDeviceConnection(DeviceConnection):
         logging.debug({"message": "Disconnecting from dummy device"})
 
     def send(self, data):
-        logging.debug({"message": "Sending data to dummy device", "data": data})
+        if debug_enabled():
+            logging.debug({"message": "Sending data to dummy device", "data": data})
         if "power" in data:
             self.power = data["power"]
 
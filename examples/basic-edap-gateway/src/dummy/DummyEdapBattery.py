@@ -1,22 +1,36 @@
 """Dummy implementation of an EDAP device."""
+import asyncio
 import logging
 from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
 from edap import EdapDevice, EdapSample, Trigger
 
+from src.utils import debug_enabled
+
+if TYPE_CHECKING:
+    from edap.replay import SampleRecorder
+
 
 class DummyEdapBattery(EdapDevice):
     """Dummy implementation of an EDAP device."""
     power_kw: float = 0.0
     soc: float = 0.50
     energy_capacity = 100.0 # kWh
-    energy: float = 0.0
     last_sample_time: datetime # when the last device sample received
     last_triggered: datetime  # when the last trigger was activated
+    latest_sample: EdapSample # the last sample evaluated, whether it activated triggers or not
+    sample_recorder: "SampleRecorder | None" # records every sample evaluated, if set
+    _recording_flush: Optional[asyncio.Future] # the chunk of recorded samples being written in a worker thread
 
     def __init__(self, mediator):
         self.mediator = mediator
         self.last_sample_time = None
         self.last_triggered = None
+        self.latest_sample = None
+        self.sample_recorder = None
+        self._recording_flush = None
+        self._levels: list[tuple[str, tuple]] = []
+        self._levels_of = None
 
         # add a default time trigger just for testing
         default_time_trigger: Trigger = Trigger(
@@ -24,34 +38,69 @@ class DummyEdapBattery(EdapDevice):
             property="time",
             delta=10
         )
-        super().__init__([default_time_trigger])
+        super().__init__([default_time_trigger], derived_sensors=[
+            {"name": "energy", "kind": "integral", "inputs": ["power"], "factor": 1 / 3600},
+            {"name": "remaining_energy", "kind": "scale", "inputs": ["soc"], "factor": self.energy_capacity},
+        ])
 
     def update_from_sample(self, data: dict):
         """Update the device state from a polling sample, and check if any triggers are activated,
         notifying the mediator if so."""
-        logging.debug({"message": "Updating device from sample", "data": data})
+        if debug_enabled():
+            logging.debug({"message": "Updating device from sample", "data": data})
         self.power_kw = data["power"]
         self.soc = data["soc"]
 
         now = datetime.now(tz=timezone.utc)
-        if self.last_sample_time:
-            since_last_sample = now - self.last_sample_time
-            self.energy += self.power_kw * since_last_sample.total_seconds() / 3600
-
         self.last_sample_time = now
 
+        # energy and remaining_energy are derived sensors, added when the triggers are evaluated
         sample = EdapSample(
             time = now,
             power = self.power_kw,
-            energy = self.energy,
-            sensors = {"soc": self.soc, "remaining_energy": self.soc * self.energy_capacity},
+            sensors = {"soc": self.soc},
         )
 
+        self.latest_sample = sample
+        if self.sample_recorder is not None:
+            self._record(sample)
         maybe_sample = self.trigger(sample)
         if maybe_sample is not None:
             self.last_triggered = now
             self.mediator.notify("trigger_activated", maybe_sample)
 
+    def _record(self, sample: EdapSample):
+        # writing a chunk of the recording to the file would block the event loop, so it is done in a worker
+        # thread, while the samples that arrive in the meantime are buffered
+        self.sample_recorder.record(sample, flush=False)
+        if self.sample_recorder.full and (self._recording_flush is None or self._recording_flush.done()):
+            self._recording_flush = asyncio.ensure_future(asyncio.to_thread(self.sample_recorder.flush))
+
+    def _level_triggers(self) -> list[tuple[str, tuple]]:
+        # the trigger list is replaced, never changed, when the triggers are set (or the template is updated),
+        # so the levels are only collected again when it was, not on every polling tick
+        triggers = self._triggers
+        if triggers is not self._levels_of:
+            self._levels = [(trigger["property"], tuple(trigger["levels"])) for trigger in triggers
+                            if trigger.get("levels") and trigger.get("property") is not None]
+            self._levels_of = triggers
+        return self._levels
+
+    def is_near_level(self, margin: float) -> bool:
+        """If the last evaluated sample, with its derived sensors, is within a relative margin of any of the
+        levels of a level trigger. Cheap enough to be asked on every polling tick."""
+        sample = self.last_evaluated
+        if sample is None:
+            return False
+        for trigger_property, levels in self._level_triggers():
+            sample_value = self._get_sample_value(sample, trigger_property)
+            if not isinstance(sample_value.value, float | int):
+                continue
+            for level in levels:
+                if abs(sample_value.value - level) <= margin * abs(level):
+                    return True
+        return False
+
     def generate_sample(self, sample: EdapSample) -> dict:
         sample["triggers"] = []
         return sample
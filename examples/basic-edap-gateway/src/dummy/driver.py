@@ -0,0 +1,6 @@
+"""Driver of the dummy battery."""
+from src.drivers import DeviceDriver
+from src.dummy.DummyDeviceConnection import DummyDeviceConnection
+from src.dummy.DummyEdapBattery import DummyEdapBattery
+
+DRIVER = DeviceDriver(connection=DummyDeviceConnection, device=DummyEdapBattery)
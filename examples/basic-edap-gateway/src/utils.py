@@ -1,30 +1,20 @@
 """Some utility functions, mostly for logging."""
 import logging
-from typing import Any
-from datetime import datetime, date, timezone
-from pythonjsonlogger import jsonlogger
+from logging.handlers import QueueHandler
+from datetime import datetime, date
 
-class CustomJsonFormatter(jsonlogger.JsonFormatter):
-    """Custom JSON Formatter class for logging"""
-    service_name: str
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler that leaves all formatting to the handlers of the queue listener.
+    The default `QueueHandler.prepare` formats the message in the calling thread, which would
+    both cost event loop time and turn dict payloads into strings before the JSON formatter
+    sees them. Payloads should not be mutated after they have been logged."""
 
-    def __init__(self, service_name: str):
-        super().__init__()
-        self.service_name = service_name
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
 
-    def add_fields(self, log_record: dict[str, Any], record: logging.LogRecord,
-                   message_dict: dict[str, Any]):
-        """Add custom fields to the log record."""
-        super().add_fields(log_record, record, message_dict)
-        log_record['service'] = self.service_name
-        if not log_record.get('timestamp'):
-            # this doesn't use record.created, so it is slightly off
-            now = datetime.now(tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-            log_record['timestamp'] = now
-        if log_record.get('level'):
-            log_record['level'] = log_record['level'].lower()
-        else:
-            log_record['level'] = record.levelname.lower()
+def debug_enabled() -> bool:
+    """If debug logging is enabled, to guard building debug payloads on the hot path."""
+    return logging.root.isEnabledFor(logging.DEBUG)
 
 def json_serialize(obj):
     """Serialize datetime and date objects to isoformat strings."""
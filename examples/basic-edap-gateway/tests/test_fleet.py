@@ -0,0 +1,51 @@
+import asyncio
+
+from src.Fleet import Fleet
+from src.Mediator import Mediator
+
+DEVICES = 4
+
+
+def _fan_out(devices: dict) -> dict:
+    return {"fan_out": {"devices": devices,
+                        "command": {"set_derived_sensors": [{"name": "double", "kind": "scale",
+                                                             "inputs": ["power"], "factor": 2}]}},
+            "time": "2024-01-01T00:00:00Z"}
+
+
+def test_concurrent_fan_outs_from_different_devices() -> None:
+    async def run() -> list:
+        loop = asyncio.get_running_loop()
+        fleet = Fleet()
+        # a fan-out that waits for another one is reported as failed after this long
+        fleet.timeout = 2.0
+        mediators = [Mediator(loop, device_id=f"device-{i}", fleet=fleet, tags=["site"]) for i in range(DEVICES)]
+        responses: list = []
+
+        async def send(response: dict) -> bool:
+            responses.append(response)
+            return True
+
+        for mediator in mediators:
+            fleet.register(mediator)
+            mediator.command_executor._send_response = send
+        try:
+            # every device receives a fan-out to all of them at the same moment
+            for mediator in mediators:
+                mediator.handle_commands(_fan_out({"tags": ["site"]}))
+            while len(responses) < DEVICES:
+                await asyncio.sleep(0.01)
+        finally:
+            for mediator in mediators:
+                await mediator.command_executor.stop()
+                await mediator.polling_scheduler.stop()
+        return responses
+
+    started = asyncio.run(asyncio.wait_for(run(), 10))
+    assert len(started) == DEVICES
+    for response in started:
+        result = response["result"]
+        assert result["result"] == "success", result
+        assert result["succeeded"] == DEVICES
+        # the device that received the fan-out queued its own command like every other device
+        assert all("queue_duration" in device for device in result["responses"].values())
@@ -0,0 +1,27 @@
+import threading
+import time
+
+from src.Profiler import Profiler
+
+
+def _busy(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_parked_threads_are_left_out() -> None:
+    stop = threading.Event()
+    threads = [threading.Thread(target=_busy, args=(stop,))] + [
+        threading.Thread(target=stop.wait) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        cpu = Profiler(max_duration=1).profile({"duration": 0.3, "interval": 0.005})["cpu"]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert cpu["idle_samples"] > 0
+    # only the busy thread is sampled, not the threads waiting for the event
+    assert cpu["top_self"][0]["function"].endswith("(_busy)")
+    assert not any("threading.py" in entry["function"] for entry in cpu["top_self"])
@@ -0,0 +1,36 @@
+import asyncio
+
+from src.Mediator import Mediator
+
+
+def test_schema_is_resent_until_acknowledged() -> None:
+    async def run() -> list:
+        mediator = Mediator(asyncio.get_running_loop(), device_id="device")
+        mediator.uplink_schema_encoding = True
+        mediator.uplink_schema_acknowledged = True
+        sent: list = []
+
+        async def send(data: dict) -> bool:
+            sent.append(data)
+            return True
+
+        mediator.connection_manager.send_to_proxy = send
+        mediator.connection_manager.is_connected = lambda: True
+        try:
+            for power in (1, 2):
+                mediator.pending_uplink.append({"time": "2024-01-01T00:00:00Z", "triggers": [],
+                                                "sensors": {"power": power}})
+                await mediator.flush_uplink()
+            mediator.handle_commands({"schema_ack": mediator.device.schema.version})
+            mediator.pending_uplink.append({"time": "2024-01-01T00:00:01Z", "triggers": [],
+                                            "sensors": {"power": 3}})
+            await mediator.flush_uplink()
+        finally:
+            await mediator.command_executor.stop()
+            await mediator.polling_scheduler.stop()
+        return sent
+
+    sent = asyncio.run(asyncio.wait_for(run(), 10))
+    # a proxy that missed the schema gets it again with the next sample, until it acknowledged it
+    assert ["schema" in message and isinstance(message["schema"], dict) for message in sent] == \
+        [True, False, True, False, False]
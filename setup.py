@@ -6,5 +6,9 @@ setup(
     version='0.1',
     description='Implementation of EDAP',
     author='Emulate Energy',
-    packages=['edap']
+    packages=['edap'],
+    extras_require={
+        'parquet': ['pyarrow'],
+        'whatif': ['numpy'],
+    }
 )
\ No newline at end of file
@@ -0,0 +1,76 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from edap.codec import DeltaDecoder, DeltaEncoder
+
+
+def _samples(count: int) -> list:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    samples = []
+    for i in range(count):
+        sensors = {f"temp_{n}": 20.0 for n in range(20)}
+        sensors["soc"] = round(i / count, 3)
+        if i % 4 == 0:
+            sensors["alarm"] = True
+        samples.append({
+            "time": start + timedelta(seconds=i),
+            "power": 5.0 if i < count // 2 else 6.0,
+            "energy": None,
+            "triggers": [f"trigger_{i % 3}"],
+            "sensors": sensors,
+        })
+    return samples
+
+
+def test_delta_frames_only_contain_changes() -> None:
+    encoder = DeltaEncoder()
+    first, second = _samples(10)[:2]
+    keyframe = encoder.encode(first)
+    assert keyframe["seq"] == 1
+    assert "base" not in keyframe
+    assert keyframe["sensors"] == first["sensors"]
+
+    delta = encoder.encode(second)
+    assert delta == {
+        "seq": 2,
+        "base": 1,
+        "triggers": ["trigger_1"],
+        "time": second["time"],
+        "sensors": {"soc": second["sensors"]["soc"]},
+        "removed_sensors": ["alarm"],
+    }
+
+
+def test_round_trip_with_keyframes() -> None:
+    samples = _samples(50)
+    encoder = DeltaEncoder(keyframe_interval=10)
+    decoder = DeltaDecoder()
+    frames = [encoder.encode(sample) for sample in samples]
+    assert [frame["seq"] for frame in frames if "base" not in frame] == [1, 12, 23, 34, 45]
+    assert [decoder.decode(frame) for frame in frames] == samples
+
+
+def test_acknowledged_deltas_are_relative_to_the_last_acknowledged_sample() -> None:
+    samples = _samples(6)
+    encoder = DeltaEncoder(acknowledged=True)
+    decoder = DeltaDecoder()
+
+    frames = [encoder.encode(samples[0]), encoder.encode(samples[1])]
+    assert all("base" not in frame for frame in frames)
+    encoder.acknowledge(2)
+    frames += [encoder.encode(sample) for sample in samples[2:5]]
+    assert [frame.get("base") for frame in frames[2:]] == [2, 2, 2]
+    encoder.acknowledge(4)
+    frames.append(encoder.encode(samples[5]))
+    assert frames[-1]["base"] == 4
+    assert [decoder.decode(frame) for frame in frames] == samples
+
+
+def test_decoder_requires_known_base() -> None:
+    encoder = DeltaEncoder()
+    frames = [encoder.encode(sample) for sample in _samples(3)]
+    with pytest.raises(KeyError):
+        DeltaDecoder().decode(frames[2])
+    encoder.request_keyframe()
+    assert "base" not in encoder.encode(_samples(1)[0])
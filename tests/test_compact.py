@@ -0,0 +1,61 @@
+import copy
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from edap.compact import CompactTrigger, compact_triggers
+from edap.edap import EdapDevice
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _triggers() -> list:
+    return json.loads(json.dumps([
+        {"id": "time", "property": "time", "delta": 60},
+        {"id": "power", "property": "power", "delta": 0.5, "sensors": ["soc"]},
+        {"id": "soc", "property": "soc", "levels": [0.2, 0.5, 0.8], "value": 0.4},
+        {"id": "missing", "property": "temperature", "tolerance": 1},
+        {"condition": "charging", "property": "power", "greater": 0},
+        {"id": "energy", "property": "energy", "delta": 1, "conditions": ["charging"]},
+    ]))
+
+
+class CompactDevice(EdapDevice):
+    compact_storage = True
+
+
+def test_compact_triggers_share_definitions() -> None:
+    first, second = compact_triggers(_triggers()), compact_triggers(_triggers())
+    assert all(a._definition is b._definition for a, b in zip(first, second))
+    assert first[2]["levels"] == (0.2, 0.5, 0.8)
+    assert first[2]["value"] == 0.4 and "value" not in first[0]
+    first[0]["value"] = START
+    assert "value" not in second[0]
+
+
+def test_compact_trigger_reads_like_a_dict() -> None:
+    trigger = CompactTrigger({"id": "power", "property": "power", "delta": 0.5, "value": 3})
+    assert dict(trigger) == {"id": "power", "property": "power", "delta": 0.5, "value": 3}
+    assert len(trigger) == 4 and trigger.get("levels") is None and trigger.get("slope", 0) == 0
+    assert copy.deepcopy(trigger) == trigger
+    with pytest.raises(TypeError):
+        trigger["delta"] = 1  # type: ignore[index]
+    with pytest.raises(KeyError):
+        trigger["slope"]  # pylint: disable=pointless-statement
+
+
+def test_compact_storage_evaluates_like_dicts() -> None:
+    device, compact = EdapDevice(_triggers()), CompactDevice(_triggers())
+    assert all(isinstance(trigger, CompactTrigger) for trigger in compact.get_triggers())
+    for step in range(300):
+        sample = {
+            "time": START + timedelta(seconds=step),
+            "power": float(step % 11 - 5),
+            "energy": step * 0.1,
+            "sensors": {"soc": (step % 50) / 50, **({"temperature": 20} if step % 40 < 30 else {})},
+        }
+        assert device.trigger(sample) == compact.trigger(sample)
+    assert [dict(trigger) for trigger in compact.get_triggers()] == [
+        {key: tuple(value) if isinstance(value, list) else value for key, value in trigger.items()}
+        for trigger in device.get_triggers()]
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from edap.derived import DerivedSensors, _Stateless
+from edap.edap import EdapDevice
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _sample(second: float, power: float | None = None, **sensors) -> dict:
+    sample = {"time": START + timedelta(seconds=second), "sensors": sensors}
+    if power is not None:
+        sample["power"] = power
+    return sample
+
+
+def test_integral_is_trapezoidal_and_scaled() -> None:
+    derived = DerivedSensors([{"name": "energy", "kind": "integral", "inputs": ["power"], "factor": 1 / 3600}])
+    assert derived.apply(_sample(0, 10))["energy"] == 0
+    assert derived.apply(_sample(3600, 20))["energy"] == pytest.approx(15)
+    # a sample without the input keeps the integral, the gap is interpolated
+    assert derived.apply(_sample(5400))["energy"] == pytest.approx(15)
+    assert derived.apply(_sample(7200, 20))["energy"] == pytest.approx(35)
+
+
+def test_difference_ratio_and_scale() -> None:
+    derived = DerivedSensors([
+        {"name": "net", "kind": "difference", "inputs": ["production", "consumption"]},
+        {"name": "change", "kind": "difference", "inputs": ["soc"]},
+        {"name": "share", "kind": "ratio", "inputs": ["production", "consumption"]},
+        {"name": "remaining_energy", "kind": "scale", "inputs": ["soc"], "factor": 100, "offset": -5},
+    ])
+    first = derived.apply(_sample(0, production=6, consumption=4, soc=0.5))["sensors"]
+    assert first == {"production": 6, "consumption": 4, "soc": 0.5, "net": 2, "share": 1.5, "remaining_energy": 45}
+    second = derived.apply(_sample(1, production=6, consumption=0, soc=0.25))["sensors"]
+    assert second["net"] == 6 and second["change"] == -0.25 and second["remaining_energy"] == 20
+    assert "share" not in second
+
+
+def test_moving_average_window() -> None:
+    derived = DerivedSensors([{"name": "power_avg", "kind": "moving_average", "inputs": ["power"], "window": 3}])
+    averages = [derived.apply(_sample(second, power))["sensors"]["power_avg"]
+                for second, power in enumerate([3, 6, 9, 12, 15])]
+    assert averages == [3, 4.5, 6, 9, 12]
+
+
+def test_derived_sensors_are_computed_in_dependency_order() -> None:
+    derived = DerivedSensors([
+        {"name": "energy_avg", "kind": "moving_average", "inputs": ["energy"], "window": 2},
+        {"name": "energy", "kind": "integral", "inputs": ["power"]},
+    ])
+    assert derived.names == ["energy", "energy_avg"]
+    derived.apply(_sample(0, 1))
+    assert derived.apply(_sample(2, 1))["sensors"]["energy_avg"] == 1
+
+
+def test_stateless_derived_sensors_are_only_recomputed_when_inputs_change(monkeypatch) -> None:
+    derived = DerivedSensors([{"name": "double", "kind": "scale", "inputs": ["soc"], "factor": 2}])
+    stage_type = type(derived._stages[0])
+    calls = []
+    compute = stage_type.compute
+    monkeypatch.setattr(stage_type, "compute", lambda stage, values: calls.append(values) or compute(stage, values))
+    for second in range(5):
+        derived.apply(_sample(second, soc=0.5))
+    derived.apply(_sample(5, soc=0.6))
+    assert calls == [[0.5], [0.6]]
+
+
+@pytest.mark.parametrize("definitions", [
+    [{"name": "x", "kind": "unknown", "inputs": ["power"]}],
+    [{"name": "x", "kind": "ratio", "inputs": ["power"]}],
+    [{"kind": "scale", "inputs": ["power"]}],
+    [{"name": "x", "kind": "scale", "inputs": ["power"]}, {"name": "x", "kind": "scale", "inputs": ["soc"]}],
+    [{"name": "x", "kind": "scale", "inputs": ["y"]}, {"name": "y", "kind": "scale", "inputs": ["x"]}],
+    [{"name": "x", "kind": "moving_average", "inputs": ["power"], "window": 0}],
+])
+def test_invalid_definitions_are_rejected(definitions) -> None:
+    with pytest.raises(ValueError):
+        DerivedSensors(definitions)
+
+
+def test_device_triggers_on_derived_sensors() -> None:
+    device = EdapDevice(
+        [{"id": "energy", "property": "energy", "delta": 0.5, "sensors": ["remaining_energy"]}],
+        derived_sensors=[
+            {"name": "energy", "kind": "integral", "inputs": ["power"], "factor": 1 / 3600},
+            {"name": "remaining_energy", "kind": "scale", "inputs": ["soc"], "factor": 100},
+        ],
+    )
+    assert "energy" in device.schema and "remaining_energy" in device.schema
+    sample = _sample(0, 3600, soc=0.5)
+    first = device.trigger(sample)
+    assert first is not None and first["energy"] == 0 and first["sensors"] == {"remaining_energy": 50}
+    assert "energy" not in sample
+    assert device.trigger(_sample(0.4, 3600, soc=0.5)) is None
+    second = device.trigger(_sample(1, 3600, soc=0.4))
+    assert second is not None and second["energy"] == pytest.approx(1)
+    assert second["sensors"]["remaining_energy"] == pytest.approx(40)
+    # the last evaluated sample has the derived sensors, also when it activated no trigger
+    assert device.trigger(_sample(1, 0, soc=0.4)) is None
+    assert device.last_evaluated["sensors"]["remaining_energy"] == pytest.approx(40)
+
+
+def test_incomplete_stages_can_not_be_instantiated() -> None:
+    class Incomplete(_Stateless):
+        __slots__ = ()
+
+    with pytest.raises(TypeError):
+        Incomplete({"name": "incomplete", "inputs": ["power"]})
@@ -0,0 +1,89 @@
+import pytest
+
+from edap.edap import EdapDevice
+from edap.expr import ExpressionError, compile_expression
+
+
+@pytest.mark.parametrize("expression, sample, expected", [
+    ("power > 5 and soc < 0.2 or mode in {'eco', 'off'}", {"power": 6, "sensors": {"soc": 0.1}}, True),
+    ("power > 5 and soc < 0.2 or mode in {'eco', 'off'}", {"power": 6, "sensors": {"soc": 0.3}}, False),
+    ("power > 5 and soc < 0.2 or mode in {'eco', 'off'}", {"sensors": {"mode": "eco"}}, True),
+    ("not (power >= 10)", {"power": 3}, True),
+    ("0 < power <= 10", {"power": 10}, True),
+    ("0 < power <= 10", {"power": 11}, False),
+    ("power * 2 - 1 == 9", {"power": 5}, True),
+    ("-power > 0", {"power": -1}, True),
+    ("mode not in ['a', \"b\"]", {"sensors": {"mode": "c"}}, True),
+    ("active == true", {"sensors": {"active": True}}, True),
+    ("`state of charge` < .5", {"sensors": {"state of charge": 0.25}}, True),
+    ("power == none", {}, True),
+    ("power > 5", {}, False),
+    ("power / 0 > 1", {"power": 5}, False),
+    ("mode > 5", {"sensors": {"mode": "eco"}}, False),
+])
+def test_expression_evaluation(expression: str, sample: dict, expected: bool) -> None:
+    assert compile_expression(expression).evaluate(sample) is expected
+
+
+def test_expression_short_circuits() -> None:
+    calls = []
+
+    class Sample(dict):
+        def __contains__(self, key):
+            calls.append(key)
+            return super().__contains__(key)
+
+    compile_expression("power > 5 or soc < 0.2").evaluate(Sample(power=6))
+    assert calls == ["power"]
+
+
+def test_expression_names() -> None:
+    assert compile_expression("power > 5 and (soc < 0.2 or mode in {'eco'})").names == {"power", "soc", "mode"}
+
+
+@pytest.mark.parametrize("expression", ["power >", "power > 5 and", "(power > 5", "power ? 5", "__import__('os')", "power not 5"])
+def test_invalid_expressions(expression: str) -> None:
+    with pytest.raises(ExpressionError):
+        compile_expression(expression)
+
+
+def test_set_triggers_rejects_invalid_expression() -> None:
+    with pytest.raises(ExpressionError):
+        EdapDevice([{"id": "bad", "expr": "power >"}])
+
+
+def test_expression_gates_trigger() -> None:
+    edap_device = EdapDevice([{"id": "power", "property": "power", "delta": 1, "expr": "soc < 0.2"}])
+    assert edap_device.trigger({"power": 10, "sensors": {"soc": 0.5}}) is None
+    assert edap_device.trigger({"power": 10, "sensors": {"soc": 0.1}})["triggers"] == ["power"]
+    assert edap_device.trigger({"power": 10.5, "sensors": {"soc": 0.1}}) is None
+    assert edap_device.trigger({"power": 20, "sensors": {"soc": 0.5}}) is None
+
+
+def test_expression_only_trigger_replaces_helper_triggers() -> None:
+    edap_device = EdapDevice([{"id": "alarm", "expr": "power > 5 and soc < 0.2 or mode in {'fault'}"}])
+    assert edap_device.trigger({"power": 6, "sensors": {"soc": 0.5}}) is None
+    assert edap_device.trigger({"power": 6, "sensors": {"soc": 0.1}})["triggers"] == ["alarm"]
+    assert edap_device.trigger({"power": 0, "sensors": {"mode": "fault"}})["triggers"] == ["alarm"]
+
+
+def test_expression_condition() -> None:
+    edap_device = EdapDevice([
+        {"condition": "low_soc", "expr": "soc < 0.2"},
+        {"id": "power", "property": "power", "delta": 1, "conditions": ["low_soc"]},
+    ])
+    assert edap_device.trigger({"power": 10, "sensors": {"soc": 0.5}}) is None
+    assert edap_device.trigger({"power": 10, "sensors": {"soc": 0.1}})["triggers"] == ["power"]
+
+
+def test_deeply_nested_expression_is_an_expression_error() -> None:
+    with pytest.raises(ExpressionError):
+        compile_expression("(" * 5000 + "power" + ")" * 5000)
+
+
+def test_device_evaluates_its_compiled_expressions(monkeypatch) -> None:
+    edap_device = EdapDevice([{"id": "alarm", "expr": "power > 5"}])
+    # expressions are compiled once when the triggers are set, not for every sample
+    monkeypatch.setattr("edap.edap.compile_expression", None)
+    assert edap_device.trigger({"power": 6, "sensors": {}})["triggers"] == ["alarm"]
+    assert edap_device.trigger({"power": 7, "sensors": {}})["triggers"] == ["alarm"]
@@ -0,0 +1,132 @@
+import copy
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from edap.edap import EdapDevice
+from edap.fingerprint import TriggerPlan
+from edap.template import TriggerTemplate
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+TRIGGERS = [
+    {"id": "time", "property": "time", "delta": 30},
+    {"id": "power", "property": "power", "delta": 2, "sensors": ["soc"]},
+    {"id": "soc", "property": "soc", "levels": [0.2, 0.5, 0.8], "value": 0.4},
+    {"id": "missing", "property": "temperature", "tolerance": 1},
+    {"condition": "charging", "property": "power", "greater": 0},
+    {"condition": "late", "expr": "time > 0"},
+    {"id": "energy", "property": "energy", "delta": 1, "conditions": ["charging"]},
+    {"id": "late_power", "property": "power", "delta": 100, "conditions": ["late"]},
+    {"id": "trajectory", "property": "power", "deviation": 1},
+    {"id": "mode", "property": "mode", "in": ["eco"], "condition": "eco"},
+    {"id": "expr", "expr": "soc > 0.9 and power < 0"},
+]
+
+
+class FullDevice(EdapDevice):
+    short_circuit = False
+
+
+def _samples(count: int, seed: int) -> list[dict]:
+    """Samples that repeat for a while, as from an idle device, with the time always moving on."""
+    rng = random.Random(seed)
+    samples: list[dict] = []
+    values: dict = {}
+    for step in range(count):
+        if not values or rng.random() < 0.2:
+            values = {
+                "power": rng.choice([-3, 0, 0.0, 1, 5, None, True]),
+                "energy": rng.choice([0.0, 0.5, 2.0]),
+                "sensors": {
+                    "soc": rng.choice([0.1, 0.4, 0.6, 0.95]),
+                    **({"temperature": 20} if rng.random() < 0.7 else {}),
+                    **({"mode": rng.choice(["eco", "boost"])} if rng.random() < 0.5 else {}),
+                },
+            }
+        samples.append({"time": START + timedelta(seconds=step * rng.choice([1, 7, 40])), **copy.deepcopy(values)})
+    return samples
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_short_circuit_matches_full_evaluation(seed: int) -> None:
+    device, full = EdapDevice(copy.deepcopy(TRIGGERS)), FullDevice(copy.deepcopy(TRIGGERS))
+    for sample in _samples(500, seed):
+        assert device.trigger(copy.deepcopy(sample)) == full.trigger(sample)
+        assert device.get_triggers() == full.get_triggers()
+    assert device.short_circuited > 0
+    assert full.short_circuited == 0
+
+
+def test_unchanged_samples_only_evaluate_time_dependent_triggers() -> None:
+    device = EdapDevice([
+        {"id": "power", "property": "power", "delta": 2},
+        {"id": "time", "property": "time", "delta": 60},
+    ])
+    sample = {"time": START, "power": 1.0, "sensors": {}}
+    assert device.trigger(sample)["triggers"] == ["power", "time"]
+    # the previous sample activated triggers, so this one is evaluated in full
+    assert device.trigger({**sample, "time": START + timedelta(seconds=1)}) is None
+    assert device.short_circuited == 0
+    assert device.trigger({**sample, "time": START + timedelta(seconds=2)}) is None
+    assert device.short_circuited == 1
+    assert device.trigger({**sample, "time": START + timedelta(seconds=60)})["triggers"] == ["time"]
+    assert device.short_circuited == 2
+    assert device.trigger({**sample, "power": 4.0, "time": START + timedelta(seconds=61)})["triggers"] == ["power"]
+    assert device.short_circuited == 2
+
+
+def test_values_of_another_type_are_not_unchanged() -> None:
+    device = EdapDevice([{"id": "on", "property": "state", "in": [1]}])
+    assert device.trigger({"time": START, "sensors": {"state": 0}}) is None
+    assert device.trigger({"time": START, "sensors": {"state": False}}) is None
+    assert device.short_circuited == 0
+    assert device.trigger({"time": START, "sensors": {"state": False}}) is None
+    assert device.short_circuited == 1
+
+
+def test_new_triggers_are_evaluated_in_full() -> None:
+    device = EdapDevice([{"id": "power", "property": "power", "delta": 2, "value": 0}])
+    sample = {"time": START, "power": 1.0, "sensors": {}}
+    assert device.trigger(sample) is None
+    device.set_triggers([{"id": "power", "property": "power", "delta": 0.5, "value": 0}])
+    assert device.trigger(sample)["triggers"] == ["power"]
+
+    template = TriggerTemplate([{"id": "power", "property": "power", "delta": 2, "value": 0}])
+    device.set_template(template)
+    assert device.trigger(sample) is None
+    template.update([{"id": "soc", "property": "soc", "delta": 0}])
+    assert device.trigger({**sample, "sensors": {"soc": 0.5}})["triggers"] == ["soc"]
+
+
+def test_plan() -> None:
+    plan = TriggerPlan(copy.deepcopy(TRIGGERS))
+    assert plan.names == ("power", "soc", "temperature", "energy", "mode")
+    assert [trigger.get("id", trigger.get("condition")) for trigger in plan.recheck] == [
+        "time", "late", "late_power", "trajectory",
+    ]
+    assert TriggerPlan([{"id": "power", "property": "power", "delta": 2}]).recheck == []
+    # a condition cycle through a time dependent trigger
+    plan = TriggerPlan([
+        {"id": "a", "condition": "a", "property": "power", "delta": 1, "conditions": ["b"]},
+        {"id": "b", "condition": "b", "property": "power", "delta": 1, "conditions": ["a", "c"]},
+        {"condition": "c", "property": "time", "delta": 1},
+    ])
+    assert [trigger["condition"] for trigger in plan.recheck] == ["a", "b", "c"]
+
+
+def test_setting_the_same_list_again_is_evaluated_in_full() -> None:
+    triggers: list = [{"id": "power", "property": "power", "delta": 2, "value": 1.0}]
+    device = EdapDevice(triggers)
+    sample = {"time": START, "power": 1.0, "sensors": {"soc": 0.5}}
+    assert device.trigger(sample) is None
+    triggers.append({"id": "soc", "property": "soc", "delta": 0})
+    device.set_triggers(triggers)
+    assert device.trigger(sample)["triggers"] == ["soc"]
+
+    device.set_derived_sensors([{"name": "double", "kind": "scale", "inputs": ["power"], "factor": 2}])
+    device.set_triggers([{"id": "double", "property": "double", "delta": 0, "value": 2.0}])
+    assert device.trigger(sample) is None
+    device.set_derived_sensors([{"name": "double", "kind": "scale", "inputs": ["power"], "factor": 3}])
+    assert device.trigger(sample)["triggers"] == ["double"]
@@ -0,0 +1,61 @@
+import logging
+
+from edap.logs import RateLimitFilter
+
+
+def _record(message, level: int = logging.ERROR) -> logging.LogRecord:
+    return logging.LogRecord("edap.test", level, __file__, 1, message, None, None)
+
+
+def test_rate_limit_filter_drops_repeated_records() -> None:
+    rate_limit = RateLimitFilter(interval=60.0, burst=2)
+    results = [rate_limit.filter(_record("Same error %s")) for _ in range(5)]
+    assert results == [True, True, False, False, False]
+
+
+def test_rate_limit_filter_keys_dict_payloads_on_message() -> None:
+    rate_limit = RateLimitFilter(interval=60.0)
+    assert rate_limit.filter(_record({"message": "Could not send", "payload": 1}))
+    assert not rate_limit.filter(_record({"message": "Could not send", "payload": 2}))
+    assert rate_limit.filter(_record({"message": "Could not connect"}))
+
+
+def test_rate_limit_filter_ignores_records_below_level() -> None:
+    rate_limit = RateLimitFilter(interval=60.0)
+    assert all(rate_limit.filter(_record("debug payload", logging.DEBUG)) for _ in range(3))
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_rate_limit_filter_reports_suppressed_count(monkeypatch) -> None:
+    clock = _Clock()
+    monkeypatch.setattr("edap.logs.time.monotonic", clock)
+    rate_limit = RateLimitFilter(interval=60.0)
+    assert rate_limit.filter(_record("error"))
+    assert not rate_limit.filter(_record("error"))
+    clock.now += 90.0
+    record = _record("error")
+    assert rate_limit.filter(record)
+    assert record.suppressed == 1
+
+
+def test_rate_limit_filter_forgets_expired_kinds(monkeypatch) -> None:
+    clock = _Clock()
+    monkeypatch.setattr("edap.logs.time.monotonic", clock)
+    rate_limit = RateLimitFilter(interval=60.0)
+    for i in range(100):
+        assert rate_limit.filter(_record(f"error {i}"))
+    assert not rate_limit.filter(_record("error 0"))
+    clock.now += 61.0
+    assert rate_limit.filter(_record("another error"))
+    # the suppressed count of "error 0" is kept for another interval
+    assert len(rate_limit._windows) == 2
+    clock.now += 61.0
+    assert rate_limit.filter(_record("another error"))
+    assert len(rate_limit._windows) == 1
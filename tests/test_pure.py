@@ -0,0 +1,78 @@
+import copy
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from edap.edap import EdapDevice
+from edap.pure import evaluate, initial_state, materialize
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+TRIGGERS = [
+    {"id": "time", "property": "time", "delta": 30},
+    {"id": "power", "property": "power", "delta": 2, "sensors": ["soc"]},
+    {"id": "soc", "property": "soc", "levels": [0.2, 0.5, 0.8], "value": 0.4},
+    {"id": "missing", "property": "temperature", "tolerance": 1},
+    {"condition": "charging", "property": "power", "greater": 0},
+    {"id": "energy", "property": "energy", "delta": 1, "conditions": ["charging"]},
+    {"id": "trajectory", "property": "power", "deviation": 1},
+]
+
+
+def _samples(count: int) -> list[dict]:
+    return [{
+        "time": START + timedelta(seconds=step),
+        "power": float(step % 17 - 8),
+        "energy": step * 0.1,
+        "sensors": {"soc": (step % 50) / 50, **({"temperature": 20} if step % 40 < 30 else {})},
+    } for step in range(count)]
+
+
+def test_evaluate_matches_apply_trigger_without_changing_its_inputs() -> None:
+    triggers = copy.deepcopy(TRIGGERS)
+    state = initial_state(triggers)
+    mutated = copy.deepcopy(TRIGGERS)
+    for sample in _samples(300):
+        sample_copy = copy.deepcopy(sample)
+        triggered, state = evaluate(sample, triggers, state)
+        assert triggered == EdapDevice.apply_trigger(sample, mutated)
+        assert sample == sample_copy
+    assert triggers == TRIGGERS
+    assert materialize(triggers, state) == mutated
+
+
+def test_unchanged_state_is_shared() -> None:
+    state = initial_state(TRIGGERS)
+    sample = _samples(1)[0]
+    triggered, first = evaluate(sample, TRIGGERS, state)
+    assert triggered is not None
+    # nothing changed, so the state is returned as is
+    triggered, second = evaluate(sample, TRIGGERS, first)
+    assert triggered is None and second is first
+    # only the power triggers are activated, every other entry is shared
+    changed = dict(sample, power=sample["power"] + 5)
+    triggered, third = evaluate(changed, TRIGGERS, second)
+    assert triggered is not None and triggered["triggers"] == ["power", "trajectory"]
+    assert [entry is previous for entry, previous in zip(third, second)] == [True, False, True, True, True, True, False]
+    assert third[1]["value"] == changed["power"]
+
+
+def test_state_can_be_rolled_back() -> None:
+    samples = _samples(100)
+    state = initial_state(TRIGGERS)
+    for sample in samples[:50]:
+        _, state = evaluate(sample, TRIGGERS, state)
+    checkpoint = state
+    for sample in samples[50:]:
+        _, state = evaluate(sample, TRIGGERS, state)
+    # evaluating again from the checkpoint is as if the later samples were never evaluated
+    mutated = materialize(TRIGGERS, checkpoint)
+    state = checkpoint
+    for sample in samples[50:]:
+        triggered, state = evaluate(sample, TRIGGERS, state)
+        assert triggered == EdapDevice.apply_trigger(sample, mutated)
+
+
+def test_state_must_match_the_triggers() -> None:
+    with pytest.raises(ValueError):
+        evaluate(_samples(1)[0], TRIGGERS, initial_state(TRIGGERS[:2]))
@@ -0,0 +1,198 @@
+import logging
+from contextlib import contextmanager
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+
+import hypothesis
+import pytest
+from hypothesis import strategies as st
+
+from edap.compact import STATE_KEYS
+from edap.reference import ENGINES, ReferenceEngine
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+PROPERTIES = ["power", "energy", "soc", "mode", "temperature"]
+CONDITIONS = ["c0", "c1", "c2"]
+EXPRESSIONS = ["power > 1", "soc < 0.5 and mode == \"eco\"", "power + energy >= 2", "time > 0", "temperature != none"]
+KINDS = ["time", "delta", "levels", "tolerance", "limits", "deviation", "expr"]
+# the triggers edap.whatif can sweep
+SWEEPABLE_KINDS = ["time", "delta", "levels"]
+values = st.sampled_from([None, 0, 0.0, 1, -1.5, 3, 20, 0.25, 0.9, True, False, "eco", "boost"])
+
+
+@st.composite
+def _trigger(draw, condition: str | None = None, sweepable: bool = False) -> dict:
+    trigger: dict = {}
+    if condition is not None:
+        trigger["condition"] = condition
+    if (condition is None and not sweepable) or draw(st.booleans()):
+        trigger["id"] = draw(st.sampled_from(["a", "b", "c", None]))
+    kind = draw(st.sampled_from(SWEEPABLE_KINDS if sweepable else KINDS))
+    if kind == "time":
+        trigger["property"] = "time"
+        trigger["delta"] = draw(st.sampled_from([None, 0, 5, 60, "30", "x"]))
+        if draw(st.booleans()):
+            trigger["value"] = draw(st.sampled_from([START, START.isoformat(), START.timestamp(), "x", None]))
+    else:
+        trigger["property"] = draw(st.sampled_from(PROPERTIES))
+        if kind == "delta":
+            trigger["delta"] = draw(st.sampled_from([None, 0, 0.5, 2, True]))
+        elif kind == "levels":
+            trigger["levels"] = draw(st.lists(st.sampled_from([0, 0.2, 0.5, 1, 10]), max_size=3))
+        elif kind == "tolerance":
+            trigger["tolerance"] = draw(st.sampled_from([None, 0, 1]))
+        elif kind == "limits":
+            trigger.setdefault("condition", draw(st.sampled_from(CONDITIONS)))
+            limits = draw(st.sampled_from(["greater", "less", "in"]))
+            trigger[limits] = draw(st.lists(values, max_size=3)) if limits == "in" else draw(st.sampled_from([0, 1, 5]))
+        elif kind == "deviation":
+            trigger["deviation"] = draw(st.sampled_from([0, 0.5, 2]))
+        else:
+            trigger["expr"] = draw(st.sampled_from(EXPRESSIONS))
+            if draw(st.booleans()):
+                del trigger["property"]
+        if draw(st.booleans()):
+            trigger["value"] = draw(values)
+    if condition is None and not sweepable and draw(st.booleans()):
+        trigger["conditions"] = draw(st.lists(st.sampled_from(CONDITIONS), max_size=2))
+    if draw(st.booleans()):
+        trigger["discard_sample"] = draw(st.booleans())
+    if draw(st.booleans()):
+        trigger["sensors"] = draw(st.lists(st.sampled_from(PROPERTIES), max_size=2))
+    return trigger
+
+
+@st.composite
+def _triggers(draw, sweepable: bool = False) -> list[dict]:
+    # conditions do not have conditions of their own, so they can not form a cycle
+    conditions = [] if sweepable else [
+        draw(_trigger(condition)) for condition in draw(st.lists(st.sampled_from(CONDITIONS), max_size=3))]
+    triggers = draw(st.lists(_trigger(sweepable=sweepable), min_size=1, max_size=6)) + conditions
+    return draw(st.permutations(triggers))
+
+
+@st.composite
+def _samples(draw) -> list[dict]:
+    """Samples with the time moving on, and their values sometimes repeated, as from an idle device."""
+    samples: list[dict] = []
+    time = START
+    for _ in range(draw(st.integers(1, 30))):
+        time += timedelta(seconds=draw(st.sampled_from([0, 1, 10, 61])))
+        if samples and draw(st.booleans()):
+            sample = {**deepcopy(samples[-1]), "time": time}
+        else:
+            sample = {"time": time if draw(st.integers(0, 9)) else None, "sensors": {}}
+            for name in PROPERTIES:
+                if draw(st.booleans()):
+                    target = sample if name in ("power", "energy") else sample["sensors"]
+                    target[name] = draw(values)
+        samples.append(sample)
+    return samples
+
+
+@st.composite
+def _scenarios(draw, sweepable: bool = False) -> list[tuple]:
+    """Samples, with the triggers set again now and then: as the same list changed in place or as a new list,
+    with triggers added to the current ones or replacing them."""
+    steps: list[tuple] = []
+    for sample in draw(_samples()):
+        if steps and draw(st.integers(0, 5)) == 0:
+            steps.append(("set", draw(st.booleans()), draw(st.booleans()), draw(_triggers(sweepable))))
+        steps.append(("sample", sample))
+    return steps
+
+
+def _key(trigger: dict) -> tuple:
+    return trigger.get("id", trigger.get("condition")), trigger.get("property")
+
+
+def _carried(current: list[dict], definitions: list[dict]) -> list[dict]:
+    """Triggers with the state of the current triggers with the same id and property, as a template update keeps
+    it, so every engine gets the same triggers whether it has a template or not."""
+    states = {_key(trigger): {key: trigger[key] for key in STATE_KEYS if key in trigger} for trigger in current}
+    carried = []
+    for definition in definitions:
+        trigger = {key: value for key, value in definition.items() if key not in STATE_KEYS}
+        own_state = {key: definition[key] for key in STATE_KEYS if key in definition}
+        carried.append({**trigger, **states.get(_key(definition), own_state)})
+    return carried
+
+
+@contextmanager
+def _quiet():
+    # random triggers often fail on the values they get (e.g. comparing strings with numbers), which is logged
+    # with a traceback for every sample
+    loggers = [logging.getLogger(name) for name in ("edap.edap", "edap.reference")]
+    levels = [logger.level for logger in loggers]
+    for logger in loggers:
+        logger.setLevel(logging.CRITICAL)
+    try:
+        yield
+    finally:
+        for logger, level in zip(loggers, levels):
+            logger.setLevel(level)
+
+
+@hypothesis.settings(max_examples=300, deadline=None)
+@hypothesis.given(triggers=_triggers(), steps=_scenarios())
+def test_engines_match_the_reference(triggers: list[dict], steps: list[tuple]) -> None:
+    # every engine gets a list of its own, which it may change, and which is given to it again when in place
+    lists = {name: deepcopy(triggers) for name in ENGINES}
+    engines = {name: engine(lists[name]) for name, engine in ENGINES.items()}
+    reference = engines["reference"]
+    with _quiet():
+        _run(engines, reference, lists, steps)
+
+
+@pytest.mark.skipif("whatif" not in ENGINES, reason="edap.whatif requires numpy")
+@hypothesis.settings(max_examples=300, deadline=None)
+@hypothesis.given(triggers=_triggers(sweepable=True), steps=_scenarios(sweepable=True))
+def test_whatif_matches_the_reference(triggers: list[dict], steps: list[tuple]) -> None:
+    # most random trigger sets can not be swept, which the whatif engine evaluates with the reference instead
+    lists = {name: deepcopy(triggers) for name in ("reference", "whatif")}
+    engines = {name: ENGINES[name](lists[name]) for name in lists}
+    with _quiet():
+        _run(engines, engines["reference"], lists, steps)
+
+
+def _run(engines: dict, reference, lists: dict, steps: list[tuple]) -> None:
+    for step in steps:
+        if step[0] == "set":
+            _, in_place, append, new_triggers = step
+            current = reference.triggers()
+            carried = _carried(current, (current if append else []) + new_triggers)
+            for name, engine in engines.items():
+                if in_place:
+                    lists[name][:] = deepcopy(carried)
+                else:
+                    lists[name] = deepcopy(carried)
+                engine.set_triggers(lists[name])
+            continue
+        sample = step[1]
+        expected = reference.trigger(deepcopy(sample))
+        for name, engine in engines.items():
+            if engine is reference:
+                continue
+            assert engine.trigger(deepcopy(sample)) == expected, name
+            assert engine.triggers() == reference.triggers(), name
+
+
+def test_reference_semantics() -> None:
+    engine = ReferenceEngine([
+        {"id": "missing", "property": "temperature", "tolerance": 1},
+        {"id": "discarded", "property": "power", "delta": 0, "discard_sample": True},
+        {"condition": "charging", "property": "power", "greater": 0},
+        {"id": "energy", "property": "energy", "delta": 1, "conditions": ["charging"]},
+        {"id": "on", "property": "on", "delta": 0},
+    ])
+    sample = {"time": START, "power": 1.0, "energy": 5.0, "sensors": {"temperature": 20, "on": False}}
+    assert engine.trigger(sample)["triggers"] == ["#discarded", "energy", "on"]
+    # the condition got the power of the sample that activated the trigger depending on it
+    assert engine.triggers()[2]["value"] == 1.0
+    # a tolerance trigger with a value fires for every sample without one, as there is no value to store
+    assert engine.trigger({**sample, "sensors": {"on": False}})["triggers"] == ["missing"]
+    assert engine.trigger({**sample, "sensors": {"on": False}})["triggers"] == ["missing"]
+    assert engine.trigger({**sample, "sensors": {"temperature": 21, "on": False}}) is None
+    # bools are deltas of 1
+    assert engine.trigger({**sample, "sensors": {"temperature": 21, "on": True}})["triggers"] == ["on"]
+    assert engine.triggers()[4]["value"] is True
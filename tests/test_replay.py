@@ -0,0 +1,96 @@
+import io
+import threading
+from datetime import datetime, timezone, timedelta
+
+from edap.edap import EdapDevice
+from edap.replay import SampleRecorder, read_samples, replay
+
+
+def _samples(count: int) -> list:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "time": start + timedelta(seconds=i),
+            "power": float(i % 7),
+            "energy": None if i % 5 == 0 else i * 0.5,
+            "sensors": {"soc": i / count, "active": i % 2 == 0, "mode": "charge" if i % 3 else "idle", "count": i},
+        }
+        for i in range(count)
+    ]
+
+
+def test_recording_round_trip() -> None:
+    samples = _samples(25)
+    buffer = io.BytesIO()
+    recorder = SampleRecorder(buffer, chunk_size=10)
+    for sample in samples:
+        recorder.record(sample, device="device_1")
+    recorder.close()
+
+    buffer.seek(0)
+    read = list(read_samples(buffer))
+    assert [device for device, _ in read] == ["device_1"] * 25
+    assert [sample for _, sample in read] == samples
+    assert isinstance(read[3][1]["sensors"]["active"], bool)
+    assert isinstance(read[3][1]["sensors"]["count"], int)
+
+
+def test_replay_matches_direct_evaluation() -> None:
+    triggers = [
+        {"id": "power", "property": "power", "delta": 2},
+        {"id": "soc", "property": "soc", "levels": [0.25, 0.5, 0.75], "sensors": ["soc"]},
+        {"id": "time", "property": "time", "delta": 10},
+    ]
+    samples = _samples(100)
+    buffer = io.BytesIO()
+    with SampleRecorder(buffer) as recorder:
+        for sample in samples:
+            recorder.record(sample, device="a")
+            recorder.record(sample, device="b")
+    buffer.seek(0)
+
+    direct_device = EdapDevice([dict(trigger) for trigger in triggers])
+    expected = [result for result in map(direct_device.trigger, samples) if result is not None]
+
+    devices = {"a": EdapDevice([dict(trigger) for trigger in triggers])}
+    events = list(replay(read_samples(buffer), devices))
+    assert [event.sample for event in events] == expected
+    assert all(event.device == "a" for event in events)
+    assert events[0].time == samples[0]["time"]
+
+
+def test_recording_keeps_ints_and_missing_values() -> None:
+    samples = [
+        {"time": None, "counter": 2 ** 53 + 1, "huge": 2 ** 70, "sensors": {"soc": None}},
+        {"counter": -3, "sensors": {}},
+        {"time": None, "power": float("inf"), "sensors": {"soc": 0.5}},
+    ]
+    buffer = io.BytesIO()
+    with SampleRecorder(buffer) as recorder:
+        for sample in samples:
+            recorder.record(sample)
+    buffer.seek(0)
+    read = [sample for _, sample in read_samples(buffer)]
+    assert read == samples
+    assert read[0]["counter"] == 2 ** 53 + 1
+
+
+def test_recording_and_flushing_from_different_threads() -> None:
+    samples = _samples(500)
+    buffer = io.BytesIO()
+    recorder = SampleRecorder(buffer, chunk_size=7)
+    stop = threading.Event()
+
+    def flush() -> None:
+        while not stop.is_set():
+            recorder.flush()
+
+    flusher = threading.Thread(target=flush)
+    flusher.start()
+    for sample in samples:
+        recorder.record(sample, flush=False)
+    stop.set()
+    flusher.join()
+    recorder.close()
+    buffer.seek(0)
+    assert [sample for _, sample in read_samples(buffer)] == samples
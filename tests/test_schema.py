@@ -0,0 +1,60 @@
+import threading
+
+from edap.codec import DeltaDecoder, DeltaEncoder
+from edap.edap import EdapDevice
+from edap.schema import SampleSchema
+
+
+def test_schema_ids_are_stable_when_extended() -> None:
+    schema = SampleSchema(["power", "soc"])
+    assert schema.version == 1
+    assert not schema.extend(["soc", "time", "sensors"])
+    assert schema.version == 1
+    assert schema.extend(["temp", "power"])
+    assert schema.version == 2
+    assert [schema.id(name) for name in ("power", "soc", "temp")] == [0, 1, 2]
+    assert schema.name(2) == "temp"
+
+
+def test_set_triggers_extends_device_schema_without_resetting_state() -> None:
+    edap_device = EdapDevice([{"id": "power", "property": "power", "delta": 1, "sensors": ["soc"]}])
+    assert edap_device.schema.names == ("power", "soc")
+    edap_device.trigger({"power": 5, "sensors": {"soc": 0.5}})
+
+    triggers = edap_device.get_triggers() + [{"id": "temp", "property": "temp", "delta": 2}]
+    edap_device.set_triggers(triggers)
+    assert edap_device.schema.names == ("power", "soc", "temp")
+    assert edap_device.schema.version == 2
+    assert edap_device.get_triggers()[0]["value"] == 5
+
+
+def test_encode_decode_round_trip_with_delta_frames() -> None:
+    sender = SampleSchema(["soc"])
+    receiver = SampleSchema()
+    encoder = DeltaEncoder()
+    decoder = DeltaDecoder()
+    samples = [
+        {"time": None, "power": 1, "triggers": ["a"], "sensors": {"soc": 0.1, "temp": 20}},
+        {"time": None, "power": 1, "triggers": ["a"], "sensors": {"soc": 0.2}},
+    ]
+    for sample in samples:
+        encoded = sender.encode(encoder.encode(sample))
+        assert all(key.isdigit() for key in encoded.get("sensors", {}))
+        receiver.update(sender.to_dict())
+        assert decoder.decode(receiver.decode(encoded)) == sample
+
+
+def test_encode_while_the_schema_is_extended() -> None:
+    schema = SampleSchema()
+    names = [f"sensor_{i}" for i in range(2000)]
+
+    def extend() -> None:
+        for name in reversed(names):
+            schema.extend([name])
+
+    extender = threading.Thread(target=extend)
+    extender.start()
+    encoded = [schema.encode({"time": None, "sensors": {name: i}}) for i, name in enumerate(names)]
+    extender.join()
+    receiver = SampleSchema.from_dict(schema.to_dict())
+    assert [receiver.decode(frame)["sensors"] for frame in encoded] == [{name: i} for i, name in enumerate(names)]
@@ -0,0 +1,121 @@
+import multiprocessing
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from edap.edap import EdapDevice
+from edap.shared_state import TriggerStateTable
+
+
+@pytest.fixture
+def table():
+    table = TriggerStateTable(devices=4, slots=4, sample_size=512)
+    yield table
+    table.close()
+    table.unlink()
+
+
+def test_write_and_read(table) -> None:
+    time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    triggers = [
+        {"id": "power", "property": "power", "delta": 1, "value": 2.5},
+        {"id": "heartbeat", "property": "time", "value": time},
+        {"id": "mode", "property": "mode", "value": "eco"},
+        {"id": "idle", "property": "power"},
+        {"property": "energy", "value": 1},
+    ]
+    assert table.read(1) is None
+    table.write(1, "battery-1", triggers, {"time": time, "power": 2.5, "triggers": ["power"], "sensors": {}})
+
+    state = table.read(1)
+    assert state.device_id == "battery-1"
+    assert state.values == {"power": 2.5, "heartbeat": time, "mode": "eco"}
+    assert state.last_sample == {"time": time.isoformat(), "power": 2.5, "triggers": ["power"], "sensors": {}}
+    assert [row for row, _ in table.states()] == [1]
+    with pytest.raises(IndexError):
+        table.read(4)
+
+
+def test_device_publishes_state(table) -> None:
+    device = EdapDevice([{"id": "power", "property": "power", "delta": 1}])
+    device.attach_state_table(table, 2, "battery-2")
+    assert table.read(2).values == {}
+
+    device.trigger({"time": None, "power": 3, "sensors": {}})
+    device.trigger({"time": None, "power": 3.5, "sensors": {}})
+    state = table.read(2)
+    assert state.values == {"power": 3}
+    assert state.last_sample["power"] == 3
+
+
+def _read_values(name: str, row: int, queue) -> None:
+    with TriggerStateTable.attach(name) as table:
+        queue.put(table.read(row).values)
+
+
+def test_read_from_other_process(table) -> None:
+    table.write(0, "battery", [{"id": "power", "value": 7}], None)
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_read_values, args=(table.name, 0, queue))
+    process.start()
+    assert queue.get(timeout=30) == {"power": 7}
+    process.join(timeout=30)
+    # attaching processes must not remove the table when they exit
+    with TriggerStateTable.attach(table.name) as attached:
+        assert attached.read(0).values == {"power": 7}
+
+
+def test_reads_are_consistent_while_writing(table) -> None:
+    stop = threading.Event()
+
+    def write() -> None:
+        i = 0
+        while not stop.is_set():
+            i += 1
+            table.write(3, "battery", [{"id": "a", "value": i}, {"id": "b", "value": -i}], {"i": i})
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(2000):
+            state = table.read(3)
+            if state is not None:
+                assert state.values["a"] == -state.values["b"] == state.last_sample["i"]
+    finally:
+        stop.set()
+        writer.join()
+
+
+def test_rows_are_acquired_and_released(table) -> None:
+    rows = [table.acquire_row() for _ in range(4)]
+    assert rows == [0, 1, 2, 3]
+    with pytest.raises(IndexError):
+        table.acquire_row()
+    table.write(1, "battery", [{"id": "power", "value": 1}], None)
+    table.release_row(1)
+    assert table.read(1) is None
+    assert table.acquire_row() == 1
+
+
+def test_replace_a_stale_table() -> None:
+    stale = TriggerStateTable(devices=4)
+    stale.write(0, "battery", [{"id": "power", "value": 1}], None)
+    # left behind without being unlinked
+    stale.close()
+    with pytest.raises(FileExistsError):
+        TriggerStateTable(stale.name, devices=2)
+    with TriggerStateTable(stale.name, devices=2, replace=True) as table:
+        assert table.devices == 2
+        assert table.read(0) is None
+        table.unlink()
+
+
+def test_ints_are_stored_exactly(table) -> None:
+    triggers = [{"id": "big", "value": 2 ** 53 + 1}, {"id": "negative", "value": -2 ** 63},
+                {"id": "float", "value": 0.1}, {"id": "flag", "value": True}]
+    table.write(0, "battery", triggers, None)
+    values = table.read(0).values
+    assert values == {"big": 2 ** 53 + 1, "negative": -2 ** 63, "float": 0.1, "flag": True}
+    assert isinstance(values["big"], int) and isinstance(values["flag"], bool)
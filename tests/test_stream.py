@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from edap import stream
+from edap.edap import EdapDevice
+from edap.expr import ExpressionError
+
+
+def _write_csv(path, rows: int) -> None:
+    with open(path, "w", encoding="utf-8") as csv_file:
+        csv_file.write("time,power,energy,soc,mode,active\n")
+        for i in range(rows):
+            csv_file.write(f"{1700000000 + i},{i % 7},{'' if i % 5 == 0 else i},{i / rows},{'eco' if i % 2 else 'max'},{i % 3 == 0}\n")
+
+
+def test_read_csv(tmp_path) -> None:
+    path = tmp_path / "samples.csv"
+    _write_csv(path, 10)
+    samples = list(stream.read_csv(str(path)))
+    assert len(samples) == 10
+    assert samples[1] == {
+        "time": datetime.fromtimestamp(1700000001, tz=timezone.utc),
+        "power": 1,
+        "energy": 1,
+        "sensors": {"soc": 0.1, "mode": "eco", "active": False},
+    }
+    assert "energy" not in samples[0]
+
+
+def test_evaluate_single_trigger_set(tmp_path) -> None:
+    path = tmp_path / "samples.csv"
+    _write_csv(path, 100)
+    triggers = [{"id": "power", "property": "power", "delta": 2}]
+
+    device = EdapDevice([dict(trigger) for trigger in triggers])
+    expected = [result for result in map(device.trigger, stream.read_csv(str(path))) if result is not None]
+    assert list(stream.evaluate(stream.read_csv(str(path)), triggers)) == expected
+    assert "value" not in triggers[0]
+
+
+def test_evaluate_compiles_expressions_up_front() -> None:
+    with pytest.raises(ExpressionError):
+        stream.evaluate(iter([]), [{"id": "invalid", "expr": "power >"}])
+    with pytest.raises(ExpressionError):
+        stream.evaluate(iter([]), {"invalid": [{"id": "invalid", "expr": "power >"}]})
+
+
+def test_evaluate_alternative_trigger_sets_in_one_pass() -> None:
+    reads = []
+
+    def samples():
+        for i in range(50):
+            reads.append(i)
+            yield {"power": float(i % 10)}
+
+    results = list(stream.evaluate(samples(), {
+        "fine": [{"id": "power", "property": "power", "delta": 1}],
+        "coarse": [{"id": "power", "property": "power", "delta": 5}],
+    }))
+    assert len(reads) == 50
+    counts = {name: sum(1 for result_name, _ in results if result_name == name) for name in ("fine", "coarse")}
+    assert counts["fine"] > counts["coarse"] > 0
+
+
+def test_read_parquet(tmp_path) -> None:
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "samples.parquet"
+    pq.write_table(pa.table({"time": [1700000000.0, 1700000001.0], "power": [1.0, None], "soc": [0.5, 0.6]}), str(path))
+    samples = list(stream.read_parquet(str(path), batch_size=1))
+    assert samples == [
+        {"time": datetime.fromtimestamp(1700000000, tz=timezone.utc), "power": 1.0, "sensors": {"soc": 0.5}},
+        {"time": datetime.fromtimestamp(1700000001, tz=timezone.utc), "sensors": {"soc": 0.6}},
+    ]
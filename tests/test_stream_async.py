@@ -0,0 +1,143 @@
+import asyncio
+import threading
+
+from edap.edap import EdapDevice
+
+
+async def _samples(count: int):
+    for i in range(count):
+        yield {"power": float(i % 5)}
+
+
+def _collect(device: EdapDevice, samples, **kwargs) -> list:
+    async def collect() -> list:
+        return [triggered async for triggered in device.stream(samples, **kwargs)]
+    return asyncio.run(collect())
+
+
+def test_stream_matches_trigger() -> None:
+    triggers = [{"id": "power", "property": "power", "delta": 1.5}]
+    expected_device = EdapDevice([dict(trigger) for trigger in triggers])
+    expected = []
+    for i in range(20):
+        result = expected_device.trigger({"power": float(i % 5)})
+        if result is not None:
+            expected.append(result)
+
+    for batch_size in (1, 3, 50):
+        device = EdapDevice([dict(trigger) for trigger in triggers])
+        assert _collect(device, _samples(20), batch_size=batch_size) == expected
+
+
+def test_stream_evaluates_in_thread_above_threshold() -> None:
+    threads = set()
+
+    class RecordingDevice(EdapDevice):
+        def trigger(self, sample):
+            threads.add(threading.current_thread())
+            return super().trigger(sample)
+
+    device = RecordingDevice([{"id": "power", "property": "power", "delta": 0}])
+    results = _collect(device, _samples(10), thread_threshold=0.0)
+    assert len(results) == 10
+    assert threading.main_thread() in threads
+    assert len(threads) > 1
+
+
+def test_stream_closes_source_when_stopped() -> None:
+    closed = []
+
+    async def source():
+        try:
+            for i in range(100):
+                yield {"power": float(i)}
+        finally:
+            closed.append(True)
+
+    async def take_two() -> list:
+        stream = EdapDevice([{"id": "power", "property": "power", "delta": 0}]).stream(source())
+        results = [await anext(stream), await anext(stream)]
+        await stream.aclose()
+        return results
+
+    assert len(asyncio.run(take_two())) == 2
+    assert closed == [True]
+
+
+async def _stalling(count: int, stalled: asyncio.Event):
+    for i in range(count):
+        yield {"power": float(i)}
+    stalled.set()
+    await asyncio.Event().wait()
+
+
+def test_stream_yields_read_samples_when_cancelled() -> None:
+    async def run() -> tuple[list, bool]:
+        stalled = asyncio.Event()
+        results = []
+
+        async def consume():
+            device = EdapDevice([{"id": "power", "property": "power", "delta": 0}])
+            async for triggered in device.stream(_stalling(3, stalled), batch_size=10):
+                results.append(triggered)
+
+        task = asyncio.ensure_future(consume())
+        await stalled.wait()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return results, True
+        return results, False
+
+    results, cancelled = asyncio.run(run())
+    assert cancelled
+    assert [result["power"] for result in results] == [0.0, 1.0, 2.0]
+
+
+def test_stream_finishes_thread_batch_when_cancelled() -> None:
+    started = threading.Event()
+    release = threading.Event()
+
+    class SlowDevice(EdapDevice):
+        def trigger(self, sample):
+            if sample["power"] >= 2:
+                started.set()
+                release.wait(5)
+            return super().trigger(sample)
+
+    async def run() -> tuple[list, bool]:
+        results = []
+
+        async def consume():
+            device = SlowDevice([{"id": "power", "property": "power", "delta": 0}])
+            async for triggered in device.stream(_samples(4), batch_size=2, thread_threshold=0.0):
+                results.append(triggered)
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return results, True
+        return results, False
+
+    results, cancelled = asyncio.run(run())
+    assert cancelled
+    # the batch in the worker thread was finished and yielded, the rest of the source was not read
+    assert [result["power"] for result in results] == [0.0, 1.0, 2.0, 3.0]
+
+
+def test_stream_evaluates_partial_batch_after_timeout() -> None:
+    async def run() -> list:
+        stalled = asyncio.Event()
+        device = EdapDevice([{"id": "power", "property": "power", "delta": 0}])
+        stream = device.stream(_stalling(3, stalled), batch_size=10, batch_timeout=0.05)
+        results = [await asyncio.wait_for(anext(stream), 2) for _ in range(3)]
+        await stream.aclose()
+        return results
+
+    assert [result["power"] for result in asyncio.run(run())] == [0.0, 1.0, 2.0]
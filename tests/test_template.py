@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from edap.edap import EdapDevice
+from edap.expr import ExpressionError
+from edap.template import TriggerTemplate
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _triggers() -> list:
+    return [
+        {"id": "time", "property": "time", "delta": 60},
+        {"id": "power", "property": "power", "delta": 2},
+        {"id": "soc", "property": "soc", "levels": [0.2, 0.8], "value": 0.5},
+        {"id": "hot", "expr": "temperature > 30"},
+    ]
+
+
+def _sample(step: int, power: float = 0.0, soc: float = 0.5, temperature: float = 20) -> dict:
+    return {"time": START + timedelta(seconds=step), "power": power,
+            "sensors": {"soc": soc, "temperature": temperature}}
+
+
+def _device(template: TriggerTemplate) -> EdapDevice:
+    device = EdapDevice()
+    device.set_template(template)
+    return device
+
+
+def test_devices_share_the_definitions_of_a_template() -> None:
+    template = TriggerTemplate(_triggers())
+    first, second = _device(template), _device(template)
+    assert all(a._definition is b._definition for a, b in zip(first.get_triggers(), second.get_triggers()))
+    assert "temperature" in first.schema and "soc" in first.schema
+    assert first.get_triggers()[2]["value"] == 0.5
+
+    assert first.trigger(_sample(0, power=5))["triggers"] == ["time", "power"]
+    # the state is per device
+    assert first.get_triggers()[1]["value"] == 5 and "value" not in second.get_triggers()[1]
+
+
+def test_template_evaluates_like_own_triggers() -> None:
+    template = TriggerTemplate(_triggers())
+    device, own = _device(template), EdapDevice(_triggers())
+    for step in range(200):
+        sample = _sample(step, power=float(step % 9), soc=(step % 20) / 20, temperature=step % 40)
+        assert device.trigger(sample) == own.trigger(sample)
+
+
+def test_template_update_applies_to_all_devices_and_keeps_state() -> None:
+    template = TriggerTemplate(_triggers())
+    devices = [_device(template) for _ in range(3)]
+    for device in devices:
+        device.trigger(_sample(0, power=5))
+
+    template.update([
+        {"id": "time", "property": "time", "delta": 60},
+        {"id": "power", "property": "power", "delta": 10},
+        {"id": "energy", "property": "energy", "delta": 1},
+    ])
+    for device in devices:
+        triggers = device.get_triggers()
+        assert [trigger["id"] for trigger in triggers] == ["time", "power", "energy"]
+        # unchanged ids keep their state, so they don't fire again right away
+        assert triggers[1]["value"] == 5 and triggers[1]["delta"] == 10
+        assert device.trigger(_sample(1, power=8)) is None
+    assert "energy" in devices[0].schema
+
+
+def test_invalid_template_update_leaves_template_unchanged() -> None:
+    template = TriggerTemplate(_triggers())
+    version = template.version
+    with pytest.raises(ExpressionError):
+        template.update([{"id": "broken", "expr": "power >"}])
+    assert template.version == version and len(template) == 4
+
+
+def test_set_triggers_replaces_the_template() -> None:
+    template = TriggerTemplate(_triggers())
+    device = _device(template)
+    device.set_triggers([{"id": "power", "property": "power", "delta": 1}])
+    template.update([])
+    assert [trigger["id"] for trigger in device.get_triggers()] == ["power"]
@@ -0,0 +1,137 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from edap.edap import EdapDevice
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+THREADS = 8
+SAMPLES = 2000
+
+
+def _trigger_set(name: str) -> list:
+    return [
+        {"id": f"{name}_counter", "property": "counter", "delta": 0},
+        {"id": f"{name}_time", "property": "time", "delta": 0},
+        {"id": f"{name}_level", "property": "counter", "levels": [SAMPLES / 2]},
+    ]
+
+
+class CompactDevice(EdapDevice):
+    compact_storage = True
+
+
+@pytest.mark.parametrize("device_type", [EdapDevice, CompactDevice])
+def test_concurrent_trigger_and_set_triggers(device_type) -> None:
+    device = device_type(_trigger_set("a"))
+    results: list[list] = [[] for _ in range(THREADS)]
+    errors: list[BaseException] = []
+    stop = threading.Event()
+    barrier = threading.Barrier(THREADS + 1)
+
+    def evaluate(thread: int) -> None:
+        try:
+            barrier.wait()
+            for i in range(SAMPLES):
+                sample = {"time": START + timedelta(microseconds=i * THREADS + thread),
+                          "sensors": {"counter": i * THREADS + thread}}
+                triggered = device.trigger(sample)
+                if triggered is not None:
+                    results[thread].append(triggered)
+        except BaseException as ex:  # pylint: disable=broad-except
+            errors.append(ex)
+
+    def swap() -> None:
+        barrier.wait()
+        swaps = 0
+        while not stop.is_set():
+            device.set_triggers(_trigger_set("b" if swaps % 2 == 0 else "a"))
+            swaps += 1
+
+    threads = [threading.Thread(target=evaluate, args=(thread,)) for thread in range(THREADS)]
+    swapper = threading.Thread(target=swap)
+    for thread in threads + [swapper]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    swapper.join()
+
+    assert not errors
+    for thread_results in results:
+        for triggered in thread_results:
+            # every sample was evaluated with a single trigger set, never a mix of both
+            prefixes = {trigger_id.split("_")[0] for trigger_id in triggered["triggers"]}
+            assert len(prefixes) == 1
+            assert triggered["sensors"]["counter"] is not None
+    # the state of the triggers and the last sample were updated together
+    last_sample = device._last_sample
+    counter_trigger = device.get_triggers()[0]
+    if last_sample is not None and "value" in counter_trigger and counter_trigger["id"] in last_sample["triggers"]:
+        assert counter_trigger["value"] == last_sample["sensors"]["counter"]
+
+
+def test_devices_are_evaluated_in_parallel_threads() -> None:
+    devices = [EdapDevice(_trigger_set("a")) for _ in range(THREADS)]
+    counts = [0] * THREADS
+
+    def evaluate(thread: int) -> None:
+        for i in range(SAMPLES):
+            if devices[thread].trigger({"time": START + timedelta(seconds=i), "sensors": {"counter": i}}) is not None:
+                counts[thread] += 1
+
+    threads = [threading.Thread(target=evaluate, args=(thread,)) for thread in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # every sample changes the counter, so every sample of every device triggers
+    assert counts == [SAMPLES] * THREADS
+
+
+@pytest.mark.parametrize("device_type", [EdapDevice, CompactDevice])
+def test_set_triggers_copies_the_callers_triggers(device_type) -> None:
+    # the same two lists are set over and over while samples are evaluated and the triggers are read
+    trigger_sets = {name: _trigger_set(name) for name in ("a", "b")}
+    device = device_type(trigger_sets["a"])
+    errors: list[BaseException] = []
+    stop = threading.Event()
+
+    def evaluate() -> None:
+        try:
+            for i in range(SAMPLES):
+                device.trigger({"time": START + timedelta(seconds=i), "sensors": {"counter": i}})
+        except BaseException as ex:  # pylint: disable=broad-except
+            errors.append(ex)
+
+    def swap() -> None:
+        swaps = 0
+        while not stop.is_set():
+            device.set_triggers(trigger_sets["b" if swaps % 2 == 0 else "a"])
+            swaps += 1
+
+    def read() -> None:
+        try:
+            while not stop.is_set():
+                triggers = device.get_triggers()
+                assert len({trigger["id"].split("_")[0] for trigger in triggers}) == 1
+        except BaseException as ex:  # pylint: disable=broad-except
+            errors.append(ex)
+
+    workers = [threading.Thread(target=evaluate) for _ in range(THREADS // 2)]
+    others = [threading.Thread(target=swap), threading.Thread(target=read)]
+    for thread in workers + others:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    stop.set()
+    for thread in others:
+        thread.join()
+
+    assert not errors
+    # the state of the triggers was kept in the device's own copies
+    assert trigger_sets == {name: _trigger_set(name) for name in ("a", "b")}
+    snapshot = device.get_triggers()
+    snapshot[0]["value"] = -1
+    assert device.get_triggers()[0].get("value") != -1
@@ -0,0 +1,72 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from edap.edap import EdapDevice, Trigger
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _samples(values: list[float]) -> list[dict]:
+    return [{"time": START + timedelta(seconds=second), "power": value, "sensors": {}}
+            for second, value in enumerate(values)]
+
+
+def _reported(samples: list[dict], trigger: Trigger) -> list[dict]:
+    triggers = [trigger]
+    return [triggered for triggered in (EdapDevice.apply_trigger(sample, triggers) for sample in samples)
+            if triggered is not None]
+
+
+def _reconstruct(reported: list[dict], time: datetime) -> float:
+    """The value at a time, extrapolated from the last two reported samples before it."""
+    before = [sample for sample in reported if sample["time"] <= time]
+    last = before[-1]
+    slope = 0.0
+    if len(before) > 1:
+        previous = before[-2]
+        slope = (last["power"] - previous["power"]) / (last["time"] - previous["time"]).total_seconds()
+    return last["power"] + slope * (time - last["time"]).total_seconds()
+
+
+def test_trajectory_trigger_reports_first_sample() -> None:
+    trigger: Trigger = {"id": "power", "property": "power", "deviation": 1}
+    assert _reported(_samples([5.0]), trigger)[0]["triggers"] == ["power"]
+    assert trigger["value"] == 5.0
+    assert trigger["slope"] == 0.0
+    assert trigger["value_time"] == START
+
+
+def test_trajectory_trigger_ramp_needs_two_samples() -> None:
+    reported = _reported(_samples([0.5 * second for second in range(1000)]),
+                         {"id": "power", "property": "power", "deviation": 0.1})
+    assert len(reported) == 2
+
+
+def test_trajectory_trigger_step_needs_two_samples() -> None:
+    reported = _reported(_samples([1.0] * 100 + [50.0] * 100), {"id": "power", "property": "power", "deviation": 0.1})
+    assert [sample["power"] for sample in reported] == [1.0, 50.0, 50.0]
+    assert [sample["time"] for sample in reported][1:] == [START + timedelta(seconds=100), START + timedelta(seconds=101)]
+
+
+def test_trajectory_trigger_reconstruction_within_deviation() -> None:
+    deviation = 0.5
+    samples = _samples([10 * math.sin(second / 200) + 0.01 * second for second in range(3600)])
+    reported = _reported(samples, {"id": "power", "property": "power", "deviation": deviation})
+    for sample in samples:
+        assert abs(sample["power"] - _reconstruct(reported, sample["time"])) <= deviation + 1e-9
+
+    delta = _reported(samples, {"id": "power", "property": "power", "delta": deviation})
+    assert len(reported) * 3 < len(delta)
+
+
+def test_trajectory_trigger_without_time_holds_value() -> None:
+    triggers: list[Trigger] = [{"id": "power", "property": "power", "deviation": 1}]
+    assert EdapDevice.apply_trigger({"power": 5, "sensors": {}}, triggers) is not None
+    assert EdapDevice.apply_trigger({"power": 5.5, "sensors": {}}, triggers) is None
+    assert EdapDevice.apply_trigger({"power": 6.5, "sensors": {}}, triggers) is not None
+    assert triggers[0]["slope"] == 0.0
+
+
+def test_trajectory_trigger_ignores_non_numeric_values() -> None:
+    triggers: list[Trigger] = [{"id": "mode", "property": "mode", "deviation": 1, "value": 1}]
+    assert EdapDevice.apply_trigger({"sensors": {"mode": "eco"}}, triggers) is None
@@ -0,0 +1,87 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from edap.edap import EdapDevice  # noqa: E402
+from edap.whatif import sweep  # noqa: E402
+
+
+def _samples(count: int) -> list:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    samples = []
+    for i in range(count):
+        sample = {"time": start + timedelta(seconds=7 * i), "power": round(10 * math.sin(i / 5) + (i % 3), 2),
+                  "sensors": {"soc": i / count}}
+        if i % 11 == 0:
+            del sample["power"]
+        samples.append(sample)
+    return samples
+
+
+def _reference(samples: list, trigger: dict) -> tuple[int, list]:
+    triggers = [dict(trigger)]
+    times = [sample.get("time") for sample in samples if EdapDevice.apply_trigger(sample, triggers) is not None]
+    return len(times), times
+
+
+def _assert_matches_reference(samples: list, trigger: dict, **parameters) -> None:
+    result = sweep(samples, trigger, **parameters)
+    for i, variant in enumerate(result.variants):
+        count, times = _reference(samples, variant)
+        assert result.counts[i] == count, variant
+        assert result.times[i] == times, variant
+
+
+def test_delta_sweep_matches_apply_trigger() -> None:
+    _assert_matches_reference(_samples(300), {"id": "power", "property": "power"}, delta=[0, 0.5, 1, 2.5, 5, 20])
+
+
+def test_levels_sweep_matches_apply_trigger() -> None:
+    levels = [[0], [-5, 0, 5], [-8, -4, 0, 4, 8], [], [3.5, 7]]
+    _assert_matches_reference(_samples(300), {"id": "power", "property": "power"}, levels=levels)
+
+
+def test_combined_sweep_matches_apply_trigger() -> None:
+    _assert_matches_reference(_samples(300), {"id": "power", "property": "power", "value": 1.0},
+                              delta=[1, 3, 6], levels=[[0, 5]])
+
+
+def test_time_sweep_matches_apply_trigger() -> None:
+    _assert_matches_reference(_samples(300), {"id": "heartbeat", "property": "time"}, delta=[0, 10, 60, 300, None])
+
+
+def test_non_numeric_values() -> None:
+    samples = [{"time": None, "mode": "eco"}, {"time": None, "mode": 1}, {"time": None, "mode": 5}]
+    _assert_matches_reference(samples, {"id": "mode", "property": "mode"}, delta=[1], levels=[[2], None])
+    _assert_matches_reference(samples, {"id": "mode", "property": "mode", "value": None}, delta=[1, 2])
+
+
+def test_within_budget() -> None:
+    result = sweep(_samples(300), {"id": "power", "property": "power"}, delta=[0.5, 2, 5, 20])
+    assert list(result.counts) == sorted(result.counts, reverse=True)
+    assert result.within_budget(int(result.counts[2])) == [2, 3]
+
+
+def test_invalid_sweeps() -> None:
+    with pytest.raises(ValueError):
+        sweep([], {"id": "power", "property": "power"}, tolerance=[1])
+    with pytest.raises(ValueError):
+        sweep([], {"id": "power", "property": "power"}, delta=[1, 2], levels=[[1], [2], [3]])
+    with pytest.raises(ValueError):
+        sweep([], {"id": "power", "property": "power", "conditions": ["c"]}, delta=[1])
+
+
+def test_triggers_are_normalised_like_in_apply_trigger() -> None:
+    samples = _samples(50)
+    # triggers without an id are never activated
+    assert sweep(samples, {"property": "power"}, delta=[1]).counts.tolist() == [0]
+    # a time delta that is not a number is the default delta
+    _assert_matches_reference(samples, {"id": "heartbeat", "property": "time"}, delta=["30", "x"])
+    # naive times can not be compared with aware ones
+    naive = [{**sample, "time": sample["time"].replace(tzinfo=None)} for sample in samples]
+    _assert_matches_reference(naive + samples, {"id": "heartbeat", "property": "time"}, delta=[30])
+    _assert_matches_reference(samples, {"id": "heartbeat", "property": "time", "value": "2024-01-01T00:00:00"},
+                              delta=[30])